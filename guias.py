@@ -11,101 +11,200 @@ from reportlab.lib import colors
 import base64
 from PIL import Image as PILImage
 import sqlite3
+import threading
 
 # Funções da Base de Dados
-def init_db():
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS clinicas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL UNIQUE
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS guias (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_guia TEXT NOT NULL,
-            nome_paciente TEXT,
-            medico TEXT,
-            trabalhos TEXT,
-            valor TEXT,
-            mes TEXT NOT NULL,
-            ano TEXT NOT NULL,
-            clinica_id INTEGER,
-            FOREIGN KEY (clinica_id) REFERENCES clinicas (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+# Uma só ligação por processo (st.cache_resource), partilhada pelas sessões do Streamlit;
+# o lock serializa o acesso, porque um sqlite3.Connection não pode ser usado por duas
+# threads ao mesmo tempo. As leituras ficam em st.cache_data e cada escrita limpa as
+# caches que afeta, por isso um rerun sem alterações não vai à base de dados.
+class BaseDados:
+    def __init__(self, caminho):
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def ler(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def escrever(self, sql, params=()):
+        with self.lock, self.conn:
+            self.conn.execute(sql, params)
+
+@st.cache_resource
+def get_db():
+    db = BaseDados('guias.db')
+    init_db(db)
+    return db
+
+def init_db(db):
+    with db.lock, db.conn:
+        db.conn.execute('''
+            CREATE TABLE IF NOT EXISTS clinicas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL UNIQUE
+            )
+        ''')
+        db.conn.execute('''
+            CREATE TABLE IF NOT EXISTS guias (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                numero_guia TEXT NOT NULL,
+                nome_paciente TEXT,
+                medico TEXT,
+                trabalhos TEXT,
+                valor TEXT,
+                mes TEXT NOT NULL,
+                ano TEXT NOT NULL,
+                clinica_id INTEGER,
+                FOREIGN KEY (clinica_id) REFERENCES clinicas (id)
+            )
+        ''')
+
+@st.cache_data
+def get_clinicas_ids():
+    """{nome: id} de todas as clínicas, ordenado por nome."""
+    return dict(get_db().ler("SELECT nome, id FROM clinicas ORDER BY nome"))
 
 def get_clinicas():
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("SELECT nome FROM clinicas ORDER BY nome")
-    clinicas = [row[0] for row in c.fetchall()]
-    conn.close()
-    return clinicas
+    return list(get_clinicas_ids())
 
 def get_clinica_id(nome_clinica):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("SELECT id FROM clinicas WHERE nome = ?", (nome_clinica,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
+    return get_clinicas_ids().get(nome_clinica)
 
 def add_clinica(nome):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO clinicas (nome) VALUES (?)", (nome,))
-        conn.commit()
+        get_db().escrever("INSERT INTO clinicas (nome) VALUES (?)", (nome,))
+        get_clinicas_ids.clear()
         st.success(f"Clínica '{nome}' adicionada com sucesso!")
     except sqlite3.IntegrityError:
         st.error(f"A clínica '{nome}' já existe.")
-    finally:
-        conn.close()
 
 def delete_clinica(nome):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM clinicas WHERE nome = ?", (nome,))
-    conn.commit()
-    conn.close()
+    get_db().escrever("DELETE FROM clinicas WHERE nome = ?", (nome,))
+    get_clinicas_ids.clear()
     st.success(f"Clínica '{nome}' apagada com sucesso!")
 
+@st.cache_data
 def get_guias(clinica_id, mes, ano):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("SELECT id, numero_guia, nome_paciente, medico, trabalhos, valor FROM guias WHERE clinica_id = ? AND mes = ? AND ano = ?", (clinica_id, mes, ano))
-    guias = c.fetchall()
-    conn.close()
-    return guias
+    return get_db().ler("SELECT id, numero_guia, nome_paciente, medico, trabalhos, valor FROM guias WHERE clinica_id = ? AND mes = ? AND ano = ?", (clinica_id, mes, ano))
 
 def add_guia(numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO guias (numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id))
-    conn.commit()
-    conn.close()
+    get_db().escrever("INSERT INTO guias (numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id))
+    get_guias.clear()
 
 def update_guia(guia_id, numero_guia, nome_paciente, medico, trabalhos, valor):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("UPDATE guias SET numero_guia = ?, nome_paciente = ?, medico = ?, trabalhos = ?, valor = ? WHERE id = ?", (numero_guia, nome_paciente, medico, trabalhos, valor, guia_id))
-    conn.commit()
-    conn.close()
+    get_db().escrever("UPDATE guias SET numero_guia = ?, nome_paciente = ?, medico = ?, trabalhos = ?, valor = ? WHERE id = ?", (numero_guia, nome_paciente, medico, trabalhos, valor, guia_id))
+    get_guias.clear()
 
 def delete_guia(guia_id):
-    conn = sqlite3.connect('guias.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM guias WHERE id = ?", (guia_id,))
-    conn.commit()
-    conn.close()
-
-# Inicializar a base de dados
-init_db()
+    get_db().escrever("DELETE FROM guias WHERE id = ?", (guia_id,))
+    get_guias.clear()
+
+# --- PDF ---
+# Memorizado pelo conteúdo: st.cache_data faz o hash dos argumentos (linhas, mês, ano,
+# clínica e total), por isso voltar a pedir o mesmo PDF não corre o ReportLab outra vez,
+# e qualquer alteração às guias dá um PDF novo.
+@st.cache_data(max_entries=32, show_spinner="A gerar o PDF...")
+def gerar_pdf(dados, mes, ano, clinica, total):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    elementos = []
+
+    style_normal = styles["Normal"]
+    style_right = ParagraphStyle(
+        "right",
+        parent=style_normal,
+        alignment=2,
+        fontSize=10,
+        leading=12
+    )
+    style_titulo = ParagraphStyle(
+        "titulo",
+        parent=styles["Title"],
+        alignment=1,
+        fontSize=16,
+        leading=18,
+        spaceAfter=12
+    )
+
+    # Logo reduzido a 75%
+    try:
+        pil_img = PILImage.open("logo.png")
+        largura_original, altura_original = pil_img.size
+        largura_nova = largura_original * 0.75
+        altura_nova = altura_original * 0.75
+        img = Image("logo.png", width=largura_nova, height=altura_nova)
+    except Exception:
+        img = Paragraph("Logótipo não encontrado", style_normal)
+
+    # Cabeçalho: logo + clínica alinhados à direita
+    logo_and_clinica = [
+        [img],
+        [Paragraph(f"<b>{clinica}</b>", style_right)]
+    ]
+    tabela_logo = Table(logo_and_clinica, colWidths=[largura_nova], hAlign="RIGHT")
+    tabela_logo.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+        ('BOTTOMPADDING', (0, 0), (0, 0), 10),
+        ('TOPPADDING', (1, 0), (1, 0), 0),
+    ]))
+    elementos.append(tabela_logo)
+    elementos.append(Spacer(1, 20))
+
+    # Título
+    elementos.append(Paragraph(f"TRABALHOS REALIZADOS NO MÊS DE {mes.upper()} - {ano}", style_titulo))
+    elementos.append(Spacer(1, 12))
+
+    # Destinatário
+    elementos.append(Paragraph(f"Exmo. Sr.<br/>{clinica}", style_normal))
+    elementos.append(Spacer(1, 20))
+
+    # Informação técnica fixa
+    info_tecnica = (
+        "Técnica de Prótese Dentária<br/>"
+        "Vânia Sofia Martins Tomé<br/>"
+        "Urb. Aldeia das Amendoeiras Lote 57<br/>"
+        "8200-004 Albufeira<br/>"
+        "Cont. 223 229 067<br/>"
+        "NIB: 0035 0018 0000 15000000 33"
+    )
+    elementos.append(Paragraph(info_tecnica, style_normal))
+    elementos.append(Spacer(1, 25))
+
+    # Tabela de dados
+    dados_tabela = [["Número da Guia", "Nome do Paciente", "Médico", "Tipo de Trabalho", "Valor (€)"]]
+    for row in dados:
+        trabalhos_formatado = Paragraph(row[4].replace("\n", "<br/>"), style_normal)
+        valor_formatado = Paragraph(row[5].replace("\n", "<br/>"), style_normal)
+        dados_tabela.append([
+            row[1],
+            row[2],
+            row[3],
+            trabalhos_formatado,
+            valor_formatado
+        ])
+    dados_tabela.append(["", "", "", "Total:", f"{total:.2f} €"])
+
+    tabela = Table(dados_tabela, colWidths=[70, 110, 90, 180, 60], hAlign='LEFT')
+    tabela.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ]))
+    elementos.append(tabela)
+
+    doc.build(elementos)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
 
 # --- PÁGINA DE GESTÃO DE CLÍNICAS ---
 def page_gestao_clinicas():
@@ -197,121 +296,16 @@ def page_principal():
             val_str = val_str.strip().replace(",", ".")
             try:
                 total += float(val_str)
-            except:
+            except ValueError:
                 pass
         return total
 
     total = 0.0
-    guias_for_total = get_guias(clinica_id, mes, ano) # Re-fetch guias for total calculation
-    for guia in guias_for_total:
+    for guia in guias:
         total += somar_valores_multilinha(guia[5])
 
     st.markdown(f"### Total estimado: **{total:.2f} €**")
 
-    # Função para gerar PDF
-    def gerar_pdf(dados, mes, ano, clinica, total):
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4,
-                                rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-        styles = getSampleStyleSheet()
-        elementos = []
-
-        style_normal = styles["Normal"]
-        style_right = ParagraphStyle(
-            "right",
-            parent=style_normal,
-            alignment=2,
-            fontSize=10,
-            leading=12
-        )
-        style_titulo = ParagraphStyle(
-            "titulo",
-            parent=styles["Title"],
-            alignment=1,
-            fontSize=16,
-            leading=18,
-            spaceAfter=12
-        )
-
-        # Logo reduzido a 75%
-        try:
-            pil_img = PILImage.open("logo.png")
-            largura_original, altura_original = pil_img.size
-            largura_nova = largura_original * 0.75
-            altura_nova = altura_original * 0.75
-            img = Image("logo.png", width=largura_nova, height=altura_nova)
-        except Exception:
-            img = Paragraph("Logótipo não encontrado", style_normal)
-
-        # Cabeçalho: logo + clínica alinhados à direita
-        from reportlab.platypus import Table, TableStyle
-
-        logo_and_clinica = [
-            [img],
-            [Paragraph(f"<b>{clinica}</b>", style_right)]
-        ]
-        tabela_logo = Table(logo_and_clinica, colWidths=[largura_nova], hAlign="RIGHT")
-        tabela_logo.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-            ('BOTTOMPADDING', (0, 0), (0, 0), 10),
-            ('TOPPADDING', (1, 0), (1, 0), 0),
-        ]))
-        elementos.append(tabela_logo)
-        elementos.append(Spacer(1, 20))
-
-        # Título
-        elementos.append(Paragraph(f"TRABALHOS REALIZADOS NO MÊS DE {mes.upper()} - {ano}", style_titulo))
-        elementos.append(Spacer(1, 12))
-
-        # Destinatário
-        elementos.append(Paragraph(f"Exmo. Sr.<br/>{clinica}", style_normal))
-        elementos.append(Spacer(1, 20))
-
-        # Informação técnica fixa
-        info_tecnica = (
-            "Técnica de Prótese Dentária<br/>"
-            "Vânia Sofia Martins Tomé<br/>"
-            "Urb. Aldeia das Amendoeiras Lote 57<br/>"
-            "8200-004 Albufeira<br/>"
-            "Cont. 223 229 067<br/>"
-            "NIB: 0035 0018 0000 15000000 33"
-        )
-        elementos.append(Paragraph(info_tecnica, style_normal))
-        elementos.append(Spacer(1, 25))
-
-        # Tabela de dados
-        dados_tabela = [["Número da Guia", "Nome do Paciente", "Médico", "Tipo de Trabalho", "Valor (€)"]]
-        for row in dados:
-            trabalhos_formatado = Paragraph(row[4].replace("\n", "<br/>"), style_normal)
-            valor_formatado = Paragraph(row[5].replace("\n", "<br/>"), style_normal)
-            dados_tabela.append([
-                row[1],
-                row[2],
-                row[3],
-                trabalhos_formatado,
-                valor_formatado
-            ])
-        dados_tabela.append(["", "", "", "Total:", f"{total:.2f} €"])
-
-        tabela = Table(dados_tabela, colWidths=[70, 110, 90, 180, 60], hAlign='LEFT')
-        tabela.setStyle(TableStyle([
-            ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ]))
-        elementos.append(tabela)
-
-        doc.build(elementos)
-        pdf = buffer.getvalue()
-        buffer.close()
-        return pdf
-
     # Mostrar PDF embutido via base64
     def mostrar_pdf_base64(pdf_bytes):
         b64 = base64.b64encode(pdf_bytes).decode()
@@ -320,17 +314,26 @@ def page_principal():
         '''
         st.markdown(pdf_display, unsafe_allow_html=True)
 
-    # Botões para pré-visualização e exportação PDF
+    # Botões para pré-visualização e exportação PDF. O PDF só é gerado quando é pedido;
+    # depois disso o botão de download fica disponível para esta clínica/mês/ano e os
+    # reruns seguintes usam o PDF memorizado por gerar_pdf.
     if guias: # Use the guias fetched earlier
-        if st.button("Mostrar Pré-visualização PDF"):
-                pdf_bytes = gerar_pdf(guias, mes, ano, clinica_selecionada, total)
-                mostrar_pdf_base64(pdf_bytes)
-        st.download_button(
-            label="📄 Exportar PDF com Design",
-            data=gerar_pdf(guias, mes, ano, clinica_selecionada, total), # Regenerate PDF for download
-            file_name="trabalhos_realizados.pdf",
-            mime="application/pdf"
-        )
+        chave_pdf = (clinica_id, mes, ano)
+        col_preview, col_pdf = st.columns(2)
+        if col_preview.button("Mostrar Pré-visualização PDF"):
+            st.session_state["pdf_pedido"] = chave_pdf
+            mostrar_pdf_base64(gerar_pdf(guias, mes, ano, clinica_selecionada, total))
+        if st.session_state.get("pdf_pedido") != chave_pdf:
+            if col_pdf.button("📄 Preparar PDF com Design"):
+                st.session_state["pdf_pedido"] = chave_pdf
+                st.experimental_rerun()
+        else:
+            col_pdf.download_button(
+                label="📄 Exportar PDF com Design",
+                data=gerar_pdf(guias, mes, ano, clinica_selecionada, total),
+                file_name="trabalhos_realizados.pdf",
+                mime="application/pdf"
+            )
 
 # --- NAVEGAÇÃO ---
 st.sidebar.title("Navegação")
@@ -1,5 +1,29 @@
 from django.contrib import admin
-from .models import Clinica, Guia
+from .models import ArquivoMensal, Clinica, EncerramentoMensal, Guia, ResumoMensal
 
 admin.site.register(Clinica)
-admin.site.register(Guia)
\ No newline at end of file
+admin.site.register(Guia)
+
+@admin.register(ResumoMensal)
+class ResumoMensalAdmin(admin.ModelAdmin):
+    list_display = [
+        'clinica', 'mes', 'ano', 'quantidade', 'total', 'quantidade_encerradas', 'total_encerradas', 'encerrado',
+        'quantidade_arquivadas', 'total_arquivado',
+    ]
+    list_filter = ['encerrado', 'clinica']
+    list_select_related = ['clinica']
+
+
+@admin.register(EncerramentoMensal)
+class EncerramentoMensalAdmin(admin.ModelAdmin):
+    list_display = ['clinica', 'mes', 'ano', 'quantidade', 'total', 'encerrado_em']
+    list_filter = ['clinica']
+    list_select_related = ['clinica']
+
+@admin.register(ArquivoMensal)
+class ArquivoMensalAdmin(admin.ModelAdmin):
+    list_display = ['clinica', 'mes', 'ano', 'quantidade', 'total', 'arquivado_em']
+    list_filter = ['clinica', 'ano']
+    list_select_related = ['clinica']
+    exclude = ['dados']
+    readonly_fields = ['clinica', 'periodo', 'mes', 'ano', 'quantidade', 'total', 'arquivado_em']
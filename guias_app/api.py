@@ -0,0 +1,124 @@
+"""Read-only REST API (Django REST framework) for reporting scripts.
+
+Every list is cursor-paginated, so a script can pull everything page by page, or keep
+the last cursor and come back for what was added since, without the cost of OFFSET on
+large tables. ?fields= limits the fields in the output, and responses carry an ETag, so
+an unchanged page is answered with 304 Not Modified.
+
+The monthly totals are read from ResumoMensal, like the overview, so they include the
+guides moved to ArquivoMensal and leave out guides whose month is not valid (no periodo).
+"""
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import conditional_page
+from rest_framework import mixins, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+from .exportacao import ABERTAS, ENCERRADAS, ESTADOS, TODAS, ErroExportacao, guias_para_exportar, periodo_de_texto
+from .models import Clinica, ResumoMensal
+from .serializers import ClinicaSerializer, GuiaSerializer, TotalMensalSerializer
+
+
+class PaginacaoCursor(CursorPagination):
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'tamanho'
+    max_page_size = 1000
+
+
+class PaginacaoTotais(PaginacaoCursor):
+    ordering = ('periodo', 'clinica_id')
+
+
+def _filtros(request):
+    """The ?clinica=, ?de=/?ate= (AAAA-MM) and ?estado= (todas/encerradas/abertas) filters."""
+    estado = request.query_params.get('estado', TODAS)
+    if estado not in dict(ESTADOS):
+        raise ValidationError({'estado': f"Use um de: {', '.join(dict(ESTADOS))}."})
+    clinica_id = request.query_params.get('clinica') or None
+    if clinica_id and not str(clinica_id).isdigit():
+        raise ValidationError(f"Clínica inválida: {clinica_id}.")
+    try:
+        return {
+            'clinica_id': clinica_id,
+            'periodo_de': periodo_de_texto(request.query_params.get('de')),
+            'periodo_ate': periodo_de_texto(request.query_params.get('ate')),
+            'estado': estado,
+        }
+    except ErroExportacao as e:
+        raise ValidationError(str(e))
+
+
+def filtrar_guias(request):
+    """Guides filtered by ?clinica=, ?de=/?ate= (AAAA-MM) and ?estado= (todas/encerradas/abertas)."""
+    return guias_para_exportar(**_filtros(request))
+
+
+def _valor(expressao):
+    return ExpressionWrapper(expressao, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+# (guides, open guides, value) of a ResumoMensal row for each ?estado=; archived guides are all closed
+TOTAIS_POR_ESTADO = {
+    TODAS: (
+        F('quantidade') + F('quantidade_arquivadas'),
+        F('quantidade') - F('quantidade_encerradas'),
+        _valor(F('total') + F('total_arquivado')),
+    ),
+    ENCERRADAS: (
+        F('quantidade_encerradas') + F('quantidade_arquivadas'),
+        Value(0),
+        _valor(F('total_encerradas') + F('total_arquivado')),
+    ),
+    ABERTAS: (
+        F('quantidade') - F('quantidade_encerradas'),
+        F('quantidade') - F('quantidade_encerradas'),
+        _valor(F('total') - F('total_encerradas')),
+    ),
+}
+
+
+@method_decorator(conditional_page, name='dispatch')
+class ClinicaViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Clinica.objects.all()
+    serializer_class = ClinicaSerializer
+    pagination_class = PaginacaoCursor
+
+
+@method_decorator(conditional_page, name='dispatch')
+class GuiaViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = GuiaSerializer
+    pagination_class = PaginacaoCursor
+
+    def get_queryset(self):
+        if self.action == 'list':
+            guias = filtrar_guias(self.request)
+        else:
+            guias = guias_para_exportar()
+        # clinica_nome would otherwise cost one query per guide
+        return guias.select_related('clinica')
+
+
+@method_decorator(conditional_page, name='dispatch')
+class TotalMensalViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Number of guides and total value per clinic and month, from the ResumoMensal rows."""
+    serializer_class = TotalMensalSerializer
+    pagination_class = PaginacaoTotais
+
+    def get_queryset(self):
+        filtros = _filtros(self.request)
+        resumos = ResumoMensal.objects.all()
+        if filtros['clinica_id']:
+            resumos = resumos.filter(clinica_id=filtros['clinica_id'])
+        if filtros['periodo_de'] is not None:
+            resumos = resumos.filter(periodo__gte=filtros['periodo_de'])
+        if filtros['periodo_ate'] is not None:
+            resumos = resumos.filter(periodo__lte=filtros['periodo_ate'])
+        guias, abertas, valor = TOTAIS_POR_ESTADO[filtros['estado']]
+        # One row per (clinica, periodo), so the cursor's ordering is unique
+        return (
+            resumos.annotate(guias_mes=guias, abertas_mes=abertas, valor_mes=valor)
+            .filter(guias_mes__gt=0)
+            .values('clinica_id', 'clinica__nome', 'periodo', 'guias_mes', 'abertas_mes', 'valor_mes')
+        )
@@ -0,0 +1,130 @@
+"""Archive of the closed guides of past years.
+
+arquivar() moves the guides of a year out of Guia into ArquivoMensal: one row per clinic
+and month, with the guides stored as a zstd-compressed Parquet file in a BinaryField. They
+stay in the database, so they are backed up with it and survive an ephemeral filesystem,
+but Guia (and GuiaLinha and the search index) only keeps the years still being worked on.
+
+The month's ResumoMensal row keeps the archived count and total, so the overview shows
+archived months without reading the archive. The archive itself is read only when
+exporting (exportacao) or rendering the PDF of an archived month whose PDF is not cached.
+"""
+import io
+import itertools
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import pesquisa, resumos
+from .models import ArquivoMensal, Guia, GuiaLinha, ResumoMensal
+from .pdf import LinhaPDF
+
+TAMANHO_LOTE = 500
+
+# Guia fields stored in the archive, in this order; id is the original primary key
+CAMPOS = ['id', 'numero_guia', 'nome_paciente', 'medico', 'trabalhos', 'valor', 'valor_total', 'mes', 'ano']
+
+
+class ErroArquivo(Exception):
+    pass
+
+
+def _esquema():
+    import pyarrow as pa
+
+    tipos = {'id': pa.int64(), 'valor_total': pa.decimal128(12, 2)}
+    return pa.schema([(campo, tipos.get(campo, pa.string())) for campo in CAMPOS])
+
+def _parquet(linhas):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    destino = io.BytesIO()
+    pq.write_table(pa.Table.from_pylist(linhas, schema=_esquema()), destino, compression='zstd')
+    return destino.getvalue()
+
+def ler(arquivo):
+    """The archived guides of one ArquivoMensal, as {field: value} dicts in their original order."""
+    import pyarrow.parquet as pq
+
+    return pq.read_table(io.BytesIO(bytes(arquivo.dados))).to_pylist()
+
+def _intervalo(ano):
+    return Q(periodo__gte=ano * 100 + 1, periodo__lte=ano * 100 + 12)
+
+def meses_a_arquivar(ano, clinicas=None):
+    """(clinica_id, periodo) months of the year with guides in Guia; ErroArquivo if any is still open."""
+    guias = Guia.objects.filter(_intervalo(ano))
+    if clinicas:
+        guias = guias.filter(clinica_id__in=clinicas)
+    abertas = guias.filter(is_closed=False).count()
+    if abertas:
+        raise ErroArquivo(f"{ano} ainda tem {abertas} guia(s) aberta(s); encerre os meses antes de arquivar.")
+    return sorted(guias.order_by().values_list('clinica_id', 'periodo').distinct())
+
+def arquivar(ano, clinicas=None):
+    """Move the guides of `ano` (optionally only these clinics) into ArquivoMensal, in one transaction.
+
+    A month archived before gets the new guides appended to its file, so the year can be
+    archived again after late guides were added and closed. Returns the ArquivoMensal rows.
+    """
+    with transaction.atomic():
+        pares = meses_a_arquivar(ano, clinicas)
+        existentes = {
+            (arquivo.clinica_id, arquivo.periodo): arquivo
+            for arquivo in ArquivoMensal.objects.filter(_intervalo(ano), clinica_id__in={c for c, _ in pares})
+        }
+        arquivos, removidas = [], []
+        for clinica_id, periodo in pares:
+            guias = list(Guia.objects.do_periodo(periodo, clinica_id).order_by('pk').values(*CAMPOS))
+            arquivo = existentes.get((clinica_id, periodo))
+            if arquivo is None:
+                arquivo = ArquivoMensal(clinica_id=clinica_id, periodo=periodo, mes=guias[0]['mes'], ano=guias[0]['ano'])
+                linhas = guias
+            else:
+                linhas = ler(arquivo) + guias
+            arquivo.quantidade = len(linhas)
+            arquivo.total = sum(linha['valor_total'] for linha in linhas)
+            arquivo.dados = _parquet(linhas)
+            arquivo.save()
+            arquivos.append(arquivo)
+            removidas.extend(guia['id'] for guia in guias)
+
+            ResumoMensal.objects.update_or_create(
+                clinica_id=clinica_id, periodo=periodo,
+                defaults={'quantidade_arquivadas': arquivo.quantidade, 'total_arquivado': arquivo.total},
+                create_defaults={
+                    'mes': arquivo.mes, 'ano': arquivo.ano,
+                    'quantidade_arquivadas': arquivo.quantidade, 'total_arquivado': arquivo.total,
+                },
+            )
+
+        # Raw deletes: the data has not changed, only moved, so the Guia signals (which would
+        # recompute each month and drop its cached PDF) are not wanted here
+        for lote in itertools.batched(removidas, TAMANHO_LOTE):
+            GuiaLinha.objects.filter(guia_id__in=lote)._raw_delete(GuiaLinha.objects.db)
+            Guia.objects.filter(pk__in=lote)._raw_delete(Guia.objects.db)
+            pesquisa.remover(lote)
+        resumos.atualizar(pares)
+    return arquivos
+
+def dados_pdf(clinica_id, periodo):
+    """gerar_pdf rows and total of an archived month, or None if it is not archived."""
+    arquivo = ArquivoMensal.objects.filter(clinica_id=clinica_id, periodo=periodo).first()
+    if arquivo is None:
+        return None
+    dados = [
+        LinhaPDF(*(linha[campo] or "" for campo in LinhaPDF._fields))
+        for linha in ler(arquivo)
+    ]
+    return dados, arquivo.total
+
+def juntar_pdf(clinica_id, periodo, dados, total):
+    """gerar_pdf rows and total of a month: its archived guides, if any, then these rows from Guia.
+
+    A guide may be added to a month after it was archived, so the two have to be merged.
+    """
+    arquivado = dados_pdf(clinica_id, periodo)
+    if arquivado is None:
+        return dados, total
+    return arquivado[0] + list(dados), arquivado[1] + total
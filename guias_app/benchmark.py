@@ -0,0 +1,179 @@
+"""Timed scenarios for the main pages, run with the Django test client.
+
+executar() times each scenario against whatever database is active (the benchmark_guias
+command runs it on a throwaway SQLite database filled by dados_sinteticos) and returns a
+dict ready to be written as JSON; comparar() checks it against a stored baseline.
+
+carga() is the load generator of benchmark_servidores, which compares the WSGI and ASGI
+deployment profiles: it sends concurrent requests to a running server over HTTP.
+"""
+import http.client
+import platform
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from . import pdf_cache
+from .models import Guia, calcular_periodo
+from .signals import periodos_alterados
+
+
+@contextmanager
+def base_de_dados_temporaria(pasta):
+    """Create a test database in pasta/benchmark.sqlite3 and yield its path; destroyed on exit."""
+    setup_test_environment(debug=False)
+    nome_original = connection.settings_dict['NAME']
+    # A file rather than the in-memory test database, so the timings include real I/O
+    caminho = pasta / 'benchmark.sqlite3'
+    connection.settings_dict['TEST']['NAME'] = str(caminho)
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        yield caminho
+    finally:
+        connection.creation.destroy_test_db(nome_original, verbosity=0)
+        teardown_test_environment()
+
+def _medir(pedido, repeticoes, preparar=None):
+    """Run `pedido` once to warm up and then `repeticoes` times; timings in ms."""
+    if preparar:
+        preparar()
+    pedido()
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            pedido()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'min_ms': round(min(tempos), 2),
+        'mediana_ms': round(statistics.median(tempos), 2),
+        'p95_ms': round(statistics.quantiles(tempos, n=20)[18], 2) if len(tempos) > 1 else round(tempos[0], 2),
+        'media_ms': round(statistics.fmean(tempos), 2),
+        'consultas': len(consultas),  # of the last run; the count does not vary between runs
+    }
+
+def _verificar(response, estado=200):
+    if response.status_code != estado:
+        raise AssertionError(f"{response.request['PATH_INFO']} devolveu {response.status_code}, esperado {estado}")
+    if getattr(response, 'streaming', False):
+        b"".join(response.streaming_content)
+    return response
+
+def cenarios(clinica, mes_encerrado, mes_aberto):
+    """{nome: (pedido, preparar)} for the scenarios, given a clinic with one closed and one open month."""
+    cliente = Client()
+    periodo_encerrado = calcular_periodo(*mes_encerrado)
+    periodo_aberto = calcular_periodo(*mes_aberto)
+    filtros_abertos = {'clinica': clinica.pk, 'mes': mes_aberto[0], 'ano': mes_aberto[1]}
+    filtros_encerrados = {'clinica': clinica.pk, 'mes': mes_encerrado[0], 'ano': mes_encerrado[1]}
+
+    def reabrir():
+        Guia.objects.do_periodo(periodo_aberto, clinica.pk).update(is_closed=False, updated_at=datetime.now(timezone.utc))
+        periodos_alterados([(clinica.pk, periodo_aberto)])
+
+    return {
+        'overview_guides': (
+            lambda: _verificar(cliente.get(reverse('overview_guides'))),
+            None,
+        ),
+        'guia_create': (
+            lambda: _verificar(cliente.get(reverse('guia_create'), filtros_abertos)),
+            None,
+        ),
+        'guia_pdf': (
+            lambda: _verificar(cliente.get(reverse('guia_pdf'), filtros_encerrados)),
+            # Measure the render, not the closed-month PDF cache
+            lambda: pdf_cache.invalidar(clinica.pk, periodo_encerrado),
+        ),
+        'guia_close_monthly': (
+            lambda: _verificar(cliente.post(reverse('guia_close_monthly'), filtros_abertos), 302),
+            reabrir,
+        ),
+    }
+
+def _ambiente():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+    }
+
+def executar(parametros, clinica, mes_encerrado, mes_aberto, repeticoes=10, apenas=None):
+    resultados = {}
+    for nome, (pedido, preparar) in cenarios(clinica, mes_encerrado, mes_aberto).items():
+        if apenas and nome not in apenas:
+            continue
+        resultados[nome] = _medir(pedido, repeticoes, preparar)
+    return {
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'ambiente': _ambiente(),
+        'parametros': dict(parametros, repeticoes=repeticoes),
+        'cenarios': resultados,
+    }
+
+def comparar(resultados, baseline, tolerancia):
+    """List of regressions: median slower than the baseline by more than `tolerancia`, or more queries."""
+    regressoes = []
+    for nome, atual in resultados['cenarios'].items():
+        base = baseline.get('cenarios', {}).get(nome)
+        if base is None:
+            continue
+        if atual['mediana_ms'] > base['mediana_ms'] * (1 + tolerancia):
+            regressoes.append(
+                f"{nome}: mediana {atual['mediana_ms']:.2f} ms, baseline {base['mediana_ms']:.2f} ms "
+                f"(+{(atual['mediana_ms'] / base['mediana_ms'] - 1) * 100:.0f}%)"
+            )
+        if atual['consultas'] > base['consultas']:
+            regressoes.append(f"{nome}: {atual['consultas']} consultas, baseline {base['consultas']}")
+    return regressoes
+
+def _pedido_http(anfitriao, porta, caminho):
+    """GET `caminho` on a new connection; returns (ms, status or None on a connection error)."""
+    inicio = time.perf_counter()
+    conexao = http.client.HTTPConnection(anfitriao, porta, timeout=120)
+    try:
+        conexao.request('GET', caminho, headers={'Connection': 'close'})
+        resposta = conexao.getresponse()
+        resposta.read()
+        estado = resposta.status
+    except (OSError, http.client.HTTPException):
+        estado = None
+    finally:
+        conexao.close()
+    return (time.perf_counter() - inicio) * 1000, estado
+
+def carga(anfitriao, porta, caminhos, concorrencia, pedidos):
+    """Send `pedidos` GET requests, `concorrencia` at a time, cycling through `caminhos`.
+
+    Every request opens its own connection, so servers with and without keep-alive are
+    measured the same way.
+    """
+    def trabalhador(indice):
+        return [
+            _pedido_http(anfitriao, porta, caminhos[i % len(caminhos)])
+            for i in range(indice, pedidos, concorrencia)
+        ]
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(concorrencia) as executor:
+        respostas = [resposta for parte in executor.map(trabalhador, range(concorrencia)) for resposta in parte]
+    duracao = time.perf_counter() - inicio
+    tempos = [ms for ms, _ in respostas]
+    return {
+        'pedidos_s': round(len(respostas) / duracao, 1),
+        'mediana_ms': round(statistics.median(tempos), 2),
+        'p95_ms': round(statistics.quantiles(tempos, n=20)[18], 2) if len(tempos) > 1 else round(tempos[0], 2),
+        'erros': sum(1 for _, estado in respostas if estado != 200),
+    }
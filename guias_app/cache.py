@@ -0,0 +1,44 @@
+"""Process-shared cache of the clinic list.
+
+The navbar (context processor), the home page, the clinic management page and the Guia
+form all show the same list of clinics. It changes only when a clinic is added, renamed or
+deleted, so it is read from the Django cache and invalidated by the Clinica signal handlers.
+"""
+from django.core.cache import cache
+
+from .models import Clinica
+
+CHAVE_CLINICAS = 'guias_app:clinicas'
+TEMPO_CLINICAS = 60 * 60 # safety net only; changes invalidate the entry explicitly
+
+
+def listar_clinicas():
+    clinicas = cache.get(CHAVE_CLINICAS)
+    if clinicas is None:
+        clinicas = list(Clinica.objects.all().order_by('nome'))
+        cache.set(CHAVE_CLINICAS, clinicas, TEMPO_CLINICAS)
+    return clinicas
+
+def nome_clinica(clinica_id):
+    """Name of a clinic from the cached list ("" if it does not exist)."""
+    for clinica in listar_clinicas():
+        if str(clinica.pk) == str(clinica_id):
+            return clinica.nome
+    return ""
+
+def invalidar_clinicas():
+    cache.delete(CHAVE_CLINICAS)
+
+async def alistar_clinicas():
+    """listar_clinicas() for async views, with the async cache and ORM APIs."""
+    clinicas = await cache.aget(CHAVE_CLINICAS)
+    if clinicas is None:
+        clinicas = [clinica async for clinica in Clinica.objects.all().order_by('nome')]
+        await cache.aset(CHAVE_CLINICAS, clinicas, TEMPO_CLINICAS)
+    return clinicas
+
+async def anome_clinica(clinica_id):
+    for clinica in await alistar_clinicas():
+        if str(clinica.pk) == str(clinica_id):
+            return clinica.nome
+    return ""
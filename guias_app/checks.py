@@ -0,0 +1,65 @@
+"""System checks for the SQLite profile in settings (SQLITE_OPTIONS).
+
+The configuration checks run with every manage.py command; the ones that open the database
+run with `manage.py check --database default` (the Heroku release phase, see Procfile) and
+before migrate.
+"""
+import os
+
+from django.core.checks import Error, Tags, Warning, register
+from django.db import connections
+
+
+def _sqlite(alias='default'):
+    conexao = connections[alias]
+    return conexao if conexao.vendor == 'sqlite' else None
+
+@register()
+def verificar_configuracao_sqlite(app_configs, **kwargs):
+    conexao = _sqlite()
+    if conexao is None:
+        return []
+    avisos = []
+    if not conexao.settings_dict.get('CONN_MAX_AGE'):
+        avisos.append(Warning(
+            "SQLite sem ligações persistentes: os pragmas são aplicados em cada pedido.",
+            hint="Defina CONN_MAX_AGE na base de dados 'default'.",
+            id='guias_app.W001',
+        ))
+    return avisos
+
+@register(Tags.database)
+def verificar_base_de_dados_sqlite(app_configs, databases=None, **kwargs):
+    if not databases or 'default' not in databases:
+        return []
+    conexao = _sqlite()
+    if conexao is None:
+        return []
+    erros = []
+    with conexao.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        modo = cursor.fetchone()[0]
+        cursor.execute("PRAGMA compile_options")
+        opcoes = {linha[0] for linha in cursor.fetchall()}
+    if modo != 'wal' and not conexao.is_in_memory_db():
+        erros.append(Warning(
+            f"A base de dados SQLite está em journal_mode={modo}, não em WAL.",
+            hint=(
+                "Execute manage.py migrate (a migração 0011_sqlite_wal ativa o WAL) e verifique se o "
+                "sistema de ficheiros suporta WAL (memória partilhada; não funciona em NFS)."
+            ),
+            id='guias_app.W003',
+        ))
+    if 'ENABLE_FTS5' not in opcoes:
+        erros.append(Error(
+            "O SQLite instalado não tem FTS5, necessário para a pesquisa de guias.",
+            id='guias_app.E001',
+        ))
+    if not conexao.is_in_memory_db():
+        pasta = os.path.dirname(os.path.abspath(conexao.settings_dict['NAME']))
+        if not os.access(pasta, os.W_OK):
+            erros.append(Error(
+                f"Sem permissão de escrita em {pasta}; o SQLite em WAL precisa de criar os ficheiros -wal e -shm.",
+                id='guias_app.E002',
+            ))
+    return erros
@@ -0,0 +1,76 @@
+"""Conditional GET (ETag / Last-Modified) for guia_pdf and overview_guides.
+
+Both pages follow from the ResumoMensal rows, whose `versao` and `atualizado_em` change
+with every change to their month (see guias_app.resumos), and from the clinic names. The
+ETag is a hash of those values, so a browser that already has the page sends
+If-None-Match and gets a 304 after one small query, without the aggregation or ReportLab.
+
+Django's @condition calls its functions synchronously, which the async views cannot do
+with the ORM, hence these helpers. The pages are sent as private, no-cache: the browser
+keeps them but asks every time. A page carrying a flash message gets no validators, so the
+message is shown now and never comes back from the browser cache.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.db.models import Count, Max, Sum
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import anome_clinica
+from .models import ResumoMensal
+
+
+def _etag(request, *partes):
+    # The CSRF secret too, as the overview embeds a token derived from it. get_token() settles
+    # it before the page is rendered, so a first visit's ETag already matches the next one
+    get_token(request)
+    partes += (request.META.get('CSRF_COOKIE'),)
+    return 'W/"%s"' % hashlib.blake2b(repr(partes).encode(), digest_size=16).hexdigest()
+
+async def _tem_mensagens(request):
+    # len() leaves the messages unread; it only touches the session if the cookie overflowed
+    return bool(await sync_to_async(len)(messages.get_messages(request)))
+
+async def avalidadores_mes(request, clinica_id, periodo):
+    """(etag, last modified) of one clinic's month, or None if the month has no summary row."""
+    resumo = await (
+        ResumoMensal.objects.filter(clinica_id=clinica_id, periodo=periodo)
+        .values_list('versao', 'atualizado_em')
+        .afirst()
+    )
+    if resumo is None or await _tem_mensagens(request):
+        return None
+    versao, atualizado_em = resumo
+    # atualizado_em too: a month whose row was deleted and created again starts over at versao 1
+    return _etag(request, clinica_id, periodo, await anome_clinica(clinica_id), versao, atualizado_em), atualizado_em
+
+async def avalidadores_resumos(request, clinicas):
+    """(etag, last modified) of the whole summary table and the clinic list, or None."""
+    if await _tem_mensagens(request):
+        return None
+    resumo = await ResumoMensal.objects.aaggregate(
+        linhas=Count('pk'), versoes=Sum('versao'), atualizado_em=Max('atualizado_em'),
+    )
+    nomes = [(clinica.pk, clinica.nome) for clinica in clinicas]
+    return _etag(request, nomes, resumo['linhas'], resumo['versoes'], resumo['atualizado_em']), resumo['atualizado_em']
+
+def nao_modificado(request, validadores):
+    """The 304 response when the browser's copy is current, else None."""
+    if validadores is None:
+        return None
+    etag, ultima_alteracao = validadores
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(ultima_alteracao.timestamp()) if ultima_alteracao else None,
+    )
+
+def com_validadores(response, validadores):
+    patch_cache_control(response, private=True, no_cache=True)
+    if validadores is not None:
+        etag, ultima_alteracao = validadores
+        response['ETag'] = etag
+        if ultima_alteracao:
+            response['Last-Modified'] = http_date(ultima_alteracao.timestamp())
+    return response
@@ -0,0 +1,82 @@
+"""Synthetic guides for benchmarks: N clinics x M months x K guides per clinic and month.
+
+The data is generated from a seeded random.Random, so the same parameters always produce
+the same database, and written with bulk_create in batches, so large data sets are quick
+to build.
+"""
+import random
+
+from django.db import transaction
+
+from . import pesquisa, resumos
+from .models import MESES, Clinica, Guia, GuiaLinha, calcular_periodo
+
+TAMANHO_LOTE = 1000
+
+TRABALHOS = [
+    ("Coroa metalo-cerâmica", "80,00"),
+    ("Coroa em zircónia", "120,00"),
+    ("Faceta", "90,00"),
+    ("Prótese acrílica parcial", "150,00"),
+    ("Prótese esquelética", "220,50"),
+    ("Ponte de 3 elementos", "240,00"),
+    ("Gancho", "15"),
+    ("Reparação", "25,50"),
+    ("Rebasamento", "40"),
+    ("Goteira", "60,00"),
+]
+NOMES = ["Ana", "Rui", "Eva", "João", "Marta", "Pedro", "Sofia", "Luís", "Inês", "Tiago", "Rita", "Nuno"]
+APELIDOS = ["Silva", "Costa", "Lopes", "Martins", "Santos", "Ferreira", "Pereira", "Oliveira", "Rodrigues", "Sousa"]
+MEDICOS = ["Dr. Almeida", "Dra. Carvalho", "Dr. Gomes", "Dra. Ribeiro", "Dr. Pinto"]
+
+
+def meses_a_partir(ano, quantidade):
+    """The first `quantidade` (mes, ano) pairs from January of `ano`."""
+    return [(MESES[i % 12], str(ano + i // 12)) for i in range(quantidade)]
+
+def _guia(aleatorio, clinica, numero, mes, ano, is_closed):
+    trabalhos = aleatorio.sample(TRABALHOS, aleatorio.randint(1, 4))
+    return Guia(
+        clinica=clinica,
+        numero_guia=str(numero),
+        nome_paciente=f"{aleatorio.choice(NOMES)} {aleatorio.choice(APELIDOS)} {aleatorio.choice(APELIDOS)}",
+        medico=aleatorio.choice(MEDICOS),
+        trabalhos="\n".join(descricao for descricao, _ in trabalhos),
+        valor="\n".join(valor for _, valor in trabalhos),
+        mes=mes,
+        ano=ano,
+        is_closed=is_closed,
+    )
+
+def _gravar(guias):
+    linhas = []
+    for guia in guias:
+        guia.periodo = calcular_periodo(guia.mes, guia.ano)
+        linhas.extend(guia.construir_linhas())
+    Guia.objects.bulk_create(guias)
+    GuiaLinha.objects.bulk_create(linhas)
+    pesquisa.indexar(guias)
+
+def gerar(clinicas, meses, guias, ano=2025, semente=0, encerrar_ultimo_mes=False):
+    """Create the clinics and their guides; every month but the last is closed unless asked otherwise.
+
+    Returns the list of Clinica created.
+    """
+    aleatorio = random.Random(semente)
+    periodos = meses_a_partir(ano, meses)
+    with transaction.atomic():
+        novas = Clinica.objects.bulk_create(
+            Clinica(nome=f"Clínica Sintética {semente}-{i + 1:03d}") for i in range(clinicas)
+        )
+        lote = []
+        for clinica in novas:
+            for indice, (mes, ano_guia) in enumerate(periodos):
+                is_closed = encerrar_ultimo_mes or indice < len(periodos) - 1
+                for numero in range(1, guias + 1):
+                    lote.append(_guia(aleatorio, clinica, numero, mes, ano_guia, is_closed))
+                    if len(lote) >= TAMANHO_LOTE:
+                        _gravar(lote)
+                        lote = []
+        _gravar(lote)
+        resumos.atualizar(Guia.objects.filter(clinica__in=novas).values_list('clinica_id', 'periodo').distinct())
+    return novas
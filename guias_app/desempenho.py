@@ -0,0 +1,193 @@
+"""Per-request performance measurements.
+
+MedicaoDesempenhoMiddleware records, for every request, the wall time, the number and
+duration of SQL queries, the response size and the URL name, flags statements repeated
+often enough to look like an N+1 pattern, and writes one JSON line per request to the
+'guias_app.desempenho' logger (stdout, or a file under LOG_DIR; see LOGGING in settings). With DEBUG on,
+the same numbers are shown at the bottom of HTML pages and in a Server-Timing header.
+
+medir_fase() times a section of code inside the request being measured; gerar_pdf uses it
+for its phases. Outside a request (background PDF jobs, management commands),
+medir_fases() logs the phases of that one operation as a line of its own.
+"""
+import contextvars
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+logger = logging.getLogger(__name__)
+
+# Phases of the operation being measured: {nome: ms}, or None when nothing is being measured
+_fases = contextvars.ContextVar('fases', default=None)
+
+_LISTA_IN = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+@contextmanager
+def medir_fase(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        fases = _fases.get()
+        if fases is not None:
+            fases[nome] = fases.get(nome, 0) + (time.perf_counter() - inicio) * 1000
+
+@contextmanager
+def medir_fases(evento):
+    """Collect the medir_fase() timings of one operation and log them, unless a request is already doing so."""
+    if _fases.get() is not None:
+        yield
+        return
+    fases = {}
+    token = _fases.set(fases)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _fases.reset(token)
+        logger.info(json.dumps({
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'evento': evento,
+            'duracao_ms': round((time.perf_counter() - inicio) * 1000, 2),
+            'fases': {nome: round(ms, 2) for nome, ms in fases.items()},
+        }))
+
+
+class _RegistoConsultas:
+    """execute_wrapper that counts and times queries, grouped by SQL text (parameters stay separate)."""
+
+    def __init__(self):
+        self.quantidade = 0
+        self.tempo = 0.0
+        self.por_sql = {}  # sql normalizado -> número de execuções
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.quantidade += 1
+            self.tempo += time.perf_counter() - inicio
+            if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                # IN lists of different lengths are still the same statement
+                sql = _LISTA_IN.sub('IN (...)', sql)
+                self.por_sql[sql] = self.por_sql.get(sql, 0) + 1
+
+    def repetidas(self, limiar):
+        return [
+            {'sql': sql[:300], 'vezes': vezes}
+            for sql, vezes in sorted(self.por_sql.items(), key=lambda item: -item[1])
+            if vezes >= limiar
+        ]
+
+
+def _instalar_registo(consultas):
+    connection.execute_wrappers.append(consultas)
+
+def _remover_registo(consultas):
+    connection.execute_wrappers.remove(consultas)
+
+
+class MedicaoDesempenhoMiddleware:
+    # Both, so that under ASGI the async views are not pushed into a thread by this middleware
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiar_repetidas = getattr(settings, 'DESEMPENHO_LIMIAR_REPETIDAS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        consultas = _RegistoConsultas()
+        fases = {}
+        token = _fases.set(fases)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(consultas):
+                response = self.get_response(request)
+        finally:
+            _fases.reset(token)
+        return self._registar(request, response, consultas, fases, inicio)
+
+    async def __acall__(self, request):
+        consultas = _RegistoConsultas()
+        fases = {}
+        token = _fases.set(fases)
+        inicio = time.perf_counter()
+        # Connections are per thread, and the async ORM runs every query of the request in
+        # the same thread (sync_to_async's thread_sensitive), so the wrapper goes on that one
+        await sync_to_async(_instalar_registo)(consultas)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _fases.reset(token)
+            await sync_to_async(_remover_registo)(consultas)
+        return self._registar(request, response, consultas, fases, inicio)
+
+    def _registar(self, request, response, consultas, fases, inicio):
+        duracao = (time.perf_counter() - inicio) * 1000
+
+        # Streamed bodies (exports, ZIPs) are produced after this point; their size and any
+        # queries they run are not known here
+        tamanho = None if response.streaming else len(response.content)
+        repetidas = consultas.repetidas(self.limiar_repetidas)
+        resolver_match = request.resolver_match
+        registo = {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'metodo': request.method,
+            'url_name': resolver_match.view_name if resolver_match else None,
+            'caminho': request.path,
+            'estado': response.status_code,
+            'duracao_ms': round(duracao, 2),
+            'consultas': consultas.quantidade,
+            'tempo_consultas_ms': round(consultas.tempo * 1000, 2),
+            'bytes': tamanho,
+            'streaming': response.streaming,
+        }
+        if fases:
+            registo['fases'] = {nome: round(ms, 2) for nome, ms in fases.items()}
+        if repetidas:
+            registo['n_mais_1'] = repetidas
+        logger.info(json.dumps(registo))
+
+        if settings.DEBUG:
+            self._mostrar(response, registo)
+        return response
+
+    def _mostrar(self, response, registo):
+        response['Server-Timing'] = (
+            f"total;dur={registo['duracao_ms']}, db;dur={registo['tempo_consultas_ms']};desc=\"{registo['consultas']} consultas\""
+        )
+        if response.streaming or not response.get('Content-Type', '').startswith('text/html'):
+            return
+        texto = (
+            f"⏱ {registo['duracao_ms']:.1f} ms · {registo['consultas']} consultas "
+            f"({registo['tempo_consultas_ms']:.1f} ms) · {registo['bytes'] / 1024:.1f} KB"
+        )
+        texto += "".join(f" · {nome} {ms:.1f} ms" for nome, ms in registo.get('fases', {}).items())
+        if 'n_mais_1' in registo:
+            texto += f" · ⚠️ possível N+1: {registo['n_mais_1'][0]['vezes']}× {registo['n_mais_1'][0]['sql'][:80]}"
+        barra = (
+            '<div style="position: fixed; bottom: 0; right: 0; background: #343a40; color: #fff; '
+            'font: 12px monospace; padding: 4px 8px; opacity: 0.85; z-index: 1000;">'
+            f'{escape(texto)}</div>'
+        ).encode()
+        conteudo = response.content
+        posicao = conteudo.rfind(b'</body>')
+        if posicao != -1:
+            response.content = conteudo[:posicao] + barra + conteudo[posicao:]
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(response.content))
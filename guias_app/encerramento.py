@@ -0,0 +1,74 @@
+"""Month close: mark a clinic's open guides of a month as closed.
+
+encerrar() closes any number of (clinica, periodo) months in a single transaction. The
+open guides are selected FOR UPDATE (row locks on PostgreSQL; on SQLite the IMMEDIATE
+transaction already holds the database write lock), and exactly those rows are closed and
+counted into an EncerramentoMensal record, so a guide inserted while the close runs is
+either fully in or left open, never closed without being counted.
+"""
+import itertools
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EncerramentoMensal, Guia
+from .signals import periodos_alterados
+
+TAMANHO_LOTE = 500
+
+
+def meses_abertos(periodos, clinicas=None):
+    """(clinica_id, periodo) pairs with open guides in these months, optionally only for these clinics."""
+    guias = Guia.objects.filter(is_closed=False, periodo__in=periodos)
+    if clinicas:
+        guias = guias.filter(clinica_id__in=clinicas)
+    return sorted(set(guias.values_list('clinica_id', 'periodo')))
+
+def encerrar(pares, progresso=None):
+    """Close the open guides of these (clinica_id, periodo) months; returns the EncerramentoMensal created.
+
+    Months without open guides are skipped. `progresso(feitas, total)` is called as the
+    guides are updated, in batches of TAMANHO_LOTE.
+    """
+    pares = sorted({(int(clinica_id), periodo) for clinica_id, periodo in pares})
+    with transaction.atomic():
+        guias = []
+        # A slice of months per query keeps the OR within SQLite's expression depth limit
+        for meses in itertools.batched(pares, 200):
+            filtro = Q()
+            for clinica_id, periodo in meses:
+                filtro |= Q(clinica_id=clinica_id, periodo=periodo)
+            guias.extend(
+                Guia.objects.select_for_update()
+                .filter(filtro, is_closed=False)
+                .order_by('pk')
+                .values_list('pk', 'clinica_id', 'periodo', 'mes', 'ano', 'valor_total')
+            )
+        if not guias:
+            return []
+
+        por_mes = defaultdict(list)
+        for pk, clinica_id, periodo, mes, ano, valor_total in guias:
+            por_mes[(clinica_id, periodo, mes, ano)].append(valor_total)
+
+        feitas = 0
+        agora = timezone.now()
+        for lote in itertools.batched((guia[0] for guia in guias), TAMANHO_LOTE):
+            Guia.objects.filter(pk__in=lote).update(is_closed=True, updated_at=agora)
+            feitas += len(lote)
+            if progresso:
+                progresso(feitas, len(guias))
+
+        encerramentos = EncerramentoMensal.objects.bulk_create(
+            EncerramentoMensal(
+                clinica_id=clinica_id, periodo=periodo, mes=mes, ano=ano,
+                quantidade=len(valores), total=sum(valores, Decimal('0')),
+            )
+            for (clinica_id, periodo, mes, ano), valores in sorted(por_mes.items())
+        )
+        # update() sends no signals; refresh the months' summaries (and PDF cache) explicitly
+        periodos_alterados((clinica_id, periodo) for clinica_id, periodo, _, _ in por_mes)
+    return encerramentos
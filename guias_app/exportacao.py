@@ -0,0 +1,174 @@
+"""Export of guides as CSV, XLSX or Parquet, for processing outside the app.
+
+Rows are read with QuerySet.iterator() and written a block at a time, and every format is
+produced as an iterable of byte chunks, so memory use does not grow with the number of
+guides exported. Archived guides (see arquivo.py) are read one month at a time and merged
+into the same (periodo, clinica) order.
+"""
+import csv
+import heapq
+import importlib.util
+import io
+import itertools
+import tempfile
+
+from django.db.models import F
+
+from . import arquivo
+from .models import ArquivoMensal, Guia
+from .streaming import _BufferEscrita
+
+TAMANHO_BLOCO = 2000
+
+TODAS = 'todas'
+ENCERRADAS = 'encerradas'
+ABERTAS = 'abertas'
+ESTADOS = [
+    (TODAS, "Todas"),
+    (ENCERRADAS, "Encerradas"),
+    (ABERTAS, "Abertas"),
+]
+
+COLUNAS = [
+    ('clinica__nome', "Clínica"),
+    ('numero_guia', "Número da Guia"),
+    ('nome_paciente', "Nome do Paciente"),
+    ('medico', "Médico"),
+    ('trabalhos', "Tipo(s) de Trabalho"),
+    ('valor', "Valor (€)"),
+    ('valor_total', "Total (€)"),
+    ('mes', "Mês"),
+    ('ano', "Ano"),
+    ('is_closed', "Encerrada"),
+]
+
+
+class ErroExportacao(Exception):
+    pass
+
+
+def periodo_de_texto(texto):
+    """Parse "AAAA-MM" (as sent by <input type="month">) into the yyyymm integer; None if empty."""
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    ano, _, mes = texto.partition('-')
+    if len(ano) != 4 or not ano.isdigit() or not mes.isdigit() or not 1 <= int(mes) <= 12:
+        raise ErroExportacao(f"Período inválido: {texto} (use AAAA-MM).")
+    return int(ano) * 100 + int(mes)
+
+def guias_para_exportar(clinica_id=None, periodo_de=None, periodo_ate=None, estado=TODAS):
+    guias = Guia.objects.all()
+    if clinica_id and not str(clinica_id).isdigit():
+        raise ErroExportacao(f"Clínica inválida: {clinica_id}.")
+    if clinica_id:
+        guias = guias.filter(clinica_id=clinica_id)
+    if periodo_de is not None:
+        guias = guias.filter(periodo__gte=periodo_de)
+    if periodo_ate is not None:
+        guias = guias.filter(periodo__lte=periodo_ate)
+    if estado == ENCERRADAS:
+        guias = guias.filter(is_closed=True)
+    elif estado == ABERTAS:
+        guias = guias.filter(is_closed=False)
+    return guias.order_by(F('periodo').asc(nulls_first=True), 'clinica_id', 'pk')
+
+def arquivos_para_exportar(clinica_id=None, periodo_de=None, periodo_ate=None, estado=TODAS):
+    """The ArquivoMensal rows for the same filters as guias_para_exportar (archived guides are all closed)."""
+    if estado == ABERTAS:
+        return ArquivoMensal.objects.none()
+    arquivos = ArquivoMensal.objects.select_related('clinica')
+    if clinica_id:
+        arquivos = arquivos.filter(clinica_id=clinica_id)
+    if periodo_de is not None:
+        arquivos = arquivos.filter(periodo__gte=periodo_de)
+    if periodo_ate is not None:
+        arquivos = arquivos.filter(periodo__lte=periodo_ate)
+    return arquivos.order_by('periodo', 'clinica_id')
+
+def _linhas_arquivadas(arquivos):
+    for arquivo_mensal in arquivos.iterator(chunk_size=1):
+        for linha in arquivo.ler(arquivo_mensal):
+            valores = dict(linha, clinica__nome=arquivo_mensal.clinica.nome, is_closed=True)
+            yield (arquivo_mensal.periodo, arquivo_mensal.clinica_id, *(valores[campo] for campo, _ in COLUNAS))
+
+def _blocos(guias, arquivos=None):
+    """Yield the rows as tuples, TAMANHO_BLOCO at a time, without loading the whole result set."""
+    linhas = guias.values_list('periodo', 'clinica_id', *(campo for campo, _ in COLUNAS)).iterator(chunk_size=TAMANHO_BLOCO)
+    if arquivos is not None:
+        # Both sources are sorted by (periodo, clinica_id); archived guides come first in a tie.
+        # Guides with no valid month have periodo None, which sorts first and cannot be compared
+        linhas = heapq.merge(
+            _linhas_arquivadas(arquivos), linhas,
+            key=lambda linha: (linha[0] is not None, linha[0] or 0, linha[1]),
+        )
+    yield from itertools.batched((linha[2:] for linha in linhas), TAMANHO_BLOCO)
+
+def exportar_csv(guias, arquivos=None):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    # The BOM lets Excel detect UTF-8 when the file is opened directly
+    buffer.write('\ufeff')
+    escritor.writerow(titulo for _, titulo in COLUNAS)
+    for bloco in _blocos(guias, arquivos):
+        escritor.writerows(bloco)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def exportar_xlsx(guias, arquivos=None):
+    import openpyxl
+
+    # A write-only workbook keeps the rows in a temporary file rather than in memory; the
+    # .xlsx (a ZIP) can only be assembled at the end, so it is built on disk and then streamed
+    livro = openpyxl.Workbook(write_only=True)
+    folha = livro.create_sheet("Guias")
+    folha.append([titulo for _, titulo in COLUNAS])
+    for bloco in _blocos(guias, arquivos):
+        for linha in bloco:
+            folha.append(linha)
+    with tempfile.TemporaryFile() as destino:
+        livro.save(destino)
+        destino.seek(0)
+        while bloco := destino.read(64 * 1024):
+            yield bloco
+
+def exportar_parquet(guias, arquivos=None):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {'valor_total': pa.decimal128(12, 2), 'is_closed': pa.bool_()}
+    esquema = pa.schema([(campo, tipos.get(campo, pa.string())) for campo, _ in COLUNAS])
+    buffer = _BufferEscrita()
+    # One row group per block, flushed to the response as soon as it is written
+    with pq.ParquetWriter(buffer, esquema, compression='zstd') as escritor:
+        for bloco in _blocos(guias, arquivos):
+            escritor.write_batch(pa.RecordBatch.from_pylist(
+                [dict(zip(esquema.names, linha)) for linha in bloco], schema=esquema,
+            ))
+            yield buffer.esvaziar()
+    yield buffer.esvaziar()
+
+# formato -> (gerador, content type, extensão, pacote opcional necessário)
+FORMATOS = {
+    'csv': (exportar_csv, 'text/csv; charset=utf-8', 'csv', None),
+    'xlsx': (exportar_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', 'openpyxl'),
+    'parquet': (exportar_parquet, 'application/vnd.apache.parquet', 'parquet', 'pyarrow'),
+}
+
+def exportar(guias, formato, arquivos=None):
+    """Return an iterable of byte chunks with the guides (and the archived ones) in the given format."""
+    if formato not in FORMATOS:
+        raise ErroExportacao(f"Formato desconhecido: {formato} (use {', '.join(FORMATOS)}).")
+    gerador, _, _, pacote = FORMATOS[formato]
+    # Checked up front: once the response has started streaming there is no way to report an error
+    if pacote and importlib.util.find_spec(pacote) is None:
+        raise ErroExportacao(f"A exportação para {formato} requer o pacote {pacote}.")
+    if arquivos is not None and importlib.util.find_spec('pyarrow') is None and arquivos.exists():
+        raise ErroExportacao("Exportar guias arquivadas requer o pacote pyarrow.")
+    return gerador(guias, arquivos)
+
+def nome_ficheiro(formato, periodo_de=None, periodo_ate=None):
+    partes = ["guias"] + [str(periodo) for periodo in (periodo_de, periodo_ate) if periodo is not None]
+    return f"{'_'.join(partes)}.{FORMATOS[formato][2]}"
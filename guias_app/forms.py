@@ -1,5 +1,8 @@
+from decimal import Decimal, InvalidOperation
+
 from django import forms
-from .models import Clinica, Guia
+from .cache import listar_clinicas
+from .models import MESES, Clinica, Guia, analisar_linhas, cabe_no_campo
 
 class ClinicaForm(forms.ModelForm):
     class Meta:
@@ -7,12 +10,7 @@ class ClinicaForm(forms.ModelForm):
         fields = ['nome']
 
 class GuiaForm(forms.ModelForm):
-    MES_CHOICES = [
-        ('Janeiro', 'Janeiro'), ('Fevereiro', 'Fevereiro'), ('Março', 'Março'),
-        ('Abril', 'Abril'), ('Maio', 'Maio'), ('Junho', 'Junho'),
-        ('Julho', 'Julho'), ('Agosto', 'Agosto'), ('Setembro', 'Setembro'),
-        ('Outubro', 'Outubro'), ('Novembro', 'Novembro'), ('Dezembro', 'Dezembro'),
-    ]
+    MES_CHOICES = [(mes, mes) for mes in MESES]
     ANO_CHOICES = [
         ('2025', '2025'), ('2026', '2026'), ('2027', '2027'),
     ]
@@ -25,4 +23,28 @@ class GuiaForm(forms.ModelForm):
         fields = ['clinica', 'numero_guia', 'nome_paciente', 'medico', 'trabalhos', 'valor', 'mes', 'ano']
         widgets = {
             'valor': forms.Textarea(attrs={'rows': 4}), # Make valor a textarea
-        }
\ No newline at end of file
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Render the clinic options from the cached list instead of querying on every page
+        clinica = self.fields['clinica']
+        if isinstance(clinica, forms.ModelChoiceField):
+            clinica.choices = [('', clinica.empty_label)] + [(c.pk, c.nome) for c in listar_clinicas()]
+    def clean_valor(self):
+        # Text lines are kept as they are, but a number the line items cannot store would fail on save
+        valor = self.cleaned_data.get('valor')
+        linhas, invalidas = analisar_linhas("", valor)
+        grandes = []
+        for val_str in invalidas:
+            try:
+                if Decimal(val_str.replace(",", ".")).is_finite():
+                    grandes.append(val_str)
+            except InvalidOperation:
+                pass
+        if grandes:
+            raise forms.ValidationError("Valor demasiado grande: %(valores)s", params={'valores': ", ".join(grandes)})
+        total = sum((valor for _, valor in linhas if valor is not None), Decimal('0'))
+        if not cabe_no_campo(total, Guia._meta.get_field('valor_total')):
+            raise forms.ValidationError("O total da guia é demasiado grande.")
+        return valor
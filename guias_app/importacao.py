@@ -0,0 +1,297 @@
+"""Bulk import of guides from CSV/XLSX spreadsheets.
+
+Rows are read one at a time (csv module / openpyxl read-only mode), validated with the
+GuiaForm rules and written with bulk_create/bulk_update in batches, so a file of any size
+is imported in a bounded amount of memory and a handful of queries per batch.
+
+CSV files are read as UTF-8 when the whole file is valid UTF-8 (checked in a first pass
+before any row is written) and as cp1252 otherwise, which is what Excel on Windows saves.
+A file that cannot be read raises ErroImportacao.
+"""
+import codecs
+import csv
+import io
+import unicodedata
+import zipfile
+from pathlib import Path
+
+from django import forms
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .forms import GuiaForm
+from .models import MESES, Clinica, Guia, GuiaLinha, calcular_periodo
+from .pesquisa import indexar
+from .signals import periodos_alterados
+
+SALTAR = 'saltar'
+ATUALIZAR = 'atualizar'
+CONFLITOS = [
+    (SALTAR, "Ignorar guias que já existem"),
+    (ATUALIZAR, "Atualizar guias que já existem"),
+]
+TAMANHO_LOTE = 500
+
+CAMPOS = ['clinica', 'numero_guia', 'nome_paciente', 'medico', 'trabalhos', 'valor', 'mes', 'ano']
+CAMPOS_ATUALIZADOS = ['nome_paciente', 'medico', 'trabalhos', 'valor', 'valor_total', 'updated_at']
+
+
+def normalizar(texto):
+    sem_acentos = unicodedata.normalize('NFKD', str(texto).strip()).encode('ascii', 'ignore').decode()
+    return "_".join(sem_acentos.casefold().replace("(", " ").replace(")", " ").split())
+
+# Accept both the field names and the labels shown in the app/PDF as column headers
+_COLUNAS = {normalizar(campo): campo for campo in CAMPOS}
+_COLUNAS.update({
+    normalizar(Guia._meta.get_field(campo).verbose_name): campo
+    for campo in CAMPOS
+})
+_COLUNAS.update({
+    'numero_ou_data': 'numero_guia',
+    'paciente': 'nome_paciente',
+    'tipo_de_trabalho': 'trabalhos',
+    'valor_eur': 'valor',
+})
+# Spreadsheets often write "janeiro" or "MARCO"; the form only accepts the names in MESES
+_MESES = {normalizar(mes): mes for mes in MESES}
+
+
+def mes_canonico(mes):
+    """The MESES name of a month written in any case or without accents; other text is returned as is."""
+    return _MESES.get(normalizar(mes or ""), mes)
+
+
+class ErroImportacao(Exception):
+    pass
+
+
+class RelatorioImportacao:
+    def __init__(self):
+        self.criadas = 0
+        self.atualizadas = 0
+        self.ignoradas = 0
+        self.erros = []  # (número da linha, mensagem)
+
+    def adicionar_erro(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+    def __str__(self):
+        return (
+            f"{self.criadas} guia(s) criada(s), {self.atualizadas} atualizada(s), "
+            f"{self.ignoradas} ignorada(s), {len(self.erros)} linha(s) com erros"
+        )
+
+
+class ImportacaoForm(forms.Form):
+    ficheiro = forms.FileField(label="Ficheiro (.csv ou .xlsx)")
+    conflitos = forms.ChoiceField(choices=CONFLITOS, initial=SALTAR, label="Guias repetidas")
+
+
+class GuiaImportForm(GuiaForm):
+    """GuiaForm rules for one spreadsheet row, without a query per row.
+
+    The clinic is looked up by name (or id) in a dictionary loaded once per import, and the
+    unique_together check is done per batch by the importer.
+    """
+
+    clinica = forms.CharField(label="Clínica")
+
+    def __init__(self, *args, clinicas, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clinicas = clinicas
+
+    def clean_clinica(self):
+        valor = self.cleaned_data['clinica']
+        clinica = self.clinicas.get(normalizar(valor))
+        if clinica is None:
+            raise forms.ValidationError(f"Clínica desconhecida: {valor}")
+        return clinica
+
+    def _get_validation_exclusions(self):
+        # The clinic was resolved from the dictionary; skip the per-row FK existence query
+        exclusoes = super()._get_validation_exclusions()
+        exclusoes.add('clinica')
+        return exclusoes
+
+    def validate_unique(self):
+        pass
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+def _codificacao(ficheiro):
+    """'utf-8-sig' if the whole file decodes as UTF-8, else 'cp1252'; read in blocks, then rewound."""
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while bloco := ficheiro.read(64 * 1024):
+            decodificador.decode(bloco)
+        decodificador.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    finally:
+        ficheiro.seek(0)
+    return 'utf-8-sig'
+
+def _linhas_csv(ficheiro):
+    texto = io.TextIOWrapper(ficheiro, encoding=_codificacao(ficheiro), newline='')
+    try:
+        amostra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+        except csv.Error:
+            dialeto = csv.excel
+        leitor = csv.reader(texto, dialeto)
+        cabecalho = next(leitor, None)
+        if cabecalho is None:
+            return
+        yield cabecalho
+        yield from leitor
+    except (UnicodeDecodeError, csv.Error) as e:
+        # cp1252 leaves a few bytes undefined; a NUL byte is a csv.Error
+        raise ErroImportacao(f"Não foi possível ler o ficheiro CSV: {e}")
+
+def _linhas_xlsx(ficheiro):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErroImportacao("A importação de ficheiros Excel requer o pacote openpyxl.")
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        livro = openpyxl.load_workbook(ficheiro, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as e:
+        # KeyError: a zip file that is not a workbook
+        raise ErroImportacao(f"O ficheiro não é um livro Excel válido: {e}")
+    try:
+        yield from livro.active.iter_rows(values_only=True)
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ErroImportacao(f"Não foi possível ler o livro Excel: {e}")
+    finally:
+        livro.close()
+
+def ler_linhas(ficheiro, nome):
+    """Yield (line number, {field: text}) for each data row of a CSV or XLSX file."""
+    extensao = Path(nome).suffix.lower()
+    if extensao == '.csv':
+        linhas = _linhas_csv(ficheiro)
+    elif extensao in ('.xlsx', '.xlsm'):
+        linhas = _linhas_xlsx(ficheiro)
+    else:
+        raise ErroImportacao("Formato não suportado; use um ficheiro .csv ou .xlsx.")
+
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        return
+    colunas = [_COLUNAS.get(normalizar(_texto(titulo))) for titulo in cabecalho]
+    em_falta = {'clinica', 'numero_guia', 'mes', 'ano'} - set(colunas)
+    if em_falta:
+        raise ErroImportacao(f"Colunas obrigatórias em falta: {', '.join(sorted(em_falta))}.")
+
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(_texto(valor) for valor in linha):
+            continue
+        yield numero, {
+            campo: _texto(valor)
+            for campo, valor in zip(colunas, linha)
+            if campo is not None
+        }
+
+def _chave(guia):
+    return (guia.numero_guia, guia.clinica_id, guia.mes, guia.ano)
+
+def _existentes(lote):
+    """Map the unique_together key of the guides already in the database to (pk, is_closed)."""
+    filtro = Q()
+    for clinica_id, periodo in {(guia.clinica_id, guia.periodo) for _, guia in lote}:
+        numeros = [guia.numero_guia for _, guia in lote if (guia.clinica_id, guia.periodo) == (clinica_id, periodo)]
+        filtro |= Q(clinica_id=clinica_id, periodo=periodo, numero_guia__in=numeros)
+    return {
+        (numero_guia, clinica_id, mes, ano): (pk, is_closed)
+        for pk, numero_guia, clinica_id, mes, ano, is_closed in Guia.objects.filter(filtro).values_list(
+            'pk', 'numero_guia', 'clinica_id', 'mes', 'ano', 'is_closed'
+        )
+    }
+
+def gravar_lote(lote, conflitos, relatorio):
+    """Insert/update a batch of validated (line number, unsaved Guia) pairs with bulk queries."""
+    if not lote:
+        return
+
+    # A key repeated inside the batch behaves as consecutive rows would:
+    # the first one is kept when skipping conflicts, the last one wins when updating
+    por_chave = {}
+    for numero, guia in lote:
+        chave = _chave(guia)
+        if chave in por_chave:
+            relatorio.ignoradas += 1
+            if conflitos != ATUALIZAR:
+                continue
+        por_chave[chave] = (numero, guia)
+    lote = list(por_chave.values())
+    existentes = _existentes(lote)
+
+    novas, atualizadas = [], []
+    for numero, guia in lote:
+        existente = existentes.get(_chave(guia))
+        if existente is None:
+            novas.append(guia)
+        elif existente[1]:
+            relatorio.adicionar_erro(numero, f"A guia {guia.numero_guia} já existe e está encerrada.")
+        elif conflitos == ATUALIZAR:
+            guia.pk = existente[0]
+            atualizadas.append(guia)
+        else:
+            relatorio.ignoradas += 1
+
+    linhas = []
+    for guia in novas + atualizadas:
+        linhas.extend(guia.construir_linhas())
+
+    with transaction.atomic():
+        Guia.objects.bulk_create(novas)
+        if atualizadas:
+            agora = timezone.now()
+            for guia in atualizadas:
+                guia.updated_at = agora
+            Guia.objects.bulk_update(atualizadas, CAMPOS_ATUALIZADOS)
+            GuiaLinha.objects.filter(guia__in=atualizadas).delete()
+        GuiaLinha.objects.bulk_create(linhas)
+        periodos_alterados((guia.clinica_id, guia.periodo) for guia in novas + atualizadas)
+        indexar(novas + atualizadas)
+
+    relatorio.criadas += len(novas)
+    relatorio.atualizadas += len(atualizadas)
+
+def importar_guias(ficheiro, nome, conflitos=SALTAR, tamanho_lote=TAMANHO_LOTE):
+    """Import a CSV/XLSX file of guides and return a RelatorioImportacao."""
+    clinicas = {}
+    for clinica in Clinica.objects.all():
+        clinicas[normalizar(clinica.nome)] = clinica
+        clinicas[str(clinica.pk)] = clinica
+
+    relatorio = RelatorioImportacao()
+    lote = []
+    for numero, dados in ler_linhas(ficheiro, nome):
+        dados['mes'] = mes_canonico(dados.get('mes'))
+        form = GuiaImportForm(dados, clinicas=clinicas)
+        if not form.is_valid():
+            for campo, erros in form.errors.items():
+                rotulo = form.fields[campo].label if campo in form.fields else ""
+                for erro in erros:
+                    relatorio.adicionar_erro(numero, f"{rotulo}: {erro}" if rotulo else erro)
+            continue
+        guia = form.save(commit=False)
+        guia.periodo = calcular_periodo(guia.mes, guia.ano)
+        lote.append((numero, guia))
+        if len(lote) >= tamanho_lote:
+            gravar_lote(lote, conflitos, relatorio)
+            lote = []
+    gravar_lote(lote, conflitos, relatorio)
+    return relatorio
@@ -0,0 +1,141 @@
+"""Migration of the Streamlit app's guias.db (tables clinicas/guias, see init_db in guias.py).
+
+The legacy database is opened read-only and its guides are read in id order with
+fetchmany(), so they are streamed in batches and never loaded all at once. Legacy clinics
+are matched to the Django ones by name (ignoring case and accents) through a dictionary
+built once, and the missing ones are created. Each batch goes through the spreadsheet
+importer's gravar_lote, which skips guides whose unique_together key already exists.
+
+A guide comes in closed when the legacy row says so (an is_closed column, if the table has
+one) or when its month is already closed here, so the migration never reopens a month.
+
+Each batch is committed on its own. The report keeps the last legacy id committed, so a
+run that fails halfway can be resumed after it with `desde`; running it again from the
+start is safe too: what was already migrated is counted as ignored, or reported as an
+error when its month is closed (as the spreadsheet importer does). A simulation runs
+in one transaction that is rolled back at the end.
+"""
+import sqlite3
+
+from django.db import transaction
+
+from .cache import invalidar_clinicas
+from .importacao import SALTAR, RelatorioImportacao, gravar_lote, mes_canonico, normalizar
+from .models import Clinica, Guia, ResumoMensal, calcular_periodo
+
+TAMANHO_LOTE = 1000
+
+_SQL_GUIAS = (
+    "SELECT id, numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id, {is_closed} "
+    "FROM guias WHERE id > ? ORDER BY id"
+)
+
+
+class ErroLegado(Exception):
+    pass
+
+
+class RelatorioLegado(RelatorioImportacao):
+    def __init__(self):
+        super().__init__()
+        self.clinicas_criadas = 0
+        self.ultimo_id = None  # último id de guias.db gravado
+
+    def __str__(self):
+        return f"{self.clinicas_criadas} clínica(s) criada(s), " + super().__str__()
+
+
+def abrir(caminho):
+    try:
+        origem = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        tabelas = {nome for (nome,) in origem.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    except sqlite3.Error as e:
+        raise ErroLegado(f"Não foi possível abrir {caminho}: {e}")
+    if not {'clinicas', 'guias'} <= tabelas:
+        origem.close()
+        raise ErroLegado(f"{caminho} não tem as tabelas clinicas/guias da aplicação Streamlit.")
+    return origem
+
+def _clinicas(origem, relatorio):
+    """{legacy clinic id: Clinica}, creating the clinics that do not exist yet."""
+    por_nome = {normalizar(clinica.nome): clinica for clinica in Clinica.objects.all()}
+    legado = origem.execute("SELECT id, nome FROM clinicas").fetchall()
+
+    novas = {}
+    for _, nome in legado:
+        chave = normalizar(nome)
+        if chave not in por_nome and chave not in novas:
+            novas[chave] = Clinica(nome=nome.strip())
+    if novas:
+        Clinica.objects.bulk_create(novas.values())
+        por_nome.update(novas)
+        relatorio.clinicas_criadas = len(novas)
+        # bulk_create sends no post_save, so the cached list is cleared here
+        invalidar_clinicas()
+        transaction.on_commit(invalidar_clinicas)
+    return {id_legado: por_nome[normalizar(nome)] for id_legado, nome in legado}
+
+def _sql_guias(origem):
+    colunas = {coluna[1] for coluna in origem.execute("PRAGMA table_info(guias)")}
+    return _SQL_GUIAS.format(is_closed="is_closed" if 'is_closed' in colunas else "0")
+
+def _meses_encerrados():
+    """The (clinica_id, periodo) months whose guides are all closed (or archived)."""
+    return set(ResumoMensal.objects.filter(encerrado=True).values_list('clinica_id', 'periodo'))
+
+def _guia(linha, clinicas, encerrados, relatorio):
+    id_legado, numero_guia, nome_paciente, medico, trabalhos, valor, mes, ano, clinica_id, is_closed = linha
+    clinica = clinicas.get(clinica_id)
+    numero_guia = (numero_guia or "").strip()
+    mes = mes_canonico(mes)
+    ano = str(ano or "").strip()
+    periodo = calcular_periodo(mes, ano)
+    if clinica is None:
+        relatorio.adicionar_erro(id_legado, f"Clínica inexistente (id {clinica_id}).")
+    elif not numero_guia:
+        relatorio.adicionar_erro(id_legado, "Número da guia em falta.")
+    elif periodo is None:
+        relatorio.adicionar_erro(id_legado, f"Mês/ano inválidos: {mes} {ano}.")
+    else:
+        return Guia(
+            clinica=clinica, numero_guia=numero_guia, nome_paciente=nome_paciente or "",
+            medico=medico or "", trabalhos=trabalhos or "", valor=valor or "",
+            mes=mes, ano=ano, periodo=periodo,
+            is_closed=bool(is_closed) or (clinica.pk, periodo) in encerrados,
+        )
+    return None
+
+def _importar(origem, tamanho_lote, desde, relatorio):
+    with transaction.atomic():
+        clinicas = _clinicas(origem, relatorio)
+    encerrados = _meses_encerrados()
+    cursor = origem.execute(_sql_guias(origem), (desde,))
+    while linhas := cursor.fetchmany(tamanho_lote):
+        lote = []
+        for linha in linhas:
+            guia = _guia(linha, clinicas, encerrados, relatorio)
+            if guia is not None:
+                lote.append((linha[0], guia))
+        # gravar_lote commits the batch in its own transaction
+        gravar_lote(lote, SALTAR, relatorio)
+        relatorio.ultimo_id = linhas[-1][0]
+
+def importar_legado(caminho, tamanho_lote=TAMANHO_LOTE, desde=0, simular=False, relatorio=None):
+    """Copy the clinics and guides of a legacy guias.db; returns a RelatorioLegado.
+
+    Guides with a legacy id up to `desde` are not read. With `simular` everything is rolled
+    back at the end, so the report shows what would be imported. Pass `relatorio` to keep
+    the last committed id (ultimo_id) when the import fails halfway.
+    """
+    origem = abrir(caminho)
+    relatorio = relatorio if relatorio is not None else RelatorioLegado()
+    try:
+        if simular:
+            with transaction.atomic():
+                _importar(origem, tamanho_lote, desde, relatorio)
+                transaction.set_rollback(True)
+        else:
+            _importar(origem, tamanho_lote, desde, relatorio)
+    finally:
+        origem.close()
+    return relatorio
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from guias_app import arquivo
+from guias_app.cache import nome_clinica
+
+
+class Command(BaseCommand):
+    help = (
+        "Arquiva as guias encerradas de um ano: saem da tabela de guias para ficheiros Parquet (zstd) "
+        "guardados por clínica e mês, ficando os totais no resumo mensal."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('ano', type=int, help="Ano a arquivar, AAAA.")
+        parser.add_argument('--clinica', type=int, action='append', dest='clinicas', help="Id da clínica (repetível).")
+        parser.add_argument('--simular', action='store_true', help="Mostrar o que seria arquivado, sem alterar nada.")
+
+    def handle(self, *args, **options):
+        try:
+            if options['simular']:
+                pares = arquivo.meses_a_arquivar(options['ano'], options['clinicas'])
+                for clinica_id, periodo in pares:
+                    self.stdout.write(f"  {nome_clinica(clinica_id)}: {periodo}")
+                self.stdout.write(f"{len(pares)} mês(es) seriam arquivados.")
+                return
+            arquivos = arquivo.arquivar(options['ano'], options['clinicas'])
+        except (ImportError, arquivo.ErroArquivo) as e:
+            raise CommandError(str(e))
+
+        for registo in arquivos:
+            self.stdout.write(
+                f"  {nome_clinica(registo.clinica_id)} {registo.mes}/{registo.ano}: "
+                f"{registo.quantidade} guias, {registo.total:.2f} €, {len(registo.dados) / 1024:.1f} KB"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(arquivos)} mês(es) arquivado(s)."))
@@ -0,0 +1,86 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from guias_app import benchmark, dados_sinteticos
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria uma base de dados SQLite temporária com dados sintéticos, mede as páginas principais "
+        "com o cliente de testes do Django e compara os resultados com a baseline guardada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinicas', type=int, default=10)
+        parser.add_argument('--meses', type=int, default=12)
+        parser.add_argument('--guias', type=int, default=30, help="Guias por clínica e por mês.")
+        parser.add_argument('--semente', type=int, default=0)
+        parser.add_argument('--repeticoes', type=int, default=10)
+        parser.add_argument('--cenario', action='append', dest='cenarios', help="Medir só este cenário (repetível).")
+        parser.add_argument('--saida', help="Ficheiro JSON onde escrever os resultados.")
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--tolerancia', type=float, default=0.25, help="Abrandamento aceite face à baseline (0.25 = 25%%).")
+        parser.add_argument('--guardar-baseline', action='store_true', help="Guardar os resultados como nova baseline.")
+
+    def handle(self, *args, **options):
+        if options['meses'] < 2:
+            raise CommandError("São precisos pelo menos 2 meses (um encerrado e um aberto).")
+        parametros = {campo: options[campo] for campo in ('clinicas', 'meses', 'guias', 'semente')}
+
+        pasta = Path(tempfile.mkdtemp(prefix='benchmark_guias_'))
+        try:
+            with benchmark.base_de_dados_temporaria(pasta), override_settings(
+                MEDIA_ROOT=pasta / 'media',
+                PDF_WORKERS=0,
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': pasta / 'cache',
+                }},
+            ):
+                self.stdout.write(
+                    f"A gerar {options['clinicas']} clínicas x {options['meses']} meses x {options['guias']} guias..."
+                )
+                clinica = dados_sinteticos.gerar(**parametros)[0]
+                meses = dados_sinteticos.meses_a_partir(2025, options['meses'])
+                resultados = benchmark.executar(
+                    parametros, clinica, meses[0], meses[-1], options['repeticoes'], options['cenarios'],
+                )
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+        for nome, medicao in resultados['cenarios'].items():
+            self.stdout.write(
+                f"  {nome:<20} mediana {medicao['mediana_ms']:8.2f} ms  p95 {medicao['p95_ms']:8.2f} ms  "
+                f"{medicao['consultas']:3d} consultas"
+            )
+
+        if options['saida']:
+            Path(options['saida']).write_text(json.dumps(resultados, indent=2, ensure_ascii=False) + "\n")
+        baseline_path = Path(options['baseline'])
+        if options['guardar_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(resultados, indent=2, ensure_ascii=False) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline guardada em {baseline_path}."))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"Sem baseline em {baseline_path}; use --guardar-baseline."))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('parametros', {}) | {'repeticoes': None} != resultados['parametros'] | {'repeticoes': None}:
+            self.stdout.write(self.style.WARNING(
+                f"A baseline foi medida com outros parâmetros ({baseline.get('parametros')}); comparação ignorada."
+            ))
+            return
+        regressoes = benchmark.comparar(resultados, baseline, options['tolerancia'])
+        if regressoes:
+            raise CommandError("Regressões face à baseline:\n  " + "\n  ".join(regressoes))
+        self.stdout.write(self.style.SUCCESS("Sem regressões face à baseline."))
@@ -0,0 +1,48 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from reportlab import rl_config
+
+from guias_app.pdf import LinhaPDF, gerar_pdf, obter_modelo_pdf
+
+
+class Command(BaseCommand):
+    help = "Mede o tempo de geração do PDF mensal com e sem o modelo pré-construído (ModeloPDF)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=50, help="Número de PDFs gerados por cenário.")
+        parser.add_argument('--linhas', type=int, default=20, help="Número de guias por PDF.")
+
+    def handle(self, *args, **options):
+        dados = [
+            LinhaPDF(str(i), f"Paciente {i}", "Dr. Teste", "Coroa\nGancho\nRevisão", "80\n20,50\n15")
+            for i in range(options['linhas'])
+        ]
+        total = Decimal('115.50') * options['linhas']
+        documentos = options['documentos']
+
+        def medir(reconstruir_modelo, ascii85=False):
+            use_a85 = rl_config.useA85
+            rl_config.useA85 = int(ascii85)
+            try:
+                inicio = time.perf_counter()
+                for _ in range(documentos):
+                    if reconstruir_modelo:
+                        obter_modelo_pdf.cache_clear()
+                    gerar_pdf(dados, "Janeiro", "2025", "Clínica Benchmark", total)
+                return (time.perf_counter() - inicio) / documentos * 1000
+            finally:
+                rl_config.useA85 = use_a85
+
+        gerar_pdf(dados, "Janeiro", "2025", "Clínica Benchmark", total)  # warm up imports and fonts
+        # Rebuilding everything and ASCII85-encoding the logo on each render is what gerar_pdf used to do
+        anterior = medir(reconstruir_modelo=True, ascii85=True)
+        sem_modelo = medir(reconstruir_modelo=True)
+        com_modelo = medir(reconstruir_modelo=False)
+
+        self.stdout.write(f"{documentos} PDFs com {options['linhas']} guias cada:")
+        self.stdout.write(f"  comportamento anterior (tudo reconstruído, ASCII85): {anterior:.2f} ms/PDF")
+        self.stdout.write(f"  modelo reconstruído em cada PDF:                     {sem_modelo:.2f} ms/PDF")
+        self.stdout.write(f"  modelo pré-construído:                               {com_modelo:.2f} ms/PDF")
+        self.stdout.write(self.style.SUCCESS(f"  ganho: {anterior / com_modelo:.2f}x ({anterior - com_modelo:.2f} ms/PDF)"))
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from guias_app import benchmark, dados_sinteticos
+
+PERFIS = {
+    'wsgi': lambda porta, workers: [
+        sys.executable, '-m', 'gunicorn', 'guias_project.wsgi',
+        '--workers', str(workers), '--bind', f'127.0.0.1:{porta}', '--log-level', 'warning',
+    ],
+    'asgi': lambda porta, workers: [
+        sys.executable, '-m', 'uvicorn', 'guias_project.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(porta),
+        '--lifespan', 'off', '--no-access-log', '--log-level', 'warning',
+    ],
+}
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara os perfis de produção sob carga concorrente: gunicorn com workers síncronos (WSGI) "
+        "e uvicorn (ASGI, vistas assíncronas), com o mesmo número de processos e a mesma base de dados sintética."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinicas', type=int, default=10)
+        parser.add_argument('--meses', type=int, default=12)
+        parser.add_argument('--guias', type=int, default=30, help="Guias por clínica e por mês.")
+        parser.add_argument('--workers', type=int, default=2, help="Processos de cada servidor.")
+        parser.add_argument('--concorrencia', type=int, default=16, help="Pedidos em simultâneo.")
+        parser.add_argument('--pedidos', type=int, default=200, help="Pedidos por cenário.")
+        parser.add_argument('--perfil', action='append', dest='perfis', choices=list(PERFIS), help="Medir só este perfil (repetível).")
+        parser.add_argument('--saida', help="Ficheiro JSON onde escrever os resultados.")
+
+    def handle(self, *args, **options):
+        parametros = {
+            campo: options[campo]
+            for campo in ('clinicas', 'meses', 'guias', 'workers', 'concorrencia', 'pedidos')
+        }
+        pasta = Path(tempfile.mkdtemp(prefix='benchmark_servidores_'))
+        try:
+            with benchmark.base_de_dados_temporaria(pasta) as base_de_dados:
+                self.stdout.write(
+                    f"A gerar {options['clinicas']} clínicas x {options['meses']} meses x {options['guias']} guias..."
+                )
+                clinica = dados_sinteticos.gerar(options['clinicas'], options['meses'], options['guias'])[0]
+                mes, ano = dados_sinteticos.meses_a_partir(2025, options['meses'])[-1]
+                # The open month: its PDF is rendered on every request and never written to MEDIA_ROOT
+                filtros = urlencode({'clinica': clinica.pk, 'mes': mes, 'ano': ano})
+                caminhos = {
+                    'home': reverse('home'),
+                    'overview_guides': reverse('overview_guides'),
+                    'guia_create': f"{reverse('guia_create')}?{filtros}",
+                    'guia_pdf': f"{reverse('guia_pdf')}?{filtros}",
+                }
+                caminhos['misto'] = list(caminhos.values())
+                connection.close()  # the servers are the only users of the database from here on
+
+                resultados = {}
+                for perfil in options['perfis'] or list(PERFIS):
+                    self.stdout.write(f"{perfil}:")
+                    resultados[perfil] = self._medir_perfil(perfil, base_de_dados, pasta, caminhos, options)
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+        if set(resultados) == set(PERFIS):
+            self.stdout.write("asgi/wsgi (pedidos/s):")
+            for cenario in caminhos:
+                razao = resultados['asgi'][cenario]['pedidos_s'] / resultados['wsgi'][cenario]['pedidos_s']
+                self.stdout.write(f"  {cenario:<16} {razao:5.2f}x")
+        if options['saida']:
+            Path(options['saida']).write_text(json.dumps({
+                'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'ambiente': benchmark._ambiente(),
+                'parametros': parametros,
+                'perfis': resultados,
+            }, indent=2, ensure_ascii=False) + "\n")
+
+    def _medir_perfil(self, perfil, base_de_dados, pasta, caminhos, options):
+        porta = _porta_livre()
+        # The servers' per-request log lines go to a file rather than into this command's output
+        pasta_logs = pasta / f'logs_{perfil}'
+        pasta_logs.mkdir()
+        ambiente = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{base_de_dados}",
+            CACHE_DIR=str(pasta / f'cache_{perfil}'),
+            LOG_DIR=str(pasta_logs),
+            DEBUG='False',
+        )
+        servidor = subprocess.Popen(
+            PERFIS[perfil](porta, options['workers']), cwd=settings.BASE_DIR, env=ambiente,
+        )
+        try:
+            self._esperar(servidor, porta, caminhos['home'])
+            resultados = {}
+            for cenario, caminho in caminhos.items():
+                lista = caminho if isinstance(caminho, list) else [caminho]
+                benchmark.carga('127.0.0.1', porta, lista, options['concorrencia'], options['concorrencia'])  # warm-up
+                medicao = benchmark.carga('127.0.0.1', porta, lista, options['concorrencia'], options['pedidos'])
+                resultados[cenario] = medicao
+                self.stdout.write(
+                    f"  {cenario:<16} {medicao['pedidos_s']:8.1f} pedidos/s  mediana {medicao['mediana_ms']:8.2f} ms  "
+                    f"p95 {medicao['p95_ms']:8.2f} ms  {medicao['erros']} erros"
+                )
+            return resultados
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    def _esperar(self, servidor, porta, caminho, limite=30):
+        fim = time.monotonic() + limite
+        while time.monotonic() < fim:
+            if servidor.poll() is not None:
+                raise CommandError(f"O servidor terminou com o código {servidor.returncode}.")
+            if benchmark._pedido_http('127.0.0.1', porta, caminho)[1] == 200:
+                return
+            time.sleep(0.2)
+        raise CommandError(f"O servidor não respondeu em {limite} s.")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from guias_app import encerramento
+from guias_app.cache import nome_clinica
+from guias_app.exportacao import ErroExportacao, periodo_de_texto
+
+
+class Command(BaseCommand):
+    help = "Encerra, numa só transação, as guias abertas dos meses indicados (todas as clínicas ou só algumas)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('periodos', nargs='+', help="Meses a encerrar, AAAA-MM.")
+        parser.add_argument('--clinica', type=int, action='append', dest='clinicas', help="Id da clínica (repetível).")
+        parser.add_argument('--simular', action='store_true', help="Mostrar o que seria encerrado, sem alterar nada.")
+
+    def handle(self, *args, **options):
+        try:
+            periodos = [periodo_de_texto(periodo) for periodo in options['periodos']]
+        except ErroExportacao as e:
+            raise CommandError(str(e))
+
+        pares = encerramento.meses_abertos(periodos, options['clinicas'])
+        if not pares:
+            self.stdout.write("Nenhuma guia aberta nos meses indicados.")
+            return
+        if options['simular']:
+            for clinica_id, periodo in pares:
+                self.stdout.write(f"  {nome_clinica(clinica_id)}: {periodo}")
+            self.stdout.write(f"{len(pares)} mês(es) seriam encerrados.")
+            return
+
+        def progresso(feitas, total):
+            self.stdout.write(f"\r  {feitas}/{total} guias encerradas", ending="")
+            self.stdout.flush()
+
+        encerramentos = encerramento.encerrar(pares, progresso)
+        self.stdout.write("")
+        for registo in encerramentos:
+            self.stdout.write(
+                f"  {nome_clinica(registo.clinica_id)} {registo.mes}/{registo.ano}: "
+                f"{registo.quantidade} guias, {registo.total:.2f} €"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(encerramentos)} mês(es) encerrado(s)."))
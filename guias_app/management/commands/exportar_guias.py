@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from guias_app.exportacao import (
+    ESTADOS, FORMATOS, TODAS, ErroExportacao, arquivos_para_exportar, exportar, guias_para_exportar,
+    periodo_de_texto,
+)
+
+
+class Command(BaseCommand):
+    help = "Exporta guias para CSV, XLSX ou Parquet, filtradas por clínica, período e estado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('destino', help="Ficheiro a criar; o formato é deduzido da extensão.")
+        parser.add_argument('--formato', choices=list(FORMATOS), help="Formato, se diferente da extensão.")
+        parser.add_argument('--clinica', help="Id da clínica (por omissão: todas).")
+        parser.add_argument('--de', help="Primeiro período, AAAA-MM.")
+        parser.add_argument('--ate', help="Último período, AAAA-MM.")
+        parser.add_argument('--estado', choices=[valor for valor, _ in ESTADOS], default=TODAS)
+
+    def handle(self, *args, **options):
+        destino = Path(options['destino'])
+        formato = options['formato'] or destino.suffix.lstrip('.').lower()
+        try:
+            filtros = {
+                'clinica_id': options['clinica'],
+                'periodo_de': periodo_de_texto(options['de']),
+                'periodo_ate': periodo_de_texto(options['ate']),
+                'estado': options['estado'],
+            }
+            conteudo = exportar(guias_para_exportar(**filtros), formato, arquivos_para_exportar(**filtros))
+            with open(destino, 'wb') as ficheiro:
+                for bloco in conteudo:
+                    ficheiro.write(bloco)
+        except (OSError, ErroExportacao) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Guias exportadas para {destino}."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from guias_app.importacao import (
+    CONFLITOS, SALTAR, TAMANHO_LOTE, ErroImportacao, importar_guias,
+)
+
+
+class Command(BaseCommand):
+    help = "Importa guias de um ficheiro CSV ou XLSX, em lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ficheiro', help="Caminho do ficheiro .csv ou .xlsx.")
+        parser.add_argument(
+            '--conflitos', choices=[valor for valor, _ in CONFLITOS], default=SALTAR,
+            help="O que fazer com guias que já existem (por omissão: saltar).",
+        )
+        parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE, help="Guias gravadas por lote.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['ficheiro'], 'rb') as ficheiro:
+                relatorio = importar_guias(
+                    ficheiro, options['ficheiro'], options['conflitos'], options['tamanho_lote'],
+                )
+        except (OSError, ErroImportacao) as e:
+            raise CommandError(str(e))
+
+        for linha, mensagem in relatorio.erros:
+            self.stderr.write(f"Linha {linha}: {mensagem}")
+        self.stdout.write(self.style.SUCCESS(str(relatorio)))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from guias_app.legado import TAMANHO_LOTE, ErroLegado, RelatorioLegado, importar_legado
+
+
+class Command(BaseCommand):
+    help = "Migra as clínicas e guias da base de dados da aplicação Streamlit (guias.db), gravando lote a lote."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'caminho', nargs='?', default=str(settings.BASE_DIR / 'guias.db'),
+            help="Caminho do guias.db (por omissão, o da raiz do projeto).",
+        )
+        parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE, help="Guias lidas e gravadas por lote.")
+        parser.add_argument('--desde', type=int, default=0, help="Retomar depois deste id de guias.db.")
+        parser.add_argument('--simular', action='store_true', help="Mostrar o que seria importado, sem gravar nada.")
+
+    def handle(self, *args, **options):
+        relatorio = RelatorioLegado()
+        try:
+            importar_legado(
+                options['caminho'], options['tamanho_lote'], options['desde'], options['simular'], relatorio,
+            )
+        except ErroLegado as e:
+            raise CommandError(str(e))
+        except Exception:
+            if relatorio.ultimo_id is not None and not options['simular']:
+                self.stderr.write(f"Importação interrompida; retome com --desde {relatorio.ultimo_id}.")
+            raise
+
+        for id_legado, mensagem in relatorio.erros:
+            self.stderr.write(f"Guia {id_legado}: {mensagem}")
+        if relatorio.ultimo_id is not None:
+            self.stdout.write(f"Último id gravado: {relatorio.ultimo_id}")
+        prefixo = "Simulação: " if options['simular'] else ""
+        self.stdout.write(self.style.SUCCESS(prefixo + str(relatorio)))
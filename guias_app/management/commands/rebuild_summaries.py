@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from guias_app import resumos
+
+
+class Command(BaseCommand):
+    help = "Recalcula de raiz a tabela de resumos mensais (ResumoMensal) a partir das guias."
+
+    def handle(self, *args, **options):
+        linhas = resumos.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"{linhas} resumo(s) mensal(ais) recalculado(s)."))
@@ -0,0 +1,59 @@
+import logging
+from decimal import Context, Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def cabe(valor, max_digits):
+    try:
+        valor.quantize(Decimal('0.01'), context=Context(prec=max_digits))
+    except InvalidOperation:
+        return False
+    return True
+
+
+def preencher_valor_total(apps, schema_editor):
+    Guia = apps.get_model('guias_app', 'Guia')
+    guias = []
+    ignoradas = []
+    for guia in Guia.objects.only('pk', 'numero_guia', 'valor').iterator():
+        total = Decimal('0')
+        for val_str in (guia.valor or "").split("\n"):
+            try:
+                valor = Decimal(val_str.strip().replace(",", "."))
+            except InvalidOperation:
+                continue
+            # A line item holds 10 digits (see 0004); larger numbers are left out of the total
+            if valor.is_finite() and cabe(valor, 10):
+                total += valor
+            elif valor.is_finite():
+                ignoradas.append(f"  Guia {guia.numero_guia} (id {guia.pk}): {val_str.strip()!r}")
+        if not cabe(total, 12):
+            ignoradas.append(f"  Guia {guia.numero_guia} (id {guia.pk}): total {total}")
+            total = Decimal('0')
+        guia.valor_total = total
+        guias.append(guia)
+    Guia.objects.bulk_update(guias, ['valor_total'], batch_size=500)
+
+    if ignoradas:
+        logger.warning(
+            "%d valor(es) demasiado grande(s) ignorado(s) nos totais:\n%s", len(ignoradas), "\n".join(ignoradas),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0002_guia_is_closed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guia',
+            name='valor_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), editable=False, max_digits=12, verbose_name='Total (€)'),
+        ),
+        migrations.RunPython(preencher_valor_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2 on 2026-10-18 19:24
+
+import logging
+from decimal import Context, Decimal, InvalidOperation
+from itertools import zip_longest
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def converter_valor(val_str):
+    try:
+        valor = Decimal(val_str.strip().replace(",", "."))
+        # GuiaLinha.valor below holds 10 digits, 2 of them decimal places
+        valor.quantize(Decimal('0.01'), context=Context(prec=10))
+    except InvalidOperation:
+        return None
+    return valor if valor.is_finite() else None
+
+
+def criar_linhas(apps, schema_editor):
+    Guia = apps.get_model('guias_app', 'Guia')
+    GuiaLinha = apps.get_model('guias_app', 'GuiaLinha')
+    linhas = []
+    invalidas = []
+    for guia in Guia.objects.select_related('clinica').iterator():
+        pares = zip_longest((guia.trabalhos or "").split("\n"), (guia.valor or "").split("\n"), fillvalue="")
+        ordem = 0
+        for descricao, val_str in pares:
+            descricao = descricao.strip()
+            valor = converter_valor(val_str)
+            if valor is None and val_str.strip():
+                invalidas.append(f"  Guia {guia.numero_guia} ({guia.clinica.nome}, {guia.mes}/{guia.ano}): {val_str.strip()!r}")
+            if descricao or valor is not None:
+                ordem += 1
+                linhas.append(GuiaLinha(guia_id=guia.pk, ordem=ordem, descricao=descricao, valor=valor))
+        if len(linhas) >= 500:
+            GuiaLinha.objects.bulk_create(linhas)
+            linhas = []
+    GuiaLinha.objects.bulk_create(linhas)
+
+    # Reported once, on stderr through logging, so that migrate --verbosity 0 stays quiet on stdout
+    if invalidas:
+        logger.warning(
+            "%d valor(es) não numérico(s) ou demasiado grande(s) ignorado(s) nos totais:\n%s",
+            len(invalidas), "\n".join(invalidas),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0003_guia_valor_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuiaLinha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveSmallIntegerField(verbose_name='Ordem')),
+                ('descricao', models.TextField(blank=True, verbose_name='Tipo de Trabalho')),
+                ('valor', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Valor (€)')),
+                ('guia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='linhas', to='guias_app.guia', verbose_name='Guia')),
+            ],
+            options={
+                'verbose_name': 'Linha da Guia',
+                'verbose_name_plural': 'Linhas da Guia',
+                'ordering': ['guia', 'ordem'],
+                'unique_together': {('guia', 'ordem')},
+            },
+        ),
+        migrations.RunPython(criar_linhas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 19:25
+
+import unicodedata
+
+from django.db import migrations, models
+
+MESES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro',
+]
+
+
+def normalizar_mes(mes):
+    return unicodedata.normalize('NFKD', mes.strip()).encode('ascii', 'ignore').decode().casefold()
+
+
+def preencher_periodo(apps, schema_editor):
+    Guia = apps.get_model('guias_app', 'Guia')
+    numero_do_mes = {normalizar_mes(nome): numero for numero, nome in enumerate(MESES, start=1)}
+    guias = []
+    for guia in Guia.objects.only('pk', 'mes', 'ano').iterator():
+        numero_mes = numero_do_mes.get(normalizar_mes(guia.mes or ""))
+        ano = (guia.ano or "").strip()
+        if numero_mes is None or len(ano) != 4 or not ano.isdigit():
+            continue
+        guia.periodo = int(ano) * 100 + numero_mes
+        guias.append(guia)
+    Guia.objects.bulk_update(guias, ['periodo'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0004_guialinha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guia',
+            name='periodo',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Período'),
+        ),
+        migrations.RunPython(preencher_periodo, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='guia',
+            index=models.Index(fields=['clinica', 'periodo', 'is_closed'], name='guia_clinica_periodo_idx'),
+        ),
+    ]
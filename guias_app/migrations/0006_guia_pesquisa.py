@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 21:40
+
+from django.db import migrations
+
+CAMPOS = ['numero_guia', 'nome_paciente', 'medico', 'trabalhos']
+
+VETOR_POSTGRES = (
+    "to_tsvector('portuguese'::regconfig, "
+    + " || ' ' || ".join(f'COALESCE("guias_app_guia"."{campo}", \'\')' for campo in CAMPOS)
+    + ")"
+)
+
+
+def criar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE guias_app_guia_fts USING fts5({', '.join(CAMPOS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO guias_app_guia_fts (rowid, {', '.join(CAMPOS)}) "
+            f"SELECT id, {', '.join(f"COALESCE({campo}, '')" for campo in CAMPOS)} FROM guias_app_guia"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"CREATE INDEX guia_pesquisa_idx ON guias_app_guia USING GIN ({VETOR_POSTGRES})")
+
+
+def apagar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS guias_app_guia_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS guia_pesquisa_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0005_guia_periodo'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, apagar_indice),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2 on 2026-10-18 19:41
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def preencher_resumos(apps, schema_editor):
+    Guia = apps.get_model('guias_app', 'Guia')
+    ResumoMensal = apps.get_model('guias_app', 'ResumoMensal')
+    linhas = (
+        Guia.objects.filter(periodo__isnull=False)
+        .order_by()
+        .values('clinica_id', 'periodo')
+        .annotate(
+            quantidade=Count('pk'),
+            total=Sum('valor_total'),
+            quantidade_encerradas=Count('pk', filter=Q(is_closed=True)),
+            total_encerradas=Sum('valor_total', filter=Q(is_closed=True)),
+            mes=Max('mes'),
+            ano=Max('ano'),
+        )
+    )
+    ResumoMensal.objects.bulk_create(
+        [
+            ResumoMensal(
+                clinica_id=linha['clinica_id'],
+                periodo=linha['periodo'],
+                mes=linha['mes'],
+                ano=linha['ano'],
+                quantidade=linha['quantidade'],
+                total=linha['total'] or Decimal('0'),
+                quantidade_encerradas=linha['quantidade_encerradas'],
+                total_encerradas=linha['total_encerradas'] or Decimal('0'),
+                encerrado=linha['quantidade_encerradas'] == linha['quantidade'],
+            )
+            for linha in linhas
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0006_guia_pesquisa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.PositiveIntegerField(verbose_name='Período')),
+                ('mes', models.CharField(max_length=50, verbose_name='Mês')),
+                ('ano', models.CharField(max_length=4, verbose_name='Ano')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Guias')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14, verbose_name='Total (€)')),
+                ('quantidade_encerradas', models.PositiveIntegerField(default=0, verbose_name='Guias encerradas')),
+                ('total_encerradas', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14, verbose_name='Total encerrado (€)')),
+                ('encerrado', models.BooleanField(default=False, verbose_name='Mês encerrado')),
+                ('clinica', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='guias_app.clinica', verbose_name='Clínica')),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal',
+                'verbose_name_plural': 'Resumos Mensais',
+                'unique_together': {('clinica', 'periodo')},
+            },
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
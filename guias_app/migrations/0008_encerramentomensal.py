@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 19:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0007_resumomensal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncerramentoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.PositiveIntegerField(verbose_name='Período')),
+                ('mes', models.CharField(max_length=50, verbose_name='Mês')),
+                ('ano', models.CharField(max_length=4, verbose_name='Ano')),
+                ('quantidade', models.PositiveIntegerField(verbose_name='Guias encerradas')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Total (€)')),
+                ('encerrado_em', models.DateTimeField(auto_now_add=True, verbose_name='Encerrado em')),
+                ('clinica', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='encerramentos', to='guias_app.clinica', verbose_name='Clínica')),
+            ],
+            options={
+                'verbose_name': 'Encerramento Mensal',
+                'verbose_name_plural': 'Encerramentos Mensais',
+                'ordering': ['-encerrado_em'],
+                'indexes': [models.Index(fields=['clinica', 'periodo'], name='encerramento_clinica_periodo')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 20:00
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0008_encerramentomensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumomensal',
+            name='quantidade_arquivadas',
+            field=models.PositiveIntegerField(default=0, verbose_name='Guias arquivadas'),
+        ),
+        migrations.AddField(
+            model_name='resumomensal',
+            name='total_arquivado',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14, verbose_name='Total arquivado (€)'),
+        ),
+        migrations.CreateModel(
+            name='ArquivoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.PositiveIntegerField(verbose_name='Período')),
+                ('mes', models.CharField(max_length=50, verbose_name='Mês')),
+                ('ano', models.CharField(max_length=4, verbose_name='Ano')),
+                ('quantidade', models.PositiveIntegerField(verbose_name='Guias')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Total (€)')),
+                ('dados', models.BinaryField(verbose_name='Guias (Parquet)')),
+                ('arquivado_em', models.DateTimeField(auto_now=True, verbose_name='Arquivado em')),
+                ('clinica', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arquivos', to='guias_app.clinica', verbose_name='Clínica')),
+            ],
+            options={
+                'verbose_name': 'Arquivo Mensal',
+                'verbose_name_plural': 'Arquivos Mensais',
+                'unique_together': {('clinica', 'periodo')},
+            },
+        ),
+    ]
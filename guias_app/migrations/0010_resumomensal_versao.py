@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 21:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0009_arquivomensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumomensal',
+            name='atualizado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='resumomensal',
+            name='versao',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versão'),
+        ),
+    ]
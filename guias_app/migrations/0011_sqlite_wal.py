@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def ativar_wal(apps, schema_editor):
+    # journal_mode=WAL is stored in the database file, so it is set once here rather than by
+    # an init_command on every connection. It cannot be changed inside a transaction, hence
+    # atomic = False below
+    conexao = schema_editor.connection
+    if conexao.vendor != 'sqlite' or conexao.is_in_memory_db():
+        return
+    with conexao.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('guias_app', '0010_resumomensal_versao'),
+    ]
+
+    operations = [
+        migrations.RunPython(ativar_wal, migrations.RunPython.noop, elidable=True),
+    ]
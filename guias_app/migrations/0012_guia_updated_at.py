@@ -0,0 +1,29 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+
+
+def preencher_updated_at(apps, schema_editor):
+    # The guides' own history is unknown; the last change to their month is the closest bound
+    Guia = apps.get_model('guias_app', 'Guia')
+    ResumoMensal = apps.get_model('guias_app', 'ResumoMensal')
+    resumo = ResumoMensal.objects.filter(clinica_id=OuterRef('clinica_id'), periodo=OuterRef('periodo'))
+    Guia.objects.filter(Exists(resumo)).update(updated_at=Subquery(resumo.values('atualizado_em')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guias_app', '0011_sqlite_wal'),
+    ]
+
+    operations = [
+        # Existing guides get the time of the migration, then their month's atualizado_em when it has one
+        migrations.AddField(
+            model_name='guia',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Atualizada em'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_updated_at, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,64 @@
-from django.db import models
+from decimal import Context, Decimal, InvalidOperation
+from itertools import zip_longest
+import unicodedata
+
+from django.db import models, transaction
+from django.utils import timezone
+
+
+MESES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro',
+]
+
+def _normalizar_mes(mes):
+    sem_acentos = unicodedata.normalize('NFKD', mes.strip()).encode('ascii', 'ignore').decode()
+    return sem_acentos.casefold()
+
+_NUMERO_DO_MES = {_normalizar_mes(nome): numero for numero, nome in enumerate(MESES, start=1)}
+
+def calcular_periodo(mes, ano):
+    """Return the yyyymm integer for a Portuguese month name and year, or None if either is invalid."""
+    numero_mes = _NUMERO_DO_MES.get(_normalizar_mes(mes or ""))
+    ano = str(ano or "").strip()
+    if numero_mes is None or len(ano) != 4 or not ano.isdigit():
+        return None
+    return int(ano) * 100 + numero_mes
+
+def cabe_no_campo(valor, campo):
+    """Whether the DecimalField `campo` can store `valor`; saving one that does not fit raises InvalidOperation."""
+    try:
+        valor.quantize(Decimal(1).scaleb(-campo.decimal_places), context=Context(prec=campo.max_digits))
+    except InvalidOperation:
+        return False
+    return True
+
+def converter_valor(val_str):
+    """Parse one line of `valor` ("12,50" or "12.50"); returns None when it is not a number GuiaLinha.valor can hold."""
+    val_str = val_str.strip().replace(",", ".")
+    try:
+        valor = Decimal(val_str)
+    except InvalidOperation:
+        return None
+    if not valor.is_finite() or not cabe_no_campo(valor, GuiaLinha._meta.get_field('valor')):
+        return None
+    return valor
+
+def analisar_linhas(trabalhos, valores):
+    """Pair the lines of `trabalhos` and `valor` into (descricao, valor) line items.
+
+    Returns the line items and the non-empty `valor` lines that could not be parsed.
+    """
+    linhas = []
+    invalidas = []
+    for descricao, val_str in zip_longest((trabalhos or "").split("\n"), (valores or "").split("\n"), fillvalue=""):
+        descricao = descricao.strip()
+        valor = converter_valor(val_str)
+        if valor is None and val_str.strip():
+            invalidas.append(val_str.strip())
+        if descricao or valor is not None:
+            linhas.append((descricao, valor))
+    return linhas, invalidas
 
 class Clinica(models.Model):
     nome = models.CharField(max_length=255, unique=True, verbose_name="Nome da Clínica")
@@ -10,6 +70,29 @@ class Clinica(models.Model):
     def __str__(self):
         return self.nome
 
+class GuiaQuerySet(models.QuerySet):
+    def do_periodo(self, periodo, clinica_id=None):
+        """Guides of one calendar month (yyyymm), optionally restricted to one clinic."""
+        guias = self.filter(periodo=periodo)
+        if clinica_id is not None:
+            guias = guias.filter(clinica_id=clinica_id)
+        return guias
+
+    def filtrar(self, clinica_id=None, mes=None, ano=None):
+        """Apply the clinic/month/year filters used by the views, as a `periodo` seek when possible."""
+        guias = self
+        if clinica_id:
+            guias = guias.filter(clinica_id=clinica_id)
+        periodo = calcular_periodo(mes, ano) if mes and ano else None
+        if periodo is not None:
+            guias = guias.filter(periodo=periodo)
+        else:
+            if mes:
+                guias = guias.filter(mes__iexact=mes)
+            if ano:
+                guias = guias.filter(ano=ano)
+        return guias.order_by('periodo', 'pk')
+
 class Guia(models.Model):
     clinica = models.ForeignKey(Clinica, on_delete=models.CASCADE, verbose_name="Clínica")
     numero_guia = models.CharField(max_length=255, verbose_name="Número da Guia")
@@ -20,11 +103,120 @@ class Guia(models.Model):
     mes = models.CharField(max_length=50, verbose_name="Mês")
     ano = models.CharField(max_length=4, verbose_name="Ano")
     is_closed = models.BooleanField(default=False, verbose_name="Encerrada")
+    # Calendar period as yyyymm, derived from `mes`/`ano` on save (None if they are not a valid month/year)
+    periodo = models.PositiveIntegerField(blank=True, null=True, editable=False, verbose_name="Período")
+    # Cached sum of the line items (see GuiaLinha), kept in sync on save so totals can be summed in SQL
+    valor_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'), editable=False, verbose_name="Total (€)")
+    # Set on save; the bulk paths (bulk_update/update) set it explicitly
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Atualizada em")
 
     class Meta:
         verbose_name = "Guia"
         verbose_name_plural = "Guias"
         unique_together = ('numero_guia', 'clinica', 'mes', 'ano') # Prevent duplicate entries for the same guide in the same clinic/month/year
+        indexes = [
+            models.Index(fields=['clinica', 'periodo', 'is_closed'], name='guia_clinica_periodo_idx'),
+        ]
+
+    objects = GuiaQuerySet.as_manager()
+
+    def construir_linhas(self):
+        """Build the (unsaved) line items for the current `trabalhos`/`valor` and refresh `valor_total`."""
+        linhas, _ = analisar_linhas(self.trabalhos, self.valor)
+        self.valor_total = sum((valor for _, valor in linhas if valor is not None), Decimal('0'))
+        return [
+            GuiaLinha(guia=self, ordem=ordem, descricao=descricao, valor=valor)
+            for ordem, (descricao, valor) in enumerate(linhas, start=1)
+        ]
+
+    def save(self, *args, **kwargs):
+        self.periodo = calcular_periodo(self.mes, self.ano)
+        linhas = self.construir_linhas()
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            self.linhas.all().delete()
+            GuiaLinha.objects.bulk_create(linhas)
+
+    def __str__(self):
+        return f"Guia {self.numero_guia} - {self.nome_paciente} ({self.clinica.nome})"
+
+class GuiaLinha(models.Model):
+    guia = models.ForeignKey(Guia, on_delete=models.CASCADE, related_name='linhas', verbose_name="Guia")
+    ordem = models.PositiveSmallIntegerField(verbose_name="Ordem")
+    descricao = models.TextField(blank=True, verbose_name="Tipo de Trabalho")
+    valor = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Valor (€)")
+
+    class Meta:
+        verbose_name = "Linha da Guia"
+        verbose_name_plural = "Linhas da Guia"
+        ordering = ['guia', 'ordem']
+        unique_together = ('guia', 'ordem')
+
+    def __str__(self):
+        return f"{self.descricao} ({self.valor} €)"
+
+class ResumoMensal(models.Model):
+    """Number and value of one clinic's guides in one month, kept up to date by guias_app.resumos."""
+    clinica = models.ForeignKey(Clinica, on_delete=models.CASCADE, related_name='resumos', verbose_name="Clínica")
+    periodo = models.PositiveIntegerField(verbose_name="Período")
+    mes = models.CharField(max_length=50, verbose_name="Mês")
+    ano = models.CharField(max_length=4, verbose_name="Ano")
+    quantidade = models.PositiveIntegerField(default=0, verbose_name="Guias")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'), verbose_name="Total (€)")
+    quantidade_encerradas = models.PositiveIntegerField(default=0, verbose_name="Guias encerradas")
+    total_encerradas = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'), verbose_name="Total encerrado (€)")
+    encerrado = models.BooleanField(default=False, verbose_name="Mês encerrado")
+    # Guides moved to ArquivoMensal; set by guias_app.arquivo and left alone by guias_app.resumos
+    quantidade_arquivadas = models.PositiveIntegerField(default=0, verbose_name="Guias arquivadas")
+    total_arquivado = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0'), verbose_name="Total arquivado (€)")
+    # Bumped by guias_app.resumos on every change to the month; the ETag/Last-Modified of its views (see guias_app.condicional)
+    versao = models.PositiveIntegerField(default=0, verbose_name="Versão")
+    atualizado_em = models.DateTimeField(default=timezone.now, verbose_name="Atualizado em")
+
+    class Meta:
+        verbose_name = "Resumo Mensal"
+        verbose_name_plural = "Resumos Mensais"
+        unique_together = ('clinica', 'periodo')
+
+    def __str__(self):
+        return f"{self.clinica.nome} - {self.mes}/{self.ano} ({self.quantidade} guias, {self.total} €)"
+
+class EncerramentoMensal(models.Model):
+    """The guides frozen by one month close, as counted when they were closed (see guias_app.encerramento)."""
+    clinica = models.ForeignKey(Clinica, on_delete=models.CASCADE, related_name='encerramentos', verbose_name="Clínica")
+    periodo = models.PositiveIntegerField(verbose_name="Período")
+    mes = models.CharField(max_length=50, verbose_name="Mês")
+    ano = models.CharField(max_length=4, verbose_name="Ano")
+    quantidade = models.PositiveIntegerField(verbose_name="Guias encerradas")
+    total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Total (€)")
+    encerrado_em = models.DateTimeField(auto_now_add=True, verbose_name="Encerrado em")
+
+    class Meta:
+        verbose_name = "Encerramento Mensal"
+        verbose_name_plural = "Encerramentos Mensais"
+        ordering = ['-encerrado_em']
+        indexes = [
+            models.Index(fields=['clinica', 'periodo'], name='encerramento_clinica_periodo'),
+        ]
+
+    def __str__(self):
+        return f"{self.clinica.nome} - {self.mes}/{self.ano} ({self.quantidade} guias, {self.total} €)"
+
+class ArquivoMensal(models.Model):
+    """The closed guides of one clinic and month, moved out of Guia as a zstd Parquet file (see guias_app.arquivo)."""
+    clinica = models.ForeignKey(Clinica, on_delete=models.CASCADE, related_name='arquivos', verbose_name="Clínica")
+    periodo = models.PositiveIntegerField(verbose_name="Período")
+    mes = models.CharField(max_length=50, verbose_name="Mês")
+    ano = models.CharField(max_length=4, verbose_name="Ano")
+    quantidade = models.PositiveIntegerField(verbose_name="Guias")
+    total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Total (€)")
+    dados = models.BinaryField(verbose_name="Guias (Parquet)")
+    arquivado_em = models.DateTimeField(auto_now=True, verbose_name="Arquivado em")
+
+    class Meta:
+        verbose_name = "Arquivo Mensal"
+        verbose_name_plural = "Arquivos Mensais"
+        unique_together = ('clinica', 'periodo')
 
     def __str__(self):
-        return f"Guia {self.numero_guia} - {self.nome_paciente} ({self.clinica.nome})"
\ No newline at end of file
+        return f"{self.clinica.nome} - {self.mes}/{self.ano} ({self.quantidade} guias, {self.total} €)"
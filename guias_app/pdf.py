@@ -0,0 +1,202 @@
+import copy
+import functools
+from collections import namedtuple
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.contrib.staticfiles.finders import find
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import (
+    SimpleDocTemplate, Table, TableStyle,
+    Paragraph, Spacer, Flowable
+)
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+from reportlab import rl_config
+
+from .desempenho import medir_fase, medir_fases
+
+# Embed image data as binary streams: the pure-Python ASCII85 encoder otherwise spends most
+# of every render re-encoding the logo
+rl_config.useA85 = 0
+
+# Plain, picklable row passed to gerar_pdf, so a render can run in another process
+LinhaPDF = namedtuple('LinhaPDF', ['numero_guia', 'nome_paciente', 'medico', 'trabalhos', 'valor'])
+
+def linhas_pdf(guias):
+    return [
+        LinhaPDF(*(campo or "" for campo in row))
+        for row in guias.values_list(*LinhaPDF._fields)
+    ]
+
+async def alinhas_pdf(guias):
+    return [
+        LinhaPDF(*(campo or "" for campo in row))
+        async for row in guias.values_list(*LinhaPDF._fields)
+    ]
+
+INFO_TECNICA = (
+    "Técnica de Prótese Dentária<br/>"
+    "Vânia Sofia Martins Tomé<br/>"
+    "Urb. Aldeia das Amendoeiras Lote 57<br/>"
+    "8200-004 Albufeira<br/>"
+    "Cont. 223 229 067<br/>"
+    "NIB: 0035 0018 0000 15000000 33"
+)
+
+class Logo(Flowable):
+    """Draws an already decoded image, so the logo file is read and decoded once per process."""
+
+    def __init__(self, imagem, largura, altura):
+        super().__init__()
+        self.imagem = imagem
+        self.largura = largura
+        self.altura = altura
+
+    def wrap(self, availWidth, availHeight):
+        return self.largura, self.altura
+
+    def draw(self):
+        self.canv.drawImage(self.imagem, 0, 0, self.largura, self.altura, mask='auto')
+
+# Everything in the monthly PDF that does not depend on the data. Built once per process by
+# obter_modelo_pdf() and never modified afterwards; each render only lays out the data table.
+ModeloPDF = namedtuple('ModeloPDF', [
+    'estilo_normal', 'estilo_direita', 'estilo_titulo',
+    'logo', 'largura_logo', 'estilo_cabecalho',
+    'info_tecnica', 'estilo_tabela',
+])
+
+@functools.cache
+def obter_modelo_pdf():
+    folha = getSampleStyleSheet()
+    estilo_normal = ParagraphStyle("normal", parent=folha["Normal"], leading=14)
+    estilo_direita = ParagraphStyle(
+        "right",
+        parent=estilo_normal,
+        alignment=2,
+        fontSize=10,
+        leading=12
+    )
+    estilo_titulo = ParagraphStyle(
+        "titulo",
+        parent=folha["Title"],
+        alignment=1,
+        fontSize=18,
+        leading=22,
+        spaceAfter=18
+    )
+
+    # Logo reduzido a 75%
+    logo = None
+    logo_path = find('guias_app/logo.png')
+    if logo_path:
+        try:
+            imagem = ImageReader(logo_path)
+            largura_original, altura_original = imagem.getSize()
+            imagem.getRGBData()  # decode now rather than on the first render
+            largura_logo = largura_original * 0.75
+            logo = Logo(imagem, largura_logo, altura_original * 0.75)
+        except Exception:
+            logo = None
+    if logo is None:
+        largura_logo = 150
+        logo = Paragraph("Logótipo não encontrado", estilo_normal)
+
+    estilo_cabecalho = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+        ('BOTTOMPADDING', (0, 0), (0, 0), 10),
+        ('TOPPADDING', (1, 0), (1, 0), 0),
+    ])
+    estilo_tabela = TableStyle([
+        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('LEFTPADDING', (0, 0), (-1, -1), 5),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+        ('LINEBELOW', (0, -2), (-1, -2), 1, colors.black),
+        ('FONTSIZE', (-2, -1), (-1, -1), 10),
+    ])
+
+    return ModeloPDF(
+        estilo_normal=estilo_normal,
+        estilo_direita=estilo_direita,
+        estilo_titulo=estilo_titulo,
+        logo=logo,
+        largura_logo=largura_logo,
+        estilo_cabecalho=estilo_cabecalho,
+        info_tecnica=Paragraph(INFO_TECNICA, estilo_normal),
+        estilo_tabela=estilo_tabela,
+    )
+
+def _multilinha(texto, estilo):
+    return Paragraph(escape(texto).replace("\n", "<br/>"), estilo)
+
+# Funções auxiliares para PDF
+def gerar_pdf(dados, mes, ano, clinica_nome, total):
+    with medir_fases('gerar_pdf'):
+        with medir_fase('pdf_estilos'):
+            modelo = obter_modelo_pdf()
+        with medir_fase('pdf_tabela'):
+            buffer, doc, elementos = _elementos_pdf(modelo, dados, mes, ano, clinica_nome, total)
+        with medir_fase('pdf_build'):
+            doc.build(elementos)
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+def _elementos_pdf(modelo, dados, mes, ano, clinica_nome, total):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
+    elementos = []
+
+    # Cabeçalho: logo + clínica alinhados à direita. The logo is copied like info_tecnica
+    # below: drawing sets attributes on the flowable, and renders may run in parallel threads
+    logo_and_clinica = [
+        [copy.copy(modelo.logo)],
+        [Paragraph(f"<b>{escape(clinica_nome)}</b>", modelo.estilo_direita)]
+    ]
+    tabela_logo = Table(logo_and_clinica, colWidths=[modelo.largura_logo], hAlign="RIGHT")
+    tabela_logo.setStyle(modelo.estilo_cabecalho)
+    elementos.append(tabela_logo)
+    elementos.append(Spacer(1, 20))
+
+    # Título
+    elementos.append(Paragraph(f"TRABALHOS REALIZADOS NO MÊS DE {escape(mes.upper())} - {escape(ano)}", modelo.estilo_titulo))
+    elementos.append(Spacer(1, 12))
+
+    # Destinatário
+    elementos.append(Paragraph(f"Exmo. Sr.<br/>{escape(clinica_nome)}", modelo.estilo_normal))
+    elementos.append(Spacer(1, 20))
+
+    # Informação técnica fixa (already parsed; a shallow copy keeps layout state out of the shared one)
+    elementos.append(copy.copy(modelo.info_tecnica))
+    elementos.append(Spacer(1, 25))
+
+    # Tabela de dados
+    dados_tabela = [["Número da Guia", "Nome do Paciente", "Médico", "Tipo de Trabalho", "Valor (€)"]]
+    for row in dados:
+        dados_tabela.append([
+            row.numero_guia,
+            row.nome_paciente,
+            row.medico,
+            _multilinha(row.trabalhos, modelo.estilo_normal),
+            _multilinha(row.valor, modelo.estilo_normal)
+        ])
+    # Total row (bold comes from the table style)
+    dados_tabela.append(["", "", "", "Total:", f"{total:.2f} €"])
+
+    tabela = Table(dados_tabela, colWidths=[70, 110, 90, 180, 60], hAlign='LEFT')
+    tabela.setStyle(modelo.estilo_tabela)
+    elementos.append(tabela)
+    return buffer, doc, elementos
@@ -0,0 +1,82 @@
+"""On-disk cache for the PDFs of closed months.
+
+A closed month can no longer change, so its PDF is rendered once and stored under
+``MEDIA_ROOT/pdf_cache/<clinica_id>/<periodo>-<versao>-<textos>.pdf``. The name is derived
+from what the PDF is rendered from, so it is known before rendering: the month's
+ResumoMensal.versao, bumped by every change to its guides, and a hash of the texts printed
+around them (clinic name, month and year). An entry is removed by the ``Guia`` signal
+handlers when a guide of that month is deleted, reopened or edited, and by the ``Clinica``
+ones when the clinic is renamed or deleted.
+
+A render can be overtaken by such a change, even more so when it waits in the PDF job
+queue. So the caller reads the month's version (versao()) before reading its data, and
+guardar() checks it again after writing the file: a change committed before that check is
+seen there, and one committed after it removes the file through the signal handlers'
+on_commit invalidation.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import ResumoMensal
+
+
+def _pasta(clinica_id):
+    return Path(settings.MEDIA_ROOT) / 'pdf_cache' / str(int(clinica_id))
+
+def chave(clinica_id, periodo, versao_lida, clinica_nome, mes, ano):
+    """The cache key of a month's PDF, from its version (see versao()); None without one."""
+    if versao_lida is None:
+        return None
+    textos = hashlib.sha256("\0".join([clinica_nome, mes, ano]).encode()).hexdigest()[:16]
+    return int(clinica_id), int(periodo), versao_lida, textos
+
+def _caminho(chave):
+    clinica_id, periodo, versao_lida, textos = chave
+    return _pasta(clinica_id) / f"{periodo}-{versao_lida}-{textos}.pdf"
+
+def obter(chave):
+    """Return the path of the cached PDF for this key, or None."""
+    caminho = _caminho(chave)
+    return caminho if caminho.exists() else None
+
+def versao(clinica_id, periodo):
+    """The month's current version (ResumoMensal.versao), or None if it has no summary row."""
+    return (
+        ResumoMensal.objects.filter(clinica_id=clinica_id, periodo=periodo)
+        .values_list('versao', flat=True)
+        .first()
+    )
+
+def versoes_do_mes(periodo):
+    """{clinica_id: versao} of every clinic with a summary row for the month."""
+    return dict(ResumoMensal.objects.filter(periodo=periodo).values_list('clinica_id', 'versao'))
+
+def guardar(chave, pdf_bytes):
+    """Store the PDF rendered from data read after the version in `chave`; returns its path, or None if the month changed."""
+    clinica_id, periodo, versao_lida, _ = chave
+    destino = _caminho(chave)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so concurrent readers never see a partial PDF
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as ficheiro:
+        ficheiro.write(pdf_bytes)
+    os.replace(temporario, destino)
+    if versao(clinica_id, periodo) != versao_lida:
+        destino.unlink(missing_ok=True)
+        return None
+    return destino
+
+def invalidar(clinica_id, periodo):
+    if clinica_id is None or periodo is None:
+        return
+    for caminho in _pasta(clinica_id).glob(f"{int(periodo)}-*.pdf"):
+        caminho.unlink(missing_ok=True)
+
+def invalidar_clinica(clinica_id):
+    """Remove every cached PDF of a clinic (its name is printed in all of them)."""
+    shutil.rmtree(_pasta(clinica_id), ignore_errors=True)
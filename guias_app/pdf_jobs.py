@@ -0,0 +1,137 @@
+"""Background PDF rendering on a local process pool.
+
+A job is identified by a UUID and lives entirely on disk under ``MEDIA_ROOT/pdf_jobs``:
+``<job>.pendente`` while it runs, then ``<job>.pdf`` or ``<job>.erro``. Keeping the state in
+files (rather than in the pool's futures) lets any gunicorn worker answer the status and
+download requests, without Redis or any other broker.
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import django
+from django.conf import settings
+
+from . import pdf_cache
+from .pdf import gerar_pdf
+
+PENDENTE = 'pendente'
+PRONTO = 'pronto'
+ERRO = 'erro'
+
+_executor = None
+
+
+def _pasta():
+    return Path(settings.MEDIA_ROOT) / 'pdf_jobs'
+
+def obter_executor():
+    """Return the process pool shared by this (gunicorn) worker, creating it on first use."""
+    global _executor
+    if _executor is None:
+        # Not "fork": a forked process would inherit this worker's open database connection
+        # and query through the same handle as its parent (pdf_cache.guardar does). A spawned
+        # process starts clean and sets Django up from DJANGO_SETTINGS_MODULE, which it inherits;
+        # the initializer is django.setup itself, as unpickling a function of this module would
+        # import the models before the app registry is ready
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+def _escrever(destino, conteudo):
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as ficheiro:
+        ficheiro.write(conteudo)
+    os.replace(temporario, destino)
+
+def _executar(job_id, argumentos, cache_key):
+    pasta = _pasta()
+    try:
+        pdf_bytes = gerar_pdf(*argumentos)
+    except Exception:
+        _escrever(pasta / f"{job_id}.erro", traceback.format_exc().encode())
+        raise
+    else:
+        _escrever(pasta / f"{job_id}.pdf", pdf_bytes)
+        if cache_key:
+            pdf_cache.guardar(cache_key, pdf_bytes)
+    finally:
+        (pasta / f"{job_id}.{PENDENTE}").unlink(missing_ok=True)
+
+def _limpar_antigos():
+    limite = time.time() - settings.PDF_JOB_RETENTION
+    for caminho in _pasta().iterdir():
+        try:
+            if caminho.stat().st_mtime < limite:
+                caminho.unlink()
+        except FileNotFoundError:
+            pass
+
+def submeter(dados, mes, ano, clinica_nome, total, cache_key=None):
+    """Queue a gerar_pdf render and return its job id.
+
+    `dados` must be picklable (see pdf.linhas_pdf). With PDF_WORKERS = 0 the PDF is rendered
+    synchronously, which is what the tests and single-process setups use.
+    """
+    pasta = _pasta()
+    pasta.mkdir(parents=True, exist_ok=True)
+    _limpar_antigos()
+
+    job_id = str(uuid.uuid4())
+    (pasta / f"{job_id}.{PENDENTE}").touch()
+    argumentos = (list(dados), mes, ano, clinica_nome, total)
+    if settings.PDF_WORKERS:
+        obter_executor().submit(_executar, job_id, argumentos, cache_key)
+    else:
+        try:
+            _executar(job_id, argumentos, cache_key)
+        except Exception:
+            pass
+    return job_id
+
+def estado(job_id):
+    """Return PENDENTE, PRONTO or ERRO for a job, or None if it is unknown."""
+    pasta = _pasta()
+    if (pasta / f"{job_id}.pdf").exists():
+        return PRONTO
+    if (pasta / f"{job_id}.erro").exists():
+        return ERRO
+    marcador = pasta / f"{job_id}.{PENDENTE}"
+    try:
+        iniciado = marcador.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    # The process running it died (e.g. the gunicorn worker was restarted)
+    if time.time() - iniciado > settings.PDF_JOB_TIMEOUT:
+        return ERRO
+    return PENDENTE
+
+def caminho_pdf(job_id):
+    return _pasta() / f"{job_id}.pdf"
+
+def renderizar_varios(pedidos):
+    """Render several PDFs in parallel on the pool, yielding (chave, pdf_bytes) as each one finishes.
+
+    `pedidos` maps an arbitrary key to the gerar_pdf arguments.
+    """
+    if not settings.PDF_WORKERS:
+        for chave, argumentos in pedidos.items():
+            yield chave, gerar_pdf(*argumentos)
+        return
+
+    executor = obter_executor()
+    futuros = {executor.submit(gerar_pdf, *argumentos): chave for chave, argumentos in pedidos.items()}
+    try:
+        for futuro in as_completed(futuros):
+            yield futuros[futuro], futuro.result()
+    finally:
+        # The client went away: do not keep rendering PDFs nobody will receive
+        for futuro in futuros:
+            futuro.cancel()
@@ -0,0 +1,138 @@
+"""Full-text search over the guides' patient, doctor, work and number fields.
+
+On SQLite the text is indexed in an FTS5 table (created by migration 0006) whose rowid is
+the guide id; the Guia signal handlers and the bulk import keep it in sync through
+indexar()/remover(). On PostgreSQL the search uses a tsvector over the same columns,
+backed by a GIN expression index, so there is nothing to keep in sync.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Guia
+
+TABELA_FTS = 'guias_app_guia_fts'
+CAMPOS = ['numero_guia', 'nome_paciente', 'medico', 'trabalhos']
+# bm25 weight of each column, in CAMPOS order: the guide number, then the patient, count most
+PESOS = [10.0, 5.0, 2.0, 1.0]
+LIMITE = 50
+
+# Same expression as the GIN index in migration 0006; PostgreSQL only uses the index when they match
+VETOR_POSTGRES = (
+    "to_tsvector('portuguese'::regconfig, "
+    + " || ' ' || ".join(f'COALESCE("guias_app_guia"."{campo}", \'\')' for campo in CAMPOS)
+    + ")"
+)
+
+# Control characters cannot appear in the indexed text, so they can mark the matches
+# before the text is HTML-escaped and the markers turned into <mark> tags
+_INICIO, _FIM = '\x02', '\x03'
+
+ResultadoPesquisa = namedtuple('ResultadoPesquisa', ['guia', 'relevancia', 'destaques'])
+
+
+def _destacar(texto):
+    return mark_safe(
+        escape(texto or "").replace(_INICIO, '<mark>').replace(_FIM, '</mark>').replace('\n', '<br>')
+    )
+
+def _termos(texto):
+    return re.findall(r'\w+', texto or "")
+
+def indexar(guias):
+    """(Re)index these saved guides in the FTS5 table."""
+    if connection.vendor != 'sqlite':
+        return
+    guias = [guia for guia in guias if guia.pk is not None]
+    if not guias:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [(guia.pk,) for guia in guias])
+        cursor.executemany(
+            f"INSERT INTO {TABELA_FTS} (rowid, {', '.join(CAMPOS)}) VALUES (%s, %s, %s, %s, %s)",
+            [(guia.pk, *(getattr(guia, campo) or "" for campo in CAMPOS)) for guia in guias],
+        )
+
+def remover(pks):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABELA_FTS} WHERE rowid = %s", [(pk,) for pk in pks])
+
+def _pesquisar_sqlite(termos, limite):
+    # Each word is quoted (FTS5 syntax in the user's text is not interpreted) and matched as
+    # a prefix, so "coro" finds "Coroa"; diacritics are ignored by the tokenizer
+    consulta = " ".join(f'"{termo}"*' for termo in termos)
+    destaques = ", ".join(
+        f"highlight({TABELA_FTS}, {coluna}, %s, %s)" for coluna in range(len(CAMPOS))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, bm25({TABELA_FTS}, {', '.join(map(str, PESOS))}), {destaques} "
+            f"FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s ORDER BY 2 LIMIT %s",
+            [_INICIO, _FIM] * len(CAMPOS) + [consulta, limite],
+        )
+        linhas = cursor.fetchall()
+
+    guias = Guia.objects.select_related('clinica').in_bulk([linha[0] for linha in linhas])
+    return [
+        # bm25() is lower for better matches; flip it so a higher relevance is better everywhere
+        ResultadoPesquisa(guias[pk], -relevancia, dict(zip(CAMPOS, map(_destacar, textos))))
+        for pk, relevancia, *textos in linhas
+        if pk in guias
+    ]
+
+def _pesquisar_postgres(termos, limite):
+    from django.contrib.postgres.search import (
+        SearchHeadline, SearchQuery, SearchRank, SearchVectorField,
+    )
+    from django.db.models.expressions import RawSQL
+
+    consulta = SearchQuery(
+        " & ".join(f"{termo}:*" for termo in termos), search_type='raw', config='portuguese',
+    )
+    guias = (
+        Guia.objects.select_related('clinica')
+        .annotate(vetor=RawSQL(VETOR_POSTGRES, [], output_field=SearchVectorField()))
+        .filter(vetor=consulta)
+        .annotate(relevancia=SearchRank('vetor', consulta))
+        .annotate(**{
+            f'destaque_{campo}': SearchHeadline(
+                campo, consulta, config='portuguese', start_sel=_INICIO, stop_sel=_FIM, highlight_all=True,
+            )
+            for campo in CAMPOS
+        })
+        .order_by('-relevancia', '-periodo')[:limite]
+    )
+    return [
+        ResultadoPesquisa(guia, guia.relevancia, {
+            campo: _destacar(getattr(guia, f'destaque_{campo}')) for campo in CAMPOS
+        })
+        for guia in guias
+    ]
+
+def _pesquisar_simples(termos, limite):
+    # Other databases: every word must appear in one of the fields; no ranking or highlighting
+    filtro = Q()
+    for termo in termos:
+        filtro &= Q(*(Q(**{f'{campo}__icontains': termo}) for campo in CAMPOS), _connector=Q.OR)
+    guias = Guia.objects.select_related('clinica').filter(filtro).order_by('-periodo', 'pk')[:limite]
+    return [
+        ResultadoPesquisa(guia, None, {campo: _destacar(getattr(guia, campo)) for campo in CAMPOS})
+        for guia in guias
+    ]
+
+def pesquisar(texto, limite=LIMITE):
+    """Return up to `limite` ResultadoPesquisa for the words in `texto`, best matches first."""
+    termos = _termos(texto)
+    if not termos:
+        return []
+    if connection.vendor == 'sqlite':
+        return _pesquisar_sqlite(termos, limite)
+    if connection.vendor == 'postgresql':
+        return _pesquisar_postgres(termos, limite)
+    return _pesquisar_simples(termos, limite)
@@ -0,0 +1,107 @@
+"""Maintenance of the ResumoMensal table (one row per clinic and month).
+
+Rather than adding and subtracting deltas, which drift as soon as one write path is
+missed, the rows of the months that changed are recomputed from their guides. That is one
+aggregate query over the (clinica, periodo, is_closed) index plus one upsert, whatever
+the number of months, so it is cheap enough to run on every change.
+
+Every month that goes through atualizar() also gets its `versao` bumped and `atualizado_em`
+set, whether or not its numbers changed (a guide may be edited without changing the total),
+which is what the conditional GET of guias_app.condicional relies on.
+
+Only the fields computed from Guia are written here. quantidade_arquivadas and
+total_arquivado belong to guias_app.arquivo. A month whose guides were all archived keeps
+its row, with the other counts at zero.
+"""
+import itertools
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Guia, ResumoMensal
+
+TAMANHO_LOTE = 200
+CAMPOS = ['mes', 'ano', 'quantidade', 'total', 'quantidade_encerradas', 'total_encerradas', 'encerrado']
+# What the CAMPOS of a month become when it has no guides left in Guia
+SEM_GUIAS = {
+    'quantidade': 0, 'total': Decimal('0'), 'quantidade_encerradas': 0, 'total_encerradas': Decimal('0'), 'encerrado': True,
+}
+
+
+def _calcular(guias):
+    """ResumoMensal instances (unsaved) for the months of these guides."""
+    linhas = (
+        guias.filter(periodo__isnull=False)
+        .order_by()
+        .values('clinica_id', 'periodo')
+        .annotate(
+            quantidade=Count('pk'),
+            total=Sum('valor_total'),
+            quantidade_encerradas=Count('pk', filter=Q(is_closed=True)),
+            total_encerradas=Sum('valor_total', filter=Q(is_closed=True)),
+            # Any guide of the month carries its canonical month name and year
+            mes=Max('mes'),
+            ano=Max('ano'),
+        )
+    )
+    return [
+        ResumoMensal(
+            clinica_id=linha['clinica_id'],
+            periodo=linha['periodo'],
+            mes=linha['mes'],
+            ano=linha['ano'],
+            quantidade=linha['quantidade'],
+            total=linha['total'] or Decimal('0'),
+            quantidade_encerradas=linha['quantidade_encerradas'],
+            total_encerradas=linha['total_encerradas'] or Decimal('0'),
+            encerrado=linha['quantidade_encerradas'] == linha['quantidade'],
+        )
+        for linha in linhas
+    ]
+
+def _gravar(resumos, batch_size=None):
+    ResumoMensal.objects.bulk_create(
+        resumos, update_conflicts=True, unique_fields=['clinica', 'periodo'], update_fields=CAMPOS,
+        batch_size=batch_size,
+    )
+
+def _esvaziar(resumos):
+    """Delete these summary rows, except for archived months, which only lose their Guia counts."""
+    resumos.filter(quantidade_arquivadas=0).delete()
+    resumos.update(**SEM_GUIAS)
+
+def _nova_versao(resumos):
+    resumos.update(versao=F('versao') + 1, atualizado_em=timezone.now())
+
+def _filtro(pares):
+    filtro = Q()
+    for clinica_id, periodo in pares:
+        filtro |= Q(clinica_id=clinica_id, periodo=periodo)
+    return filtro
+
+def atualizar(pares):
+    """Recompute the summary rows of these (clinica_id, periodo) months."""
+    pares = {(int(clinica_id), periodo) for clinica_id, periodo in pares if clinica_id and periodo}
+    if not pares:
+        return
+    with transaction.atomic():
+        # In slices, so the OR of (clinica, periodo) conditions stays within SQLite's expression depth limit
+        for lote in itertools.batched(sorted(pares), TAMANHO_LOTE):
+            resumos = _calcular(Guia.objects.filter(_filtro(lote)))
+            vazios = set(lote) - {(resumo.clinica_id, resumo.periodo) for resumo in resumos}
+            if vazios:
+                # Months whose last guide was deleted, moved away or archived
+                _esvaziar(ResumoMensal.objects.filter(_filtro(vazios)))
+            _gravar(resumos)
+            _nova_versao(ResumoMensal.objects.filter(_filtro(lote)))
+
+def reconstruir():
+    """Recompute the whole table from the guides; returns the number of rows."""
+    with transaction.atomic():
+        _esvaziar(ResumoMensal.objects.all())
+        resumos = _calcular(Guia.objects.all())
+        _gravar(resumos, batch_size=500)
+        _nova_versao(ResumoMensal.objects.all())
+    return len(resumos)
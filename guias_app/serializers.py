@@ -0,0 +1,50 @@
+from rest_framework import serializers
+
+from .models import MESES, Clinica, Guia
+
+
+class CamposSelecionadosMixin:
+    """Only output the fields listed in ?fields=a,b,c (all of them when the parameter is absent)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        pedidos = request.query_params.get('fields') if request else None
+        if pedidos:
+            pedidos = {campo.strip() for campo in pedidos.split(',')}
+            for campo in set(self.fields) - pedidos:
+                self.fields.pop(campo)
+
+
+class ClinicaSerializer(CamposSelecionadosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Clinica
+        fields = ['id', 'nome']
+
+
+class GuiaSerializer(CamposSelecionadosMixin, serializers.ModelSerializer):
+    clinica_nome = serializers.CharField(source='clinica.nome', read_only=True)
+
+    class Meta:
+        model = Guia
+        fields = [
+            'id', 'clinica', 'clinica_nome', 'numero_guia', 'nome_paciente', 'medico',
+            'trabalhos', 'valor', 'valor_total', 'mes', 'ano', 'periodo', 'is_closed',
+        ]
+
+
+class TotalMensalSerializer(CamposSelecionadosMixin, serializers.Serializer):
+    clinica = serializers.IntegerField(source='clinica_id')
+    clinica_nome = serializers.CharField(source='clinica__nome')
+    periodo = serializers.IntegerField()
+    mes = serializers.SerializerMethodField()
+    ano = serializers.SerializerMethodField()
+    quantidade = serializers.IntegerField(source='guias_mes')
+    quantidade_abertas = serializers.IntegerField(source='abertas_mes')
+    total = serializers.DecimalField(max_digits=14, decimal_places=2, source='valor_mes')
+
+    def get_mes(self, linha):
+        return MESES[linha['periodo'] % 100 - 1]
+
+    def get_ano(self, linha):
+        return str(linha['periodo'] // 100)
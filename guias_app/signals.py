@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import pdf_cache, pesquisa, resumos
+from .cache import invalidar_clinicas
+from .models import Clinica, Guia
+
+
+@receiver(post_save, sender=Clinica)
+@receiver(post_delete, sender=Clinica)
+def invalidar_lista_clinicas(sender, **kwargs):
+    invalidar_clinicas()
+    # Again after commit, in case another request cached the old list in the meantime
+    transaction.on_commit(invalidar_clinicas)
+
+
+@receiver(post_save, sender=Clinica)
+@receiver(post_delete, sender=Clinica)
+def invalidar_pdfs_da_clinica(sender, instance, created=False, **kwargs):
+    # The clinic's name is printed in its PDFs; a new clinic has none yet
+    if not created:
+        pdf_cache.invalidar_clinica(instance.pk)
+
+
+def periodos_alterados(pares):
+    """Propagate a change to the guides of these (clinica_id, periodo) months.
+
+    Called by the Guia signal handlers below, and directly by the bulk paths
+    (bulk_create/bulk_update/update) that bypass them.
+    """
+    pares = set(pares)
+    for clinica_id, periodo in pares:
+        # A new, reopened, edited or deleted guide means the month's PDF no longer matches the data
+        pdf_cache.invalidar(clinica_id, periodo)
+    resumos.atualizar(pares)
+    # Again after commit, in case a render that read the old data stored its PDF in the meantime
+    transaction.on_commit(lambda: _invalidar_pdfs(pares))
+
+
+def _invalidar_pdfs(pares):
+    for clinica_id, periodo in pares:
+        pdf_cache.invalidar(clinica_id, periodo)
+
+
+@receiver(pre_save, sender=Guia)
+def guardar_periodo_anterior(sender, instance, **kwargs):
+    # Remember where an edited guide came from, in case the edit moves it to another clinic/month
+    instance._periodo_anterior = None
+    if instance.pk:
+        instance._periodo_anterior = Guia.objects.filter(pk=instance.pk).values_list('clinica_id', 'periodo').first()
+
+@receiver(post_save, sender=Guia)
+def guia_gravada(sender, instance, **kwargs):
+    pares = [(instance.clinica_id, instance.periodo)]
+    if getattr(instance, '_periodo_anterior', None):
+        pares.append(instance._periodo_anterior)
+    periodos_alterados(pares)
+    pesquisa.indexar([instance])
+
+@receiver(post_delete, sender=Guia)
+def guia_apagada(sender, instance, **kwargs):
+    periodos_alterados([(instance.clinica_id, instance.periodo)])
+    pesquisa.remover([instance.pk])
@@ -0,0 +1,61 @@
+"""Helpers for responses that are produced incrementally (StreamingHttpResponse)."""
+import io
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+class _BufferEscrita(io.RawIOBase):
+    """Write-only, non-seekable sink that hands back whatever was written since the last call."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def esvaziar(self):
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def zip_em_fluxo(ficheiros):
+    """Yield a ZIP archive chunk by chunk from an iterable of (nome, conteudo) pairs.
+
+    Each entry is written and flushed as soon as it arrives, so only the entry being added
+    is ever held in memory, never the whole archive.
+    """
+    buffer = _BufferEscrita()
+    # PDFs are already compressed; storing them keeps the web worker's CPU free
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as arquivo:
+        for nome, conteudo in ficheiros:
+            arquivo.writestr(nome, conteudo)
+            yield buffer.esvaziar()
+    yield buffer.esvaziar()
+
+
+_FIM = object()
+
+async def _em_fluxo_assincrono(iteravel):
+    iterador = iter(iteravel)
+    # Thread-sensitive, so every chunk is produced on the same thread and database connection
+    proximo = sync_to_async(next)
+    while (bloco := await proximo(iterador, _FIM)) is not _FIM:
+        yield bloco
+
+def conteudo_em_fluxo(request, iteravel):
+    """The content for a StreamingHttpResponse made of a sync iterable.
+
+    Under ASGI, Django collects a sync iterator whole with sync_to_async(list) before
+    sending anything, so the iterable is wrapped in an async iterator that pulls one chunk
+    at a time in a thread. Under WSGI it is returned as is.
+    """
+    if isinstance(request, ASGIRequest):
+        return _em_fluxo_assincrono(iteravel)
+    return iteravel
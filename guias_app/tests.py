@@ -1,3 +1,727 @@
-from django.test import TestCase
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from .models import Clinica, Guia, ResumoMensal, analisar_linhas
+
+# The settings' file cache is shared with the running server (and cache.clear() below would
+# wipe it), so the whole module runs against a private in-memory cache. PDFs are rendered
+# in-process: the pool's processes would set Django up again from the real settings.
+_DEFINICOES_DE_TESTE = override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'guias_app.tests',
+    }},
+    PDF_WORKERS=0,
+)
+# Nor do the requests made here belong in the performance log; assertLogs still sees them
+_registo_desempenho = logging.getLogger('guias_app.desempenho')
+_handlers_desempenho = []
+
+
+def setUpModule():
+    _DEFINICOES_DE_TESTE.enable()
+    _handlers_desempenho[:] = _registo_desempenho.handlers
+    _registo_desempenho.handlers = [logging.NullHandler()]
+
+def tearDownModule():
+    _registo_desempenho.handlers = _handlers_desempenho[:]
+    _DEFINICOES_DE_TESTE.disable()
+
+
+class OverviewGuidesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def criar_guias(self, clinica, mes, ano, quantidade):
+        for i in range(quantidade):
+            Guia.objects.create(
+                clinica=clinica, numero_guia=f"{mes}-{i}", nome_paciente="Paciente",
+                medico="Dr. Teste", trabalhos="Coroa\nGancho", valor="80\n20,50",
+                mes=mes, ano=ano, is_closed=True,
+            )
+
+    def test_totais_agregados(self):
+        clinica_a = Clinica.objects.create(nome="Clínica A")
+        clinica_b = Clinica.objects.create(nome="Clínica B")
+        self.criar_guias(clinica_a, "Janeiro", "2025", 2)
+        self.criar_guias(clinica_a, "Fevereiro", "2025", 1)
+        self.criar_guias(clinica_b, "Janeiro", "2025", 3)
+        Guia.objects.create(clinica=clinica_b, numero_guia="aberta", valor="999", mes="Janeiro", ano="2025")
+
+        response = self.client.get(reverse('overview_guides'))
+
+        grouped_data = response.context['grouped_data']
+        self.assertEqual(list(grouped_data["Clínica A"]['monthly_guides']), ["Janeiro/2025", "Fevereiro/2025"])
+        self.assertEqual(grouped_data["Clínica A"]['monthly_guides']["Janeiro/2025"]['total_value'], Decimal('201.00'))
+        self.assertEqual(grouped_data["Clínica A"]['clinic_total'], Decimal('301.50'))
+        self.assertEqual(grouped_data["Clínica B"]['clinic_total'], Decimal('301.50'))
+        self.assertEqual(response.context['global_total'], Decimal('603.00'))
+
+    def test_numero_de_queries_constante(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        self.criar_guias(clinica, "Janeiro", "2025", 2)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('overview_guides'))
+
+        for nome in ("Clínica B", "Clínica C"):
+            outra = Clinica.objects.create(nome=nome)
+            for mes in ("Janeiro", "Fevereiro", "Março"):
+                self.criar_guias(outra, mes, "2025", 20)
+        with self.assertNumQueries(3):
+            self.client.get(reverse('overview_guides'))
+
+
+    def test_get_condicional(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        self.criar_guias(clinica, "Janeiro", "2025", 1)
+        response = self.client.get(reverse('overview_guides'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            nao_modificada = self.client.get(reverse('overview_guides'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(nao_modificada.status_code, 304)
+
+        Guia.objects.get().delete()
+        self.assertEqual(self.client.get(reverse('overview_guides'), headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+class GuiaLinhaTests(TestCase):
+    def test_linhas_e_total_atualizados_ao_gravar(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        guia = Guia.objects.create(
+            clinica=clinica, numero_guia="1", trabalhos="Coroa\nGancho\nRevisão",
+            valor="80\n12,5\na definir", mes="Janeiro", ano="2025",
+        )
+
+        self.assertEqual(
+            list(guia.linhas.values_list('descricao', 'valor')),
+            [("Coroa", Decimal('80.00')), ("Gancho", Decimal('12.50')), ("Revisão", None)],
+        )
+        self.assertEqual(guia.valor_total, Decimal('92.5'))
+
+        guia.trabalhos, guia.valor = "Implante", "200"
+        guia.save()
+        self.assertEqual(list(guia.linhas.values_list('descricao', 'valor')), [("Implante", Decimal('200.00'))])
+
+    def test_valor_grande_demais_para_a_linha(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        guia = Guia.objects.create(
+            clinica=clinica, numero_guia="1", trabalhos="Coroa\nPonte", valor="80\n123456789012", mes="Janeiro", ano="2025",
+        )
+        self.assertEqual(analisar_linhas(guia.trabalhos, guia.valor)[1], ["123456789012"])
+        self.assertEqual(list(guia.linhas.values_list('valor', flat=True)), [Decimal('80.00'), None])
+        self.assertEqual(guia.valor_total, Decimal('80'))
+
+        dados = {'clinica': clinica.pk, 'numero_guia': "2", 'trabalhos': "Ponte", 'valor': "123456789012", 'mes': "Janeiro", 'ano': "2025"}
+        response = self.client.post(reverse('guia_create'), dados, headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('valor', response.json()['erros'])
+        self.assertFalse(Guia.objects.filter(numero_guia="2").exists())
+
+
+class GuiaPdfCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.clinica = Clinica.objects.create(nome="Clínica A")
+        self.guia = Guia.objects.create(
+            clinica=self.clinica, numero_guia="1", nome_paciente="Paciente", medico="Dr. Teste",
+            trabalhos="Coroa", valor="80", mes="Janeiro", ano="2025", is_closed=True,
+        )
+        self.url = reverse('guia_pdf') + f"?clinica={self.clinica.pk}&mes=Janeiro&ano=2025"
+
+    def test_mes_encerrado_renderizado_uma_vez(self):
+        with mock.patch('guias_app.views.gerar_pdf', return_value=b"%PDF-1") as gerar:
+            self.assertEqual(self.client.get(self.url).content, b"%PDF-1")
+            segunda = self.client.get(self.url)
+        self.assertEqual(gerar.call_count, 1)
+        self.assertEqual(b"".join(segunda.streaming_content), b"%PDF-1")
+
+    def test_pdf_nao_modificado_sem_renderizar(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with mock.patch('guias_app.views.gerar_pdf') as gerar:
+            nao_modificado = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(nao_modificado.status_code, 304)
+        gerar.assert_not_called()
+
+        # Renaming the patient changes neither the total nor the closed state, but it is a new PDF
+        self.guia.nome_paciente = "Outro"
+        self.guia.save()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_job_ultrapassado_por_uma_alteracao_nao_fica_em_cache(self):
+        from . import pdf_cache
+
+        def reabrir_durante_a_geracao(*args):
+            # The guide is reopened while the job is rendering the closed month
+            self.guia.is_closed = False
+            self.guia.save()
+            return b"%PDF-1"
+
+        with mock.patch('guias_app.pdf_jobs.gerar_pdf', side_effect=reabrir_durante_a_geracao):
+            resposta = self.client.post(reverse('guia_pdf_job_create'), {'clinica': self.clinica.pk, 'mes': "Janeiro", 'ano': "2025"})
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(list(pdf_cache._pasta(self.clinica.pk).glob('*.pdf')), [])
+
+    def test_cache_invalidada_ao_mudar_o_nome_da_clinica(self):
+        with mock.patch('guias_app.views.gerar_pdf', return_value=b"%PDF-1") as gerar:
+            self.client.get(self.url)
+            self.clinica.nome = "Clínica B"
+            self.clinica.save()
+            self.client.get(self.url)
+        self.assertEqual(gerar.call_count, 2)
+        self.assertEqual(gerar.call_args.args[3], "Clínica B")
+
+    def test_cache_invalidada_ao_reabrir(self):
+        with mock.patch('guias_app.views.gerar_pdf', return_value=b"%PDF-1") as gerar:
+            self.client.get(self.url)
+            self.guia.is_closed = False
+            self.guia.save()
+            self.client.get(self.url)
+        self.assertEqual(gerar.call_count, 2)
+
+
+class GuiaCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_listagem_paginada_com_queries_constantes(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        url = reverse('guia_create') + f"?clinica={clinica.pk}&mes=Janeiro&ano=2025"
+        Guia.objects.create(clinica=clinica, numero_guia="0", valor="10", mes="Janeiro", ano="2025")
+        self.client.get(url)  # warm the clinic list cache
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        Guia.objects.bulk_create(
+            Guia(clinica=clinica, numero_guia=str(i), valor="10", valor_total=Decimal('10'),
+                 mes="Janeiro", ano="2025", periodo=202501)
+            for i in range(1, 120)
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(url + "&pagina=3")
+
+        self.assertEqual(len(response.context['guias']), 20)
+        self.assertEqual(response.context['page_obj'].paginator.count, 120)
+        self.assertEqual(response.context['total'], Decimal('1200.00'))
+
+    def test_fragmentos_ao_adicionar_e_apagar(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        Guia.objects.create(clinica=clinica, numero_guia="0", valor="10", mes="Janeiro", ano="2025")
+        dados = {'clinica': clinica.pk, 'numero_guia': "1", 'trabalhos': "Coroa", 'valor': "80", 'mes': "Janeiro", 'ano': "2025"}
+        json_ = {'Accept': 'application/json'}
+
+        response = self.client.post(reverse('guia_create'), dados, headers=json_)
+        self.assertEqual(response.status_code, 201)
+        fragmento = response.json()
+        self.assertIn(f'id="guia-{fragmento["pk"]}"', fragmento['linha'])
+        self.assertNotIn('<html', fragmento['linha'])
+        self.assertEqual((fragmento['total'], fragmento['quantidade'], fragmento['por_pagina']), ("90.00", 2, 50))
+
+        # Same GuiaForm validation: the guide now exists in that clinic and month
+        repetida = self.client.post(reverse('guia_create'), dados, headers=json_)
+        self.assertEqual(repetida.status_code, 400)
+        self.assertIn('__all__', repetida.json()['erros'])
+
+        apagada = self.client.post(reverse('guia_delete', args=[fragmento['pk']]), headers=json_).json()
+        self.assertEqual((apagada['total'], apagada['quantidade']), ("10.00", 1))
+        # No flash message is left behind for the next full page
+        self.assertNotIn('messages', response.cookies)
+
+
+class ImportacaoTests(TestCase):
+    CSV = (
+        "Clínica;Número da Guia;Nome do Paciente;Tipo de Trabalho;Valor;Mês;Ano\n"
+        "Clínica A;1;Ana;Coroa;80;Janeiro;2025\n"
+        "Clínica A;2;Rui;\"Coroa\nGancho\";\"80\n20,50\";Janeiro;2025\n"
+        "Clínica B;3;Eva;Coroa;10;Janeiro;2025\n"
+        "Clínica A;4;Rita;Coroa;10;Março;2024\n"
+    )
+
+    def importar(self, texto, **kwargs):
+        from io import BytesIO
+        from .importacao import importar_guias
+        return importar_guias(BytesIO(texto.encode()), "guias.csv", **kwargs)
+
+    def test_importa_em_lotes_e_reporta_erros(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        with self.assertNumQueries(1 + 2 * 12):  # the clinics, then a fixed number of queries per batch
+            relatorio = self.importar(self.CSV, tamanho_lote=1)
+
+        self.assertEqual((relatorio.criadas, relatorio.atualizadas, relatorio.ignoradas), (2, 0, 0))
+        self.assertEqual([linha for linha, _ in relatorio.erros], [4, 5])
+        guia = Guia.objects.get(numero_guia="2")
+        self.assertEqual((guia.clinica, guia.periodo, guia.valor_total), (clinica, 202501, Decimal('100.50')))
+        self.assertEqual(guia.linhas.count(), 2)
+
+    def test_conflitos(self):
+        from .importacao import ATUALIZAR
+        clinica = Clinica.objects.create(nome="Clínica A")
+        Guia.objects.create(clinica=clinica, numero_guia="1", valor="5", mes="Janeiro", ano="2025")
+        Guia.objects.create(clinica=clinica, numero_guia="2", valor="5", mes="Janeiro", ano="2025", is_closed=True)
+
+        relatorio = self.importar(self.CSV)
+        self.assertEqual((relatorio.criadas, relatorio.atualizadas, relatorio.ignoradas), (0, 0, 1))
+        self.assertEqual(Guia.objects.get(numero_guia="1").valor_total, Decimal('5'))
+
+        relatorio = self.importar(self.CSV, conflitos=ATUALIZAR)
+        self.assertEqual(relatorio.atualizadas, 1)
+        self.assertEqual(Guia.objects.get(numero_guia="1").valor_total, Decimal('80'))
+        self.assertEqual(Guia.objects.get(numero_guia="2").valor_total, Decimal('5'))
+
+    def test_csv_em_cp1252_e_excel_invalido(self):
+        from io import BytesIO
+        from .importacao import importar_guias
+        Clinica.objects.create(nome="Clínica A")
+        relatorio = importar_guias(BytesIO(self.CSV.encode('cp1252')), "guias.csv")
+        self.assertEqual(relatorio.criadas, 2)
+        self.assertTrue(Guia.objects.filter(mes="Janeiro", clinica__nome="Clínica A").exists())
+
+        response = self.client.post(reverse('guia_import'), {
+            'ficheiro': SimpleUploadedFile("guias.xlsx", b"isto nao e um zip"), 'conflitos': 'saltar',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ficheiro', response.context['form'].errors)
+
+
+class LegadoTests(TestCase):
+    def setUp(self):
+        import sqlite3
+        self.caminho = tempfile.mkstemp(suffix=".db")[1]
+        self.addCleanup(os.remove, self.caminho)
+        origem = sqlite3.connect(self.caminho)
+        origem.executescript("""
+            CREATE TABLE clinicas (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT NOT NULL UNIQUE);
+            CREATE TABLE guias (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, numero_guia TEXT NOT NULL, nome_paciente TEXT,
+                medico TEXT, trabalhos TEXT, valor TEXT, mes TEXT NOT NULL, ano TEXT NOT NULL, clinica_id INTEGER
+            );
+            INSERT INTO clinicas (id, nome) VALUES (1, 'clinica a'), (2, 'Clínica Nova');
+            INSERT INTO guias (numero_guia, nome_paciente, trabalhos, valor, mes, ano, clinica_id) VALUES
+                ('1', 'Ana', 'Coroa', '80', 'Agosto', '2023', 1),
+                ('1', 'Ana', 'Coroa', '80', 'Agosto', '2023', 1),
+                ('2', NULL, 'Coroa' || char(10) || 'Gancho', '80' || char(10) || '20,50', 'janeiro', '2024', 2),
+                ('3', 'Rui', 'Coroa', '10', 'Agosto', '2023', 9),
+                ('4', 'Eva', 'Coroa', '10', 'Agostinho', '2023', 1);
+        """)
+        origem.close()
+
+    def test_migra_e_repete_sem_duplicar(self):
+        from .legado import importar_legado
+        clinica = Clinica.objects.create(nome="Clínica A")
+
+        relatorio = importar_legado(self.caminho, tamanho_lote=2)
+        self.assertEqual((relatorio.clinicas_criadas, relatorio.criadas, relatorio.ignoradas), (1, 2, 1))
+        self.assertEqual([id_legado for id_legado, _ in relatorio.erros], [4, 5])
+        self.assertEqual(relatorio.ultimo_id, 5)
+        self.assertEqual(Guia.objects.get(numero_guia="1").clinica, clinica)
+        guia = Guia.objects.get(numero_guia="2")
+        self.assertEqual((guia.clinica.nome, guia.periodo, guia.valor_total), ("Clínica Nova", 202401, Decimal('100.50')))
+        self.assertEqual(ResumoMensal.objects.get(clinica=clinica).quantidade, 1)
+
+        relatorio = importar_legado(self.caminho, desde=1)
+        self.assertEqual((relatorio.clinicas_criadas, relatorio.criadas, relatorio.ignoradas), (0, 0, 2))
+        self.assertEqual((Clinica.objects.count(), Guia.objects.count()), (2, 2))
+
+    def test_mantem_meses_encerrados_e_grava_lote_a_lote(self):
+        import sqlite3
+        from .importacao import gravar_lote
+        from .legado import RelatorioLegado, importar_legado
+        origem = sqlite3.connect(self.caminho)
+        origem.executescript("""
+            ALTER TABLE guias ADD COLUMN is_closed INTEGER DEFAULT 0;
+            UPDATE guias SET is_closed = 1 WHERE numero_guia = '2';
+        """)
+        origem.close()
+        clinica = Clinica.objects.create(nome="Clínica A")
+        Guia.objects.create(clinica=clinica, numero_guia="9", valor="1", mes="Agosto", ano="2023", is_closed=True)
+
+        # The second batch fails; the first one stays, and the report says where to resume
+        lotes = iter([gravar_lote, mock.Mock(side_effect=RuntimeError)])
+        relatorio = RelatorioLegado()
+        with mock.patch('guias_app.legado.gravar_lote', side_effect=lambda *args: next(lotes)(*args)):
+            with self.assertRaises(RuntimeError):
+                importar_legado(self.caminho, tamanho_lote=2, relatorio=relatorio)
+        self.assertEqual(relatorio.ultimo_id, 2)
+        self.assertTrue(Guia.objects.filter(numero_guia="1").exists())
+
+        importar_legado(self.caminho, desde=relatorio.ultimo_id)
+        self.assertTrue(Guia.objects.get(numero_guia="1").is_closed)
+        self.assertTrue(Guia.objects.get(numero_guia="2").is_closed)
+        self.assertTrue(ResumoMensal.objects.get(clinica=clinica, periodo=202308).encerrado)
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinica = Clinica.objects.create(nome="Clínica A")
+        outra = Clinica.objects.create(nome="Clínica B")
+        for clinica, numero, mes, is_closed in [
+            (self.clinica, "1", "Janeiro", True),
+            (self.clinica, "2", "Março", False),
+            (self.clinica, "3", "Junho", True),
+            (outra, "4", "Março", True),
+        ]:
+            Guia.objects.create(clinica=clinica, numero_guia=numero, valor="10", mes=mes, ano="2025", is_closed=is_closed)
+
+    def exportar(self, **params):
+        response = self.client.get(reverse('guia_export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv_filtrado(self):
+        conteudo = self.exportar(clinica=self.clinica.pk, de="2025-02", ate="2025-12", estado="encerradas")
+        linhas = conteudo.decode('utf-8-sig').splitlines()
+        self.assertEqual(linhas[0].split(";")[:2], ["Clínica", "Número da Guia"])
+        self.assertEqual([linha.split(";")[1] for linha in linhas[1:]], ["3"])
+
+    def test_parquet(self):
+        import io
+        import pyarrow.parquet as pq
+        tabela = pq.read_table(io.BytesIO(self.exportar(formato="parquet", estado="todas")))
+        self.assertEqual(tabela.column('numero_guia').to_pylist(), ["1", "2", "4", "3"])
+        self.assertEqual(sum(tabela.column('valor_total').to_pylist()), Decimal('40'))
+
+    async def test_em_fluxo_assincrono_sob_asgi(self):
+        response = await self.async_client.get(reverse('guia_export'), {'estado': "encerradas"})
+        # An async iterator, which the ASGI handler sends chunk by chunk instead of collecting it
+        self.assertTrue(response.is_async)
+        conteudo = b"".join([bloco async for bloco in response.streaming_content])
+        self.assertEqual(len(conteudo.decode('utf-8-sig').splitlines()), 4)
+
+    def test_periodo_invalido(self):
+        response = self.client.get(reverse('guia_export'), {'de': "2025-13"})
+        self.assertRedirects(response, reverse('overview_guides'))
+
+
+class PesquisaTests(TestCase):
+    def setUp(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        self.coroa = Guia.objects.create(
+            clinica=clinica, numero_guia="101", nome_paciente="Ana Silva", medico="Dr. Lopes",
+            trabalhos="Coroa <zircónia>\nGancho", valor="80\n20", mes="Janeiro", ano="2025",
+        )
+        self.protese = Guia.objects.create(
+            clinica=clinica, numero_guia="102", nome_paciente="Rui Costa", medico="Dra. Silva",
+            trabalhos="Prótese", valor="100", mes="Fevereiro", ano="2025",
+        )
+
+    def pesquisar(self, texto):
+        response = self.client.get(reverse('guia_search_api'), {'q': texto})
+        return response.json()['resultados']
+
+    def test_pesquisa_ordenada_e_destacada(self):
+        resultados = self.pesquisar("silva")
+        self.assertEqual({r['id'] for r in resultados}, {self.coroa.pk, self.protese.pk})
+        self.assertEqual(resultados[0]['destaques']['nome_paciente'], "Ana <mark>Silva</mark>")
+
+        resultados = self.pesquisar("zirconia coro")  # prefixes, accents ignored
+        self.assertEqual([r['id'] for r in resultados], [self.coroa.pk])
+        self.assertEqual(
+            resultados[0]['destaques']['trabalhos'],
+            "<mark>Coroa</mark> &lt;<mark>zircónia</mark>&gt;<br>Gancho",
+        )
+
+    def test_indice_atualizado_por_sinais(self):
+        self.protese.trabalhos = "Ponte"
+        self.protese.save()
+        self.assertEqual(self.pesquisar("protese"), [])
+        self.assertEqual(len(self.pesquisar("ponte")), 1)
+        self.coroa.delete()
+        self.assertEqual(self.pesquisar("ana"), [])
+        self.assertEqual(self.pesquisar('" OR *'), [])
+
+    def test_limite_da_api(self):
+        for limite, esperados in [("-5", 1), ("0", 1), ("1", 1), ("abc", 2)]:
+            response = self.client.get(reverse('guia_search_api'), {'q': "silva", 'limite': limite})
+            self.assertEqual(len(response.json()['resultados']), esperados, limite)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.clinicas = [Clinica.objects.create(nome=f"Clínica {letra}") for letra in "AB"]
+        for i in range(5):
+            for clinica in self.clinicas:
+                Guia.objects.create(clinica=clinica, numero_guia=str(i), valor="10", mes="Janeiro",
+                                    ano="2025", is_closed=i < 3)
+
+    def test_guias_paginadas_por_cursor_sem_n_mais_1(self):
+        url = reverse('api-guia-list') + "?tamanho=4&fields=id,clinica_nome"
+        ids = []
+        while url:
+            with self.assertNumQueries(1):
+                dados = self.client.get(url).json()
+            self.assertEqual(set(dados['results'][0]), {'id', 'clinica_nome'})
+            ids += [guia['id'] for guia in dados['results']]
+            url = dados['next']
+        self.assertEqual(ids, sorted(Guia.objects.values_list('pk', flat=True)))
+
+    def test_totais_mensais(self):
+        dados = self.client.get(reverse('api-total-mensal-list'), {'clinica': self.clinicas[0].pk}).json()
+        self.assertEqual(len(dados['results']), 1)
+        total = dados['results'][0]
+        self.assertEqual((total['quantidade'], total['quantidade_abertas'], total['total']), (5, 2, "50.00"))
+
+    def test_totais_paginados_com_meses_sem_periodo_e_arquivados(self):
+        from .arquivo import arquivar
+        clinica = self.clinicas[0]
+        Guia.objects.create(clinica=clinica, numero_guia="7", valor="1", mes="Jan", ano="2025")
+        Guia.objects.create(clinica=clinica, numero_guia="8", valor="3", mes="Março", ano="2024", is_closed=True)
+        Guia.objects.create(clinica=clinica, numero_guia="9", valor="4", mes="marco", ano="2024", is_closed=True)
+        arquivar(2024)
+
+        url = reverse('api-total-mensal-list') + "?tamanho=1"
+        totais = []
+        while url:
+            dados = self.client.get(url).json()
+            totais += [(t['clinica'], t['periodo'], t['mes'], t['ano'], t['quantidade'], t['total']) for t in dados['results']]
+            url = dados['next']
+        self.assertEqual(totais, [
+            (clinica.pk, 202403, "Março", "2024", 2, "7.00"),
+            (clinica.pk, 202501, "Janeiro", "2025", 5, "50.00"),
+            (self.clinicas[1].pk, 202501, "Janeiro", "2025", 5, "50.00"),
+        ])
+
+        encerradas = self.client.get(reverse('api-total-mensal-list'), {'estado': 'encerradas', 'de': "2025-01"}).json()
+        self.assertEqual([(t['quantidade'], t['quantidade_abertas'], t['total']) for t in encerradas['results']],
+                         [(3, 0, "30.00"), (3, 0, "30.00")])
+
+    def test_etag(self):
+        url = reverse('api-clinica-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+
+class ResumoMensalTests(TestCase):
+    def resumos(self):
+        return list(ResumoMensal.objects.order_by('clinica_id', 'periodo').values_list(
+            'clinica_id', 'periodo', 'quantidade', 'total', 'quantidade_encerradas', 'total_encerradas', 'encerrado',
+        ))
+
+    def test_mantido_ao_criar_encerrar_e_apagar(self):
+        clinica = Clinica.objects.create(nome="Clínica A")
+        guias = [
+            Guia.objects.create(clinica=clinica, numero_guia=str(i), valor="10", mes="Janeiro", ano="2025")
+            for i in range(3)
+        ]
+        Guia.objects.create(clinica=clinica, numero_guia="9", valor="5", mes="Fevereiro", ano="2025")
+        self.assertEqual(self.resumos(), [
+            (clinica.pk, 202501, 3, Decimal('30'), 0, Decimal('0'), False),
+            (clinica.pk, 202502, 1, Decimal('5'), 0, Decimal('0'), False),
+        ])
+
+        self.client.post(reverse('guia_close_monthly'), {'clinica': clinica.pk, 'mes': "Janeiro", 'ano': "2025"})
+        guias[0].delete()
+        guias[1].mes = "Fevereiro"
+        guias[1].save()
+        self.assertEqual(self.resumos(), [
+            (clinica.pk, 202501, 1, Decimal('10'), 1, Decimal('10'), True),
+            (clinica.pk, 202502, 2, Decimal('15'), 0, Decimal('0'), False),
+        ])
+
+        antes = self.resumos()
+        call_command('rebuild_summaries', stdout=StringIO())
+        self.assertEqual(self.resumos(), antes)
+
+
+class DesempenhoTests(TestCase):
+    def test_registo_por_pedido_com_n_mais_1(self):
+        from . import desempenho
+
+        def view_com_n_mais_1(request):
+            for clinica in Clinica.objects.all():
+                list(clinica.guia_set.all())
+            return HttpResponse("<html><body></body></html>")
+
+        for i in range(6):
+            Clinica.objects.create(nome=f"Clínica {i}")
+        middleware = desempenho.MedicaoDesempenhoMiddleware(view_com_n_mais_1)
+        request = RequestFactory().get('/teste/')
+        with self.assertLogs('guias_app.desempenho', 'INFO') as logs, override_settings(DEBUG=True):
+            response = middleware(request)
+
+        registo = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(registo['consultas'], 7)
+        self.assertEqual(registo['n_mais_1'][0]['vezes'], 6)
+        self.assertEqual(registo['bytes'], len("<html><body></body></html>"))
+        self.assertIn(b"7 consultas", response.content)
+
+    def test_fases_do_pdf(self):
+        from .pdf import gerar_pdf
+        with self.assertLogs('guias_app.desempenho', 'INFO') as logs:
+            gerar_pdf([], "Janeiro", "2025", "Clínica A", Decimal('0'))
+        registo = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(set(registo['fases']), {'pdf_estilos', 'pdf_tabela', 'pdf_build'})
+
+    async def test_vistas_assincronas_pelo_handler_asgi(self):
+        await sync_to_async(cache.clear)()
+        clinica = await Clinica.objects.acreate(nome="Clínica A")
+        await Guia.objects.acreate(clinica=clinica, numero_guia="1", trabalhos="Coroa", valor="80", mes="Janeiro", ano="2025")
+        filtros = {'clinica': clinica.pk, 'mes': "Janeiro", 'ano': "2025"}
+
+        with self.assertLogs('guias_app.desempenho', 'INFO') as logs:
+            criar = await self.async_client.get(reverse('guia_create'), filtros)
+            pdf = await self.async_client.get(reverse('guia_pdf'), filtros)
+
+        self.assertEqual(criar.context['total'], Decimal('80'))
+        self.assertTrue(pdf.content.startswith(b"%PDF"))
+        registos = [json.loads(registo.getMessage()) for registo in logs.records]
+        # The queries made through the async ORM are still counted by the middleware
+        self.assertEqual([registo['url_name'] for registo in registos], ['guia_create', 'guia_pdf'])
+        self.assertEqual(registos[-1]['consultas'], 6)  # validators, version, total, rows, archive, open guides check
+        self.assertEqual(set(registos[-1]['fases']), {'pdf_estilos', 'pdf_tabela', 'pdf_build'})
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def test_dados_sinteticos_e_cenarios(self):
+        from . import benchmark, dados_sinteticos
+
+        clinicas = dados_sinteticos.gerar(clinicas=2, meses=3, guias=4)
+        self.assertEqual(Guia.objects.count(), 2 * 3 * 4)
+        self.assertEqual(ResumoMensal.objects.filter(encerrado=True).count(), 2 * 2)
+        self.assertTrue(Guia.objects.filter(trabalhos__contains="\n").exists())
+
+        meses = dados_sinteticos.meses_a_partir(2025, 3)
+        with override_settings(MEDIA_ROOT=self.media_root):
+            resultados = benchmark.executar({}, clinicas[0], meses[0], meses[-1], repeticoes=2)
+        self.assertEqual(set(resultados['cenarios']), {'overview_guides', 'guia_create', 'guia_pdf', 'guia_close_monthly'})
+        self.assertEqual(benchmark.comparar(resultados, resultados, 0.25), [])
+
+
+class PerfilSqliteTests(TestCase):
+    def test_verificacoes_sem_problemas(self):
+        from . import checks
+        self.assertEqual(checks.verificar_configuracao_sqlite(None), [])
+        self.assertEqual(checks.verificar_base_de_dados_sqlite(None, databases=['default']), [])
+
+    def test_pragmas_aplicados(self):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class EncerramentoTests(TestCase):
+    def test_encerrar_varios_meses_numa_transacao(self):
+        from .encerramento import encerrar, meses_abertos
+        clinicas = [Clinica.objects.create(nome=f"Clínica {letra}") for letra in "AB"]
+        for clinica in clinicas:
+            for mes in ("Janeiro", "Fevereiro"):
+                for i in range(3):
+                    Guia.objects.create(clinica=clinica, numero_guia=str(i), valor="10", mes=mes, ano="2025")
+        Guia.objects.filter(clinica=clinicas[1], mes="Fevereiro", numero_guia="0").update(is_closed=True)
+
+        pares = meses_abertos([202501, 202502])
+        self.assertEqual(len(pares), 4)
+        antes = Guia.objects.filter(is_closed=False).latest('updated_at').updated_at
+        progresso = []
+        encerramentos = encerrar(pares, lambda feitas, total: progresso.append((feitas, total)))
+
+        self.assertEqual(progresso[-1], (11, 11))
+        self.assertEqual(
+            [(e.clinica_id, e.periodo, e.quantidade, e.total) for e in encerramentos],
+            [(clinicas[0].pk, 202501, 3, Decimal('30')), (clinicas[0].pk, 202502, 3, Decimal('30')),
+             (clinicas[1].pk, 202501, 3, Decimal('30')), (clinicas[1].pk, 202502, 2, Decimal('20'))],
+        )
+        self.assertFalse(Guia.objects.filter(is_closed=False).exists())
+        # update() bypasses auto_now, so the close sets updated_at itself
+        self.assertEqual(Guia.objects.filter(updated_at__gt=antes).count(), 11)
+        self.assertEqual(ResumoMensal.objects.filter(encerrado=True).count(), 4)
+        self.assertEqual(encerrar(pares), [])
+
+
+class ArquivoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.clinica = Clinica.objects.create(nome="Clínica A")
+        for numero, mes, ano, valor in [("1", "Janeiro", "2024", "80\n20"), ("2", "Janeiro", "2024", "50"),
+                                        ("3", "Março", "2024", "10"), ("4", "Janeiro", "2025", "7")]:
+            Guia.objects.create(clinica=self.clinica, numero_guia=numero, trabalhos="Coroa\nGancho", valor=valor,
+                                mes=mes, ano=ano, is_closed=True)
+
+    def test_arquivar_ano_mantem_overview_exportacao_e_pdf(self):
+        from .arquivo import arquivar
+        antes = self.client.get(reverse('overview_guides')).context['grouped_data']
+
+        arquivos = arquivar(2024)
+
+        self.assertEqual([(a.periodo, a.quantidade, a.total) for a in arquivos], [(202401, 2, Decimal('150')), (202403, 1, Decimal('10'))])
+        self.assertEqual(list(Guia.objects.values_list('numero_guia', flat=True)), ["4"])
+        self.assertEqual(ResumoMensal.objects.get(periodo=202401).quantidade, 0)
+        self.assertEqual(self.client.get(reverse('overview_guides')).context['grouped_data'], antes)
+
+        response = self.client.get(reverse('guia_export'), {'formato': 'csv', 'estado': 'encerradas'})
+        linhas = list(csv.reader(StringIO(b"".join(response.streaming_content).decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual([linha[1] for linha in linhas[1:]], ["1", "2", "3", "4"])
+        self.assertEqual(linhas[1][6], "100.00")
+
+        with mock.patch('guias_app.views.gerar_pdf', return_value=b"%PDF-1") as gerar:
+            self.client.get(reverse('guia_pdf'), {'clinica': self.clinica.pk, 'mes': "Janeiro", 'ano': "2024"})
+        dados, _, _, _, total = gerar.call_args.args
+        self.assertEqual(([linha.numero_guia for linha in dados], total), (["1", "2"], Decimal('150')))
+
+    def test_pdf_junta_arquivo_e_guias_tardias(self):
+        from .arquivo import arquivar
+        arquivar(2024)
+        # A late guide for an archived, closed month
+        Guia.objects.create(clinica=self.clinica, numero_guia="5", valor="5", mes="Janeiro", ano="2024", is_closed=True)
+
+        with mock.patch('guias_app.views.gerar_pdf', return_value=b"%PDF-1") as gerar:
+            self.client.get(reverse('guia_pdf'), {'clinica': self.clinica.pk, 'mes': "Janeiro", 'ano': "2024"})
+        dados, _, _, _, total = gerar.call_args.args
+        self.assertEqual(([linha.numero_guia for linha in dados], total), (["1", "2", "5"], Decimal('155')))
+
+        # A fully archived month is in the month's ZIP too
+        zip_ = self.client.get(reverse('guia_pdf_zip'), {'mes': "Março", 'ano': "2024"})
+        self.assertIn(b"clinica-a_202403.pdf", b"".join(zip_.streaming_content))
+
+    def test_exportacao_com_guia_sem_periodo(self):
+        from .arquivo import arquivar
+        arquivar(2024)
+        # "Jan" is not a month name, so the guide has no periodo
+        Guia.objects.create(clinica=self.clinica, numero_guia="6", valor="3", mes="Jan", ano="2025")
+
+        response = self.client.get(reverse('guia_export'), {'formato': 'csv'})
+        linhas = list(csv.reader(StringIO(b"".join(response.streaming_content).decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual([linha[1] for linha in linhas[1:]], ["6", "1", "2", "3", "4"])
+
+    def test_ano_com_guias_abertas_nao_e_arquivado(self):
+        from .arquivo import ErroArquivo, arquivar
+        Guia.objects.create(clinica=self.clinica, numero_guia="5", valor="1", mes="Março", ano="2024")
+        with self.assertRaises(ErroArquivo):
+            arquivar(2024)
+        self.assertEqual(Guia.objects.count(), 5)
@@ -1,5 +1,12 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import api, views
+
+router = DefaultRouter()
+router.register('clinicas', api.ClinicaViewSet, basename='api-clinica')
+router.register('guias', api.GuiaViewSet, basename='api-guia')
+router.register('totais-mensais', api.TotalMensalViewSet, basename='api-total-mensal')
 
 urlpatterns = [
     path('clinicas/', views.clinica_list, name='clinica_list'),
@@ -7,9 +14,18 @@ urlpatterns = [
     path('clinicas/delete/<int:pk>/', views.clinica_delete, name='clinica_delete'),
     path('guias/overview/', views.overview_guides, name='overview_guides'),
     path('guias/create/', views.guia_create, name='guia_create'),
+    path('guias/pesquisa/', views.guia_search, name='guia_search'),
+    path('guias/pesquisa/api/', views.guia_search_api, name='guia_search_api'),
+    path('guias/exportar/', views.guia_export, name='guia_export'),
+    path('guias/importar/', views.guia_import, name='guia_import'),
     path('guias/delete/<int:pk>/', views.guia_delete, name='guia_delete'),
     path('guias/pdf/', views.guia_pdf, name='guia_pdf'),
+    path('guias/pdf/zip/', views.guia_pdf_zip, name='guia_pdf_zip'),
+    path('guias/pdf/jobs/', views.guia_pdf_job_create, name='guia_pdf_job_create'),
+    path('guias/pdf/jobs/<uuid:job_id>/', views.guia_pdf_job_status, name='guia_pdf_job_status'),
+    path('guias/pdf/jobs/<uuid:job_id>/download/', views.guia_pdf_job_download, name='guia_pdf_job_download'),
     
     path('guias/close_monthly/', views.guia_close_monthly, name='guia_close_monthly'),
+    path('api/', include(router.urls)),
     path('', views.home, name='home'), # Default view
 ]
\ No newline at end of file
@@ -1,154 +1,35 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.template.defaultfilters import floatformat
+from django.template.loader import render_to_string
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib import messages
-from django.contrib.staticfiles.finders import find
-from django.db.models import Sum
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Q, Sum
+from django.utils.text import slugify
+from django.views.decorators.http import require_POST
 from decimal import Decimal
+from urllib.parse import urlencode
 
-from .models import Clinica, Guia
+from . import arquivo, condicional, encerramento, exportacao, importacao, pdf_cache, pdf_jobs, pesquisa
+from .cache import alistar_clinicas, anome_clinica, listar_clinicas, nome_clinica
+from .models import MESES, ArquivoMensal, Clinica, Guia, ResumoMensal, calcular_periodo
 from .forms import ClinicaForm, GuiaForm
+from .pdf import alinhas_pdf, gerar_pdf, linhas_pdf
+from .streaming import conteudo_em_fluxo, zip_em_fluxo
 
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import (
-    SimpleDocTemplate, Table, TableStyle,
-    Paragraph, Spacer, Image
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from PIL import Image as PILImage
-
-# Funções auxiliares para PDF
-def somar_valores_multilinha(valores_multilinha):
-    total = Decimal('0.0')
-    for val_str in valores_multilinha.split("\n"):
-        val_str = val_str.strip().replace(",", ".")
-        try:
-            total += Decimal(val_str)
-        except:
-            pass
-    return total
-
-def gerar_pdf(dados, mes, ano, clinica_nome, total):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4,
-                            rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    styles = getSampleStyleSheet()
-    elementos = []
-
-    style_normal = styles["Normal"]
-    style_normal.leading = 14
-
-    style_right = ParagraphStyle(
-        "right",
-        parent=style_normal,
-        alignment=2,
-        fontSize=10,
-        leading=12
-    )
-    style_titulo = ParagraphStyle(
-        "titulo",
-        parent=styles["Title"],
-        alignment=1,
-        fontSize=18,
-        leading=22,
-        spaceAfter=18
-    )
-
-    # Logo
-    logo_path = find('guias_app/logo.png')
-    if logo_path:
-        try:
-            pil_img = PILImage.open(logo_path)
-            largura_original, altura_original = pil_img.size
-            largura_nova = largura_original * 0.75
-            altura_nova = altura_original * 0.75
-            img = Image(logo_path, width=largura_nova, height=altura_nova)
-        except Exception:
-            img = Paragraph("Logótipo não encontrado", style_normal)
-    else:
-        img = Paragraph("Logótipo não encontrado", style_normal)
+GUIAS_POR_PAGINA = 50
 
-    # Cabeçalho: logo + clínica alinhados à direita
-    from reportlab.platypus import Table, TableStyle
-
-    logo_and_clinica = [
-        [img],
-        [Paragraph(f"<b>{clinica_nome}</b>", style_right)]
-    ]
-    tabela_logo = Table(logo_and_clinica, colWidths=[largura_nova], hAlign="RIGHT")
-    tabela_logo.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-        ('BOTTOMPADDING', (0, 0), (0, 0), 10),
-        ('TOPPADDING', (1, 0), (1, 0), 0),
-    ]))
-    elementos.append(tabela_logo)
-    elementos.append(Spacer(1, 20))
-
-    # Título
-    elementos.append(Paragraph(f"TRABALHOS REALIZADOS NO MÊS DE {mes.upper()} - {ano}", style_titulo))
-    elementos.append(Spacer(1, 12))
-
-    # Destinatário
-    elementos.append(Paragraph(f"Exmo. Sr.<br/>{clinica_nome}", style_normal))
-    elementos.append(Spacer(1, 20))
-
-    # Informação técnica fixa
-    info_tecnica = (
-        "Técnica de Prótese Dentária<br/>"
-        "Vânia Sofia Martins Tomé<br/>"
-        "Urb. Aldeia das Amendoeiras Lote 57<br/>"
-        "8200-004 Albufeira<br/>"
-        "Cont. 223 229 067<br/>"
-        "NIB: 0035 0018 0000 15000000 33"
-    )
-    elementos.append(Paragraph(info_tecnica, style_normal))
-    elementos.append(Spacer(1, 25))
-
-    # Tabela de dados
-    dados_tabela = [["Número da Guia", "Nome do Paciente", "Médico", "Tipo de Trabalho", "Valor (€)"]]
-    for row in dados:
-        trabalhos_formatado = Paragraph(row.trabalhos.replace("\n", "<br/>"), style_normal)
-        valor_formatado = Paragraph(row.valor.replace("\n", "<br/>"), style_normal)
-        dados_tabela.append([
-            row.numero_guia,
-            row.nome_paciente,
-            row.medico,
-            trabalhos_formatado,
-            valor_formatado
-        ])
-    # Total row
-    dados_tabela.append(["", "", "", "<b>Total:</b>", f"<b>{total:.2f} €</b>"])
-
-    tabela = Table(dados_tabela, colWidths=[70, 110, 90, 180, 60], hAlign='LEFT')
-    tabela.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (-2, -1), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (-2, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-        ('LINEBELOW', (0, -2), (-1, -2), 1, colors.black),
-        ('FONTSIZE', (-2, -1), (-1, -1), 10),
-    ]))
-    elementos.append(tabela)
-
-    doc.build(elementos)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
+# home, overview_guides, guia_create and guia_pdf are async views: under ASGI (see
+# guias_project/asgi.py) their queries go through the async ORM and the PDF is rendered in
+# a thread, so the worker keeps serving other requests meanwhile. Templates are rendered in
+# a thread too, because the context processors, the session and the messages hit the database.
+arender = sync_to_async(render)
 
 # Views para Clínicas
 def clinica_list(request):
-    clinicas = Clinica.objects.all().order_by('nome')
+    clinicas = listar_clinicas()
     form = ClinicaForm()
     return render(request, 'guias_app/clinica_list.html', {'clinicas': clinicas, 'form': form})
 
@@ -167,7 +48,7 @@ def clinica_add(request):
                     form.add_error(None, f"Ocorreu um erro: {e}")
     else:
         form = ClinicaForm()
-    clinicas = Clinica.objects.all().order_by('nome')
+    clinicas = listar_clinicas()
     return render(request, 'guias_app/clinica_list.html', {'clinicas': clinicas, 'form': form})
 
 def clinica_delete(request, pk):
@@ -177,43 +58,58 @@ def clinica_delete(request, pk):
     return redirect('clinica_list')
 
 # Views para Guias
-def overview_guides(request):
-    # Get all closed guides
-    all_closed_guias = Guia.objects.filter(is_closed=True).order_by('clinica__nome', 'ano', 'mes')
+async def overview_guides(request):
+    clinicas = await alistar_clinicas()
+    # An unchanged summary table and clinic list is answered with a 304 (see condicional.py)
+    validadores = await condicional.avalidadores_resumos(request, clinicas)
+    if (response := condicional.nao_modificado(request, validadores)) is not None:
+        return condicional.com_validadores(response, validadores)
+
+    # Closed totals per clinic and month, read from the summary table (see resumos.py);
+    # archived guides (see arquivo.py) are all closed and counted in total_arquivado
+    monthly_totals = [
+        row async for row in ResumoMensal.objects.filter(Q(quantidade_encerradas__gt=0) | Q(quantidade_arquivadas__gt=0))
+        .values('clinica_id', 'clinica__nome', 'periodo', 'mes', 'ano', total_value=F('total_encerradas') + F('total_arquivado'))
+        .order_by('clinica__nome', 'periodo')
+    ]
 
-    # Group by clinic, then by month/year, and calculate totals
+    # Group the aggregated rows by clinic and roll them up into clinic and global totals
     grouped_data = {}
     global_total = Decimal('0.0')
+    guia_pdf_url = reverse('guia_pdf')
 
-    for guia in all_closed_guias:
-        clinica_name = guia.clinica.nome
-        month_year = f"{guia.mes}/{guia.ano}"
-        guia_value = somar_valores_multilinha(guia.valor)
+    for row in monthly_totals:
+        clinica_name = row['clinica__nome']
+        month_year = f"{row['mes']}/{row['ano']}"
+        total_value = row['total_value'] or Decimal('0.0')
 
         if clinica_name not in grouped_data:
             grouped_data[clinica_name] = {
                 'monthly_guides': {},
                 'clinic_total': Decimal('0.0')
             }
-        
-        if month_year not in grouped_data[clinica_name]['monthly_guides']:
-            grouped_data[clinica_name]['monthly_guides'][month_year] = {
-                'total_value': Decimal('0.0'),
-                'guia_pdf_url': reverse('guia_pdf') + f'?clinica={guia.clinica.pk}&mes={guia.mes}&ano={guia.ano}'
-            }
-        
-        grouped_data[clinica_name]['monthly_guides'][month_year]['total_value'] += guia_value
-        grouped_data[clinica_name]['clinic_total'] += guia_value
-        global_total += guia_value
 
-    clinicas = Clinica.objects.all().order_by('nome') # Still needed for navbar
+        grouped_data[clinica_name]['monthly_guides'][month_year] = {
+            'total_value': total_value,
+            'clinica_id': row['clinica_id'],
+            'mes': row['mes'],
+            'ano': row['ano'],
+            'guia_pdf_url': guia_pdf_url + '?' + urlencode({'clinica': row['clinica_id'], 'mes': row['mes'], 'ano': row['ano']})
+        }
+        grouped_data[clinica_name]['clinic_total'] += total_value
+        global_total += total_value
 
     context = {
         'grouped_data': grouped_data,
         'global_total': global_total,
-        'clinicas': clinicas, # For navbar
+        'meses': MESES,
+        'anos': [ano for ano, _ in GuiaForm.ANO_CHOICES],
+        'clinicas': clinicas,
+        'estados_exportacao': exportacao.ESTADOS,
+        'formatos_exportacao': list(exportacao.FORMATOS),
     }
-    return render(request, 'guias_app/overview_guides.html', context)
+    response = await arender(request, 'guias_app/overview_guides.html', context)
+    return condicional.com_validadores(response, validadores)
 
 def guia_close_monthly(request):
     if request.method == 'POST':
@@ -221,22 +117,72 @@ def guia_close_monthly(request):
         ano = request.POST.get('ano', '')
         clinica_id = request.POST.get('clinica', '')
 
-        if not all([mes, ano, clinica_id]):
+        periodo = calcular_periodo(mes, ano)
+        if not all([periodo, clinica_id.isdigit()]):
             messages.error(request, "Mês, Ano e Clínica são obrigatórios para encerrar a guia.")
             return redirect(reverse('guia_create') + f"?{request.POST.get('query_string', '')}")
 
-        guias_to_close = Guia.objects.filter(mes=mes, ano=ano, clinica__id=clinica_id)
-
-        if not guias_to_close.exists():
+        if not encerramento.encerrar([(clinica_id, periodo)]):
             messages.warning(request, "Nenhum registo encontrado para encerrar com os filtros fornecidos.")
         else:
-            guias_to_close.update(is_closed=True)
-            messages.success(request, f"Guia mensal para {mes}/{ano} da clínica {Clinica.objects.get(id=clinica_id).nome} encerrada com sucesso!")
+            messages.success(request, f"Guia mensal para {mes}/{ano} da clínica {nome_clinica(clinica_id)} encerrada com sucesso!")
 
         return redirect(reverse('guia_create') + f"?{request.POST.get('query_string', '')}")
     return redirect('guia_create')
 
-def guia_create(request):
+def _quer_fragmento(request):
+    # guia_create.html's script asks for JSON: only the changed row and the new total
+    return 'application/json' in request.headers.get('Accept', '')
+
+def _totais_abertas(clinica_id, mes, ano):
+    """Count and total of the open guides listed by guia_create for these filters, for the fragments."""
+    resumo = (
+        Guia.objects.filter(is_closed=False).filtrar(clinica_id, mes, ano).order_by()
+        .aggregate(total=Sum('valor_total'), quantidade=Count('pk'))
+    )
+    return {
+        'total': floatformat(resumo['total'] or Decimal('0.0'), 2),
+        # The page script patches the listing in place only while it fits in one page
+        'quantidade': resumo['quantidade'],
+        'por_pagina': GUIAS_POR_PAGINA,
+    }
+
+def _gravar_guia_fragmento(request):
+    """guia_create's POST for the page script: the same GuiaForm validation, answered with the new row."""
+    form = GuiaForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'erros': {campo: list(erros) for campo, erros in form.errors.items()}}, status=400)
+    guia = form.save()
+    filtros = {'clinica': guia.clinica_id, 'mes': guia.mes, 'ano': guia.ano}
+    linha = render_to_string('guias_app/guia_linha.html', {
+        'guia': guia,
+        'clinica_filter_id': guia.clinica_id,
+        'mes_filter': guia.mes,
+        'ano_filter': guia.ano,
+        'is_closed_for_filters': False,
+    }, request=request)
+    return JsonResponse({
+        'pk': guia.pk,
+        'linha': linha,
+        'filtros_query': urlencode(filtros),
+        **filtros,
+        **_totais_abertas(guia.clinica_id, guia.mes, guia.ano),
+    }, status=201)
+
+def _gravar_guia(request):
+    """Validate and save the posted guide; returns the form to show next."""
+    form = GuiaForm(request.POST)
+    if form.is_valid():
+        guia = form.save()
+        messages.success(request, "Registo adicionado com sucesso!")
+        form = GuiaForm(initial={
+            'clinica': guia.clinica.pk,
+            'mes': guia.mes,
+            'ano': guia.ano
+        })
+    return form
+
+async def guia_create(request):
     clinica_filter_id = request.GET.get('clinica') or request.POST.get('clinica')
     mes_filter = request.GET.get('mes') or request.POST.get('mes')
     ano_filter = request.GET.get('ano') or request.POST.get('ano')
@@ -249,50 +195,36 @@ def guia_create(request):
     if ano_filter:
         initial_data['ano'] = ano_filter
 
+    if request.method == 'POST' and _quer_fragmento(request):
+        return await sync_to_async(_gravar_guia_fragmento)(request)
     if request.method == 'POST':
-        form = GuiaForm(request.POST)
-        if form.is_valid():
-            guia = form.save()
-            messages.success(request, "Registo adicionado com sucesso!")
-            form = GuiaForm(initial={
-                'clinica': guia.clinica.pk,
-                'mes': guia.mes,
-                'ano': guia.ano
-            })
-        else:
-            pass
+        form = await sync_to_async(_gravar_guia)(request)
     else:
-        form = GuiaForm(initial=initial_data)
+        # GuiaForm reads the clinic choices from the cached list, which may need a query
+        form = await sync_to_async(GuiaForm)(initial=initial_data)
 
     # Only fetch OPEN guides for the current clinic, month, and year
-    guias = Guia.objects.filter(is_closed=False)
-    if clinica_filter_id:
-        guias = guias.filter(clinica__id=clinica_filter_id)
-    if mes_filter:
-        guias = guias.filter(mes__iexact=mes_filter)
-    if ano_filter:
-        guias = guias.filter(ano=ano_filter)
+    guias = Guia.objects.filter(is_closed=False).filtrar(clinica_filter_id, mes_filter, ano_filter)
 
-    total = sum(somar_valores_multilinha(guia.valor) for guia in guias)
+    # Count and total come from one aggregate query; the page itself is a LIMIT/OFFSET slice
+    resumo = await guias.aaggregate(total=Sum('valor_total'), quantidade=Count('pk'))
+    total = resumo['total'] or Decimal('0.0')
+    paginator = Paginator(guias, GUIAS_POR_PAGINA)
+    paginator.count = resumo['quantidade'] # already known, spares Paginator its own COUNT(*)
+    page_obj = paginator.get_page(request.GET.get('pagina'))
+    page_obj.object_list = [guia async for guia in page_obj.object_list]
 
-    # Determine if the current filtered set of guides is closed (should be false here if we only show open guides)
-    is_closed_for_filters = False # Always false for this view now
-    if guias.exists(): # Check if there are any open guides for this filter
-        if all(guia.is_closed for guia in guias): # This condition will likely be false now
-            is_closed_for_filters = True
+    # Only open guides are listed here, so the filtered set is never closed
+    is_closed_for_filters = False
 
-    clinicas = Clinica.objects.all().order_by('nome')
-    clinica_nome = ""
-    if clinica_filter_id:
-        try:
-            clinica_nome = Clinica.objects.get(id=clinica_filter_id).nome
-        except Clinica.DoesNotExist:
-            pass
+    clinica_nome = await anome_clinica(clinica_filter_id) if clinica_filter_id else ""
 
+    filtros = {'clinica': clinica_filter_id, 'mes': mes_filter, 'ano': ano_filter}
     context = {
         'form': form,
-        'clinicas': clinicas,
-        'guias': guias,
+        'guias': page_obj,
+        'page_obj': page_obj,
+        'filtros_query': urlencode({chave: valor for chave, valor in filtros.items() if valor}),
         'total': total,
         'mes_filter': mes_filter,
         'ano_filter': ano_filter,
@@ -300,43 +232,258 @@ def guia_create(request):
         'is_closed_for_filters': is_closed_for_filters,
         'clinica_nome': clinica_nome,
     }
-    return render(request, 'guias_app/guia_create.html', context)
+    return await arender(request, 'guias_app/guia_create.html', context)
 
 def guia_delete(request, pk):
     guia = get_object_or_404(Guia, pk=pk)
     guia.delete()
+    if _quer_fragmento(request):
+        return JsonResponse({'pk': pk, **_totais_abertas(guia.clinica_id, guia.mes, guia.ano)})
     messages.success(request, "Registo apagado com sucesso!")
     query_string = request.POST.get('query_string', '')
     return redirect(f'{reverse('guia_create')}?{query_string}')
 
-def guia_pdf(request):
-    mes_filter = request.GET.get('mes', '')
-    ano_filter = request.GET.get('ano', '')
-    clinica_filter_id = request.GET.get('clinica', '')
+def guia_import(request):
+    relatorio = None
+    if request.method == 'POST':
+        form = importacao.ImportacaoForm(request.POST, request.FILES)
+        if form.is_valid():
+            ficheiro = form.cleaned_data['ficheiro']
+            try:
+                relatorio = importacao.importar_guias(ficheiro, ficheiro.name, form.cleaned_data['conflitos'])
+            except importacao.ErroImportacao as e:
+                form.add_error('ficheiro', str(e))
+            else:
+                if relatorio.erros:
+                    messages.warning(request, f"Importação concluída com erros: {relatorio}.")
+                else:
+                    messages.success(request, f"Importação concluída: {relatorio}.")
+    else:
+        form = importacao.ImportacaoForm()
+    return render(request, 'guias_app/guia_import.html', {'form': form, 'relatorio': relatorio})
 
-    guias = Guia.objects.all()
-    if mes_filter:
-        guias = guias.filter(mes__iexact=mes_filter)
-    if ano_filter:
-        guias = guias.filter(ano=ano_filter)
-    if clinica_filter_id:
-        guias = guias.filter(clinica__id=clinica_filter_id)
+def _chave_pdf(clinica_filter_id, mes_filter, ano_filter):
+    """The pdf_cache key when the filters are one clinic's month, else None.
 
-    clinica_nome = ""
-    if clinica_filter_id:
-        try:
-            clinica_nome = Clinica.objects.get(id=clinica_filter_id).nome
-        except Clinica.DoesNotExist:
-            pass
+    It holds the month's version, so it must be read before the data (see pdf_cache.py).
+    """
+    periodo = calcular_periodo(mes_filter, ano_filter)
+    if not clinica_filter_id.isdigit() or periodo is None:
+        return None
+    versao = pdf_cache.versao(clinica_filter_id, periodo)
+    return pdf_cache.chave(clinica_filter_id, periodo, versao, nome_clinica(clinica_filter_id), mes_filter, ano_filter)
+
+def _pdf_em_cache(chave):
+    return pdf_cache.obter(chave) if chave else None
+
+def _preparar_pdf(clinica_filter_id, mes_filter, ano_filter, chave):
+    """Collect the gerar_pdf arguments for the filters, plus the cache key (from _chave_pdf) if the month is closed."""
+    guias = Guia.objects.filtrar(clinica_filter_id, mes_filter, ano_filter)
+    periodo = calcular_periodo(mes_filter, ano_filter)
+    mes_unico = clinica_filter_id.isdigit() and periodo is not None
+
+    clinica_nome = nome_clinica(clinica_filter_id) if clinica_filter_id else ""
+
+    total = guias.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.0')
+    dados = linhas_pdf(guias)
+
+    cache_key = None
+    if mes_unico:
+        # Part of the month may have been archived (see arquivo.py)
+        dados, total = arquivo.juntar_pdf(clinica_filter_id, periodo, dados, total)
+        if chave and dados and not guias.filter(is_closed=False).exists():
+            cache_key = chave
+
+    return (dados, mes_filter, ano_filter, clinica_nome, total), cache_key
+
+def _resposta_pdf(caminho):
+    return FileResponse(open(caminho, 'rb'), as_attachment=True,
+                        filename="trabalhos_realizados.pdf", content_type='application/pdf')
 
-    total = sum(somar_valores_multilinha(guia.valor) for guia in guias)
+async def _apreparar_pdf(clinica_filter_id, mes_filter, ano_filter, chave):
+    """_preparar_pdf() with the async ORM."""
+    guias = Guia.objects.filtrar(clinica_filter_id, mes_filter, ano_filter)
+    periodo = calcular_periodo(mes_filter, ano_filter)
+    mes_unico = clinica_filter_id.isdigit() and periodo is not None
 
-    pdf_bytes = gerar_pdf(guias, mes_filter, ano_filter, clinica_nome, total)
+    clinica_nome = await anome_clinica(clinica_filter_id) if clinica_filter_id else ""
+
+    total = (await guias.aaggregate(total=Sum('valor_total')))['total'] or Decimal('0.0')
+    dados = await alinhas_pdf(guias)
+
+    cache_key = None
+    if mes_unico:
+        dados, total = await sync_to_async(arquivo.juntar_pdf)(clinica_filter_id, periodo, dados, total)
+        if chave and dados and not await guias.filter(is_closed=False).aexists():
+            cache_key = chave
+
+    return (dados, mes_filter, ano_filter, clinica_nome, total), cache_key
+
+async def guia_pdf(request):
+    mes_filter = request.GET.get('mes', '')
+    ano_filter = request.GET.get('ano', '')
+    clinica_filter_id = request.GET.get('clinica', '')
+
+    # A month the browser already has, unchanged, is answered with a 304 (see condicional.py)
+    validadores = None
+    periodo = calcular_periodo(mes_filter, ano_filter)
+    if clinica_filter_id.isdigit() and periodo is not None:
+        validadores = await condicional.avalidadores_mes(request, clinica_filter_id, periodo)
+    if (response := condicional.nao_modificado(request, validadores)) is not None:
+        return condicional.com_validadores(response, validadores)
+
+    # Closed months never change, so their PDF is served straight from the disk cache
+    chave = await sync_to_async(_chave_pdf)(clinica_filter_id, mes_filter, ano_filter)
+    cached_pdf = await sync_to_async(_pdf_em_cache, thread_sensitive=False)(chave)
+    if cached_pdf:
+        return condicional.com_validadores(_resposta_pdf(cached_pdf), validadores)
+
+    argumentos, cache_key = await _apreparar_pdf(clinica_filter_id, mes_filter, ano_filter, chave)
+    # ReportLab is CPU-bound; thread_sensitive=False runs it in the shared executor, off the
+    # event loop and without holding the thread the ORM calls of every request go through
+    pdf_bytes = await sync_to_async(gerar_pdf, thread_sensitive=False)(*argumentos)
+    if cache_key:
+        # Thread-sensitive: guardar() queries the month's version on the request's connection
+        await sync_to_async(pdf_cache.guardar)(cache_key, pdf_bytes)
 
     response = HttpResponse(pdf_bytes, content_type='application/pdf')
     response['Content-Disposition'] = 'attachment; filename="trabalhos_realizados.pdf"'
+    return condicional.com_validadores(response, validadores)
+
+@require_POST
+def guia_pdf_job_create(request):
+    mes_filter = request.POST.get('mes', '')
+    ano_filter = request.POST.get('ano', '')
+    clinica_filter_id = request.POST.get('clinica', '')
+    query_string = urlencode({'clinica': clinica_filter_id, 'mes': mes_filter, 'ano': ano_filter})
+
+    chave = _chave_pdf(clinica_filter_id, mes_filter, ano_filter)
+    if _pdf_em_cache(chave):
+        return JsonResponse({
+            'estado': pdf_jobs.PRONTO,
+            'download_url': reverse('guia_pdf') + f'?{query_string}',
+        })
+
+    argumentos, cache_key = _preparar_pdf(clinica_filter_id, mes_filter, ano_filter, chave)
+    job_id = pdf_jobs.submeter(*argumentos, cache_key=cache_key)
+    return JsonResponse({
+        'job_id': job_id,
+        'estado': pdf_jobs.PENDENTE,
+        'status_url': reverse('guia_pdf_job_status', args=[job_id]),
+    }, status=202)
+
+def guia_pdf_job_status(request, job_id):
+    estado = pdf_jobs.estado(str(job_id))
+    if estado is None:
+        raise Http404("Pedido de PDF desconhecido.")
+    data = {'job_id': str(job_id), 'estado': estado}
+    if estado == pdf_jobs.PRONTO:
+        data['download_url'] = reverse('guia_pdf_job_download', args=[job_id])
+    return JsonResponse(data)
+
+def guia_pdf_job_download(request, job_id):
+    if pdf_jobs.estado(str(job_id)) != pdf_jobs.PRONTO:
+        raise Http404("PDF ainda não disponível.")
+    return _resposta_pdf(pdf_jobs.caminho_pdf(str(job_id)))
+
+def _pdfs_encerrados_do_mes(periodo, mes, ano):
+    """Yield (file name, PDF bytes) for every clinic with closed or archived guides in the month, rendering in parallel."""
+    versoes = pdf_cache.versoes_do_mes(periodo)  # before the data, see pdf_cache.py
+    guias_do_mes = Guia.objects.do_periodo(periodo)
+    guias_encerradas = guias_do_mes.filter(is_closed=True)
+    clinicas = Clinica.objects.filter(
+        Q(pk__in=guias_encerradas.values('clinica_id'))
+        | Q(pk__in=ArquivoMensal.objects.filter(periodo=periodo).values('clinica_id'))
+    ).order_by('nome')
+    clinicas_com_abertas = set(guias_do_mes.filter(is_closed=False).values_list('clinica_id', flat=True))
+
+    pedidos = {}
+    for clinica in clinicas:
+        nome_ficheiro = f"{slugify(clinica.nome) or clinica.pk}_{periodo}.pdf"
+        chave = pdf_cache.chave(clinica.pk, periodo, versoes.get(clinica.pk), clinica.nome, mes, ano)
+        cached_pdf = pdf_cache.obter(chave) if chave else None
+        if cached_pdf:
+            yield nome_ficheiro, cached_pdf.read_bytes()
+            continue
+        guias = guias_encerradas.filter(clinica_id=clinica.pk).order_by('pk')
+        total = guias.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.0')
+        dados, total = arquivo.juntar_pdf(clinica.pk, periodo, linhas_pdf(guias), total)
+        pedidos[(clinica.pk, nome_ficheiro, chave)] = (dados, mes, ano, clinica.nome, total)
+
+    for (clinica_id, nome_ficheiro, chave), pdf_bytes in pdf_jobs.renderizar_varios(pedidos):
+        if chave and clinica_id not in clinicas_com_abertas:
+            pdf_cache.guardar(chave, pdf_bytes)
+        yield nome_ficheiro, pdf_bytes
+
+def guia_pdf_zip(request):
+    mes_filter = request.GET.get('mes', '')
+    ano_filter = request.GET.get('ano', '')
+    periodo = calcular_periodo(mes_filter, ano_filter)
+    if periodo is None:
+        messages.error(request, "Indique um Mês e um Ano válidos para exportar os PDFs.")
+        return redirect('overview_guides')
+
+    response = StreamingHttpResponse(
+        conteudo_em_fluxo(request, zip_em_fluxo(_pdfs_encerrados_do_mes(periodo, mes_filter, ano_filter))),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="trabalhos_realizados_{periodo}.zip"'
+    return response
+
+def guia_export(request):
+    formato = request.GET.get('formato', 'csv')
+    try:
+        periodo_de = exportacao.periodo_de_texto(request.GET.get('de'))
+        periodo_ate = exportacao.periodo_de_texto(request.GET.get('ate'))
+        filtros = {
+            'clinica_id': request.GET.get('clinica') or None,
+            'periodo_de': periodo_de,
+            'periodo_ate': periodo_ate,
+            'estado': request.GET.get('estado', exportacao.TODAS),
+        }
+        guias = exportacao.guias_para_exportar(**filtros)
+        conteudo = exportacao.exportar(guias, formato, exportacao.arquivos_para_exportar(**filtros))
+    except exportacao.ErroExportacao as e:
+        messages.error(request, str(e))
+        return redirect('overview_guides')
+
+    response = StreamingHttpResponse(conteudo_em_fluxo(request, conteudo), content_type=exportacao.FORMATOS[formato][1])
+    response['Content-Disposition'] = f'attachment; filename="{exportacao.nome_ficheiro(formato, periodo_de, periodo_ate)}"'
     return response
 
-def home(request):
-    clinicas = Clinica.objects.all().order_by('nome')
-    return render(request, 'guias_app/home.html', {'clinicas': clinicas})
\ No newline at end of file
+def guia_search(request):
+    texto = request.GET.get('q', '').strip()
+    resultados = pesquisa.pesquisar(texto) if texto else []
+    return render(request, 'guias_app/guia_search.html', {
+        'texto': texto,
+        'resultados': resultados,
+        'limite': pesquisa.LIMITE,
+    })
+
+def guia_search_api(request):
+    try:
+        limite = max(1, min(int(request.GET.get('limite', pesquisa.LIMITE)), pesquisa.LIMITE))
+    except ValueError:
+        limite = pesquisa.LIMITE
+    resultados = pesquisa.pesquisar(request.GET.get('q', ''), limite)
+    return JsonResponse({'resultados': [
+        {
+            'id': resultado.guia.pk,
+            'clinica': resultado.guia.clinica.nome,
+            'clinica_id': resultado.guia.clinica_id,
+            'numero_guia': resultado.guia.numero_guia,
+            'nome_paciente': resultado.guia.nome_paciente,
+            'medico': resultado.guia.medico,
+            'trabalhos': resultado.guia.trabalhos,
+            'mes': resultado.guia.mes,
+            'ano': resultado.guia.ano,
+            'is_closed': resultado.guia.is_closed,
+            'relevancia': resultado.relevancia,
+            'destaques': resultado.destaques,
+        }
+        for resultado in resultados
+    ]})
+
+async def home(request):
+    clinicas = await alistar_clinicas()
+    return await arender(request, 'guias_app/home.html', {'clinicas': clinicas})
\ No newline at end of file
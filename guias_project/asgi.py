@@ -5,6 +5,29 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+ASGI deployment profile. It is an option for measured workloads, not a drop-in
+replacement for the Procfile's gunicorn/WSGI profile, which remains the default. It runs
+uvicorn with one process per WEB_CONCURRENCY:
+
+    uvicorn guias_project.asgi:application --host 0.0.0.0 --port $PORT --lifespan off
+
+Each process runs an event loop. The async views (home, overview_guides, guia_create,
+guia_pdf) wait on the database without blocking it, and the PDF rendering runs in the
+default thread pool. The remaining views are sync and run in a thread per request.
+
+- Database connections belong to the request under ASGI, so they cannot be persistent.
+  CONN_MAX_AGE defaults to 0 here (see settings).
+- Django collects a sync streaming response whole before sending it under ASGI. The
+  streaming views (guia_export, guia_pdf_zip) therefore hand it an async iterator instead
+  (see guias_app.streaming), so they keep their constant memory use. Any new
+  StreamingHttpResponse over a generator must do the same.
+- Django's own middleware adds a few thread hops to every request. Against SQLite on the
+  same machine, where a request almost never waits on I/O, the WSGI profile is faster:
+  measured with 2 workers on one CPU, this profile served 0.70-0.86x the WSGI requests
+  per second.
+- `manage.py benchmark_servidores` measures both profiles under concurrent load. Use it
+  to decide which profile to deploy on a given machine and database.
 """
 
 import os
@@ -12,5 +35,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'guias_project.settings')
+os.environ.setdefault('CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -1,4 +1,4 @@
-from guias_app.models import Clinica
+from guias_app.cache import listar_clinicas
 
 def all_clinicas(request):
-    return {'clinicas_nav': Clinica.objects.all().order_by('nome')}
\ No newline at end of file
+    return {'clinicas_nav': listar_clinicas()}
\ No newline at end of file
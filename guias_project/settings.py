@@ -30,10 +30,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'guias_app',
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include all the other middleware
+    'guias_app.desempenho.MedicaoDesempenhoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,12 +75,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Persistent connections, so the pragmas below run once per worker and not on every request
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
 # Se estiver no Heroku, use a variável de ambiente DATABASE_URL
 db_from_env = dj_database_url.config(conn_max_age=500)
-DATABASES['default'].update(db_from_env)
+if db_from_env:
+    DATABASES['default'] = db_from_env
+
+# Sob ASGI cada pedido tem a sua própria ligação, que nunca seria reutilizada; o perfil ASGI
+# (guias_project/asgi.py) define CONN_MAX_AGE=0 para a fechar no fim do pedido
+if 'CONN_MAX_AGE' in os.environ:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ['CONN_MAX_AGE'])
+
+# Perfil SQLite para vários workers do gunicorn (verificado por guias_app/checks.py):
+# - WAL: quem lê não espera por quem escreve (ex.: um encerramento mensal a decorrer). Fica
+#   gravado no próprio ficheiro, por isso é ativado uma vez pela migração 0011_sqlite_wal e
+#   não em cada ligação
+# - synchronous=NORMAL: seguro em WAL, sem fsync em cada commit
+# - cache_size/mmap_size: 64 MB de cache de páginas e 256 MB lidos por mmap
+# - timeout: busy_timeout do SQLite; um escritor espera até 20 s pelo lock em vez de falhar
+# - transaction_mode IMMEDIATE: as transações pedem o lock de escrita logo no BEGIN, o que
+#   evita o "database is locked" imediato quando duas transações tentam passar de leitura a escrita
+SQLITE_OPTIONS = {
+    'init_command': (
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update(SQLITE_OPTIONS)
+
+
+# Cache partilhada pelos workers do gunicorn (lista de clínicas, ver guias_app/cache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+    }
+}
 
 
 # Password validation
@@ -132,4 +175,45 @@ STATIC_URL = '/static/'
 
 # Se usares media:
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Geração de PDFs em segundo plano (guias_app.pdf_jobs); 0 gera o PDF dentro do pedido
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+PDF_JOB_TIMEOUT = 5 * 60 # segundos até um pedido pendente ser dado como falhado
+PDF_JOB_RETENTION = 24 * 60 * 60 # segundos que os PDFs gerados ficam disponíveis
+
+
+# Medições de desempenho por pedido (guias_app.desempenho), uma linha JSON por pedido.
+# Vão para o stdout (no Heroku, para os logs da app). Com LOG_DIR, vão para
+# LOG_DIR/desempenho.jsonl, que tem de existir e ser rodado por fora (logrotate): o
+# ficheiro é partilhado pelos workers do gunicorn e pelos processos dos PDFs, e um
+# RotatingFileHandler não roda com segurança entre processos.
+LOG_DIR = os.environ.get('LOG_DIR')
+DESEMPENHO_LIMIAR_REPETIDAS = 5 # a mesma consulta repetida este número de vezes num pedido é assinalada como possível N+1
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'mensagem': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'desempenho': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': Path(LOG_DIR) / 'desempenho.jsonl',
+            'delay': True,
+            'formatter': 'mensagem',
+        } if LOG_DIR else {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'mensagem',
+        },
+    },
+    'loggers': {
+        'guias_app.desempenho': {
+            'handlers': ['desempenho'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}